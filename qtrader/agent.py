@@ -9,7 +9,6 @@ Created on 08/18/2016
 """
 import random
 from environment import Agent, Environment
-from simulator import Simulator
 import translators
 import logging
 import sys
@@ -17,23 +16,42 @@ import time
 from bintrees import FastRBTree
 from collections import defaultdict
 import numpy as np
-import pandas as pd
-import pickle
-import pprint
+import latency
 import preprocess
+import qtable
+from mdp import EmpiricalMDP
+from replay import ExperienceReplay
 
 # Log finle enabled. global variable
 DEBUG = True
 
+root = logging.getLogger()
 
-# setup logging messages
-if DEBUG:
+
+'''
+Begin help functions
+'''
+
+
+# bits of the stop actions in the masks of valid actions
+BUY_MASK = qtable.actions_to_mask(['BUY'])
+SELL_MASK = qtable.actions_to_mask(['SELL'])
+
+
+def setup_logging(s_dir='log/train_test'):
+    '''
+    Log the messages to a new file, named by the current time, and to the
+    standard output. It is done once by process, by the scripts that run
+    simulations, so importing the module stays fast
+    :*param s_dir: string. Folder of the log files
+    '''
+    if not DEBUG or root.handlers:
+        return
     s_format = '%(asctime)s;%(message)s'
     s_now = time.strftime('%c')
     s_now = s_now.replace('/', '').replace(' ', '_').replace(':', '')
-    s_file = 'log/train_test/sim_{}.log'.format(s_now)
+    s_file = '{}/sim_{}.log'.format(s_dir, s_now)
     logging.basicConfig(filename=s_file, format=s_format)
-    root = logging.getLogger()
     root.setLevel(logging.DEBUG)
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logging.DEBUG)
@@ -43,11 +61,6 @@ if DEBUG:
     root.addHandler(ch)
 
 
-'''
-Begin help functions
-'''
-
-
 class InvalidOptionException(Exception):
     """
     InvalidOptionException is raised by the run() function and indicate that no
@@ -69,7 +82,21 @@ class BasicAgent(Agent):
     actions_to_close_when_long = [None, 'BEST_OFFER']
     actions_to_stop_when_short = [None, 'BEST_BID', 'BUY']
     actions_to_stop_when_long = [None, 'BEST_OFFER', 'SELL']
+    # valid actions and their bit masks by (position regime, stop flag). The
+    # regime is -1 at the maximum short position, 1 at the maximum long one
+    d_valid_actions = {(0, False): tuple(actions_to_open),
+                       (0, True): tuple(actions_to_open),
+                       (-1, False): tuple(actions_to_close_when_short),
+                       (-1, True): tuple(actions_to_stop_when_short),
+                       (1, False): tuple(actions_to_close_when_long),
+                       (1, True): tuple(actions_to_stop_when_long)}
+    d_valid_masks = dict((t_key, qtable.actions_to_mask(t_actions))
+                         for t_key, t_actions in d_valid_actions.iteritems())
     FROZEN_POLICY = False
+    # extension of the files with the policy learned, used by the Simulator
+    s_qtable_ext = '.qtb'
+    l_latency_stages = ['sense', 'intern_state', 'take_action',
+                        'update_book', 'act', 'learn', 'total']
 
     def __init__(self, env, i_id, f_min_time=3600.):
         '''
@@ -84,13 +111,30 @@ class BasicAgent(Agent):
         self.f_min_time = f_min_time
         self.next_time = 0.
         self.max_pos = 100.
-        # self.scaler = preprocess.ClusterScaler()
-        self.scaler = preprocess.LessClustersScaler()
+        self.scaler = self._load_scaler()
         self.s_agent_name = 'BasicAgent'
         self.last_max_pnl = None
         self.f_delta_pnl = 0.  # defined at [-inf, 0)
         self.old_state = None
         self.last_action = None
+        self.last_valid_actions = self.d_valid_actions[(0, False)]
+        self.old_valid_actions = self.last_valid_actions
+        self.i_valid_mask = self.d_valid_masks[(0, False)]
+        self.i_old_valid_mask = self.i_valid_mask
+        self.chosen_action = None  # the last action chosen by the policy
+        self.old_chosen_action = None
+        self.f_action_prob = 1.  # probability of choosing the last action
+        self.f_old_prob = 1.
+        self.b_fill = False  # if the last decision was driven by a fill
+        self.b_old_fill = False
+        self.decision_log = None  # list of the decisions, when recording
+
+    def _load_scaler(self):
+        '''
+        Return the object used to map the inputs to the intern state
+        '''
+        # return preprocess.ClusterScaler()
+        return preprocess.LessClustersScaler()
 
     def _freeze_policy(self):
         '''
@@ -114,6 +158,22 @@ class BasicAgent(Agent):
         self.d_order_map = {}
         # Reset any variables here, if required
         self.next_time = 0.
+        # the last decision was taken in the session before. It should not be
+        # learned with the first state of this one
+        self.last_max_pnl = None
+        self.f_delta_pnl = 0.
+        self.old_state = None
+        self.last_action = None
+        self.last_valid_actions = self.d_valid_actions[(0, False)]
+        self.old_valid_actions = self.last_valid_actions
+        self.i_valid_mask = self.d_valid_masks[(0, False)]
+        self.i_old_valid_mask = self.i_valid_mask
+        self.chosen_action = None
+        self.old_chosen_action = None
+        self.f_action_prob = 1.
+        self.f_old_prob = 1.
+        self.b_fill = False
+        self.b_old_fill = False
 
     def should_update(self):
         '''
@@ -134,20 +194,25 @@ class BasicAgent(Agent):
             if not self.should_update():
                 return None
         # recover basic infos
+        f_t0 = latency.clock()
         inputs = self.env.sense(self)
         state = self.env.agent_states[self]
+        f_t1 = latency.clock()
 
         # Update state (position ,volume and if has an order in bid or ask)
         self.state = self._get_intern_state(inputs, state)
+        f_t2 = latency.clock()
 
         # Select action according to the agent's policy
         l_msg = self._take_action(self.state, msg_env)
+        f_t3 = latency.clock()
 
         # # Execute action and get reward
         # print '\ncurrent action: {}\n'.format(action)
         reward = 0.
         # pprint.pprint(l_msg)
         self.env.update_order_book(l_msg)
+        f_t4 = latency.clock()
         s_action = None
         s_action2 = s_action
         l_prices_to_print = []
@@ -164,6 +229,7 @@ class BasicAgent(Agent):
                 elif s_indic == 'Agressive' and s_action == 'BUY':
                     s_action2 = 'TAKE'  # take the offer
                 reward += self.env.act(self, msg)
+        f_t5 = latency.clock()
         # NOTE: I am not sure about that, but at least makes sense... I guess
         # I should have to apply the reward to the action that has generated
         # the trade (when my order was hit, I was in the book before)
@@ -176,6 +242,12 @@ class BasicAgent(Agent):
         if not self.FROZEN_POLICY:
             # does not update if it is frozen
             self._apply_policy(self.state, s_action, reward)
+        # keep the time spent in each stage of the decision
+        if latency.tracker.b_enabled:
+            latency.tracker.record_stages(self.s_agent_name,
+                                          self.l_latency_stages,
+                                          [f_t0, f_t1, f_t2, f_t3, f_t4, f_t5,
+                                           latency.clock()])
         # calculate the next time that the agent will react
         self.next_time = self.env.order_matching.last_date
         self.next_time += self.f_min_time
@@ -192,7 +264,9 @@ class BasicAgent(Agent):
         inputs.pop('logret')
         inputs.pop('qAggr')
         inputs.pop('qTraded')
-        inputs['cluster'] = self.state['cluster']
+        for s_key in self.env.order_matching.rolling.l_keys:
+            inputs.pop(s_key)
+        inputs['cluster'] = self.state.get('cluster')
         # check the last maximum pnl considering just the current position
         f_delta_pnl = 0.
         f_pnl = self.env.agent_states[self]['Pnl']
@@ -203,6 +277,10 @@ class BasicAgent(Agent):
                                     self.env.agent_states[self]['Pnl'])
             f_delta_pnl = f_pnl - self.last_max_pnl
             self.f_delta_pnl = f_delta_pnl
+        # keep the decision taken, when it is being recorded
+        if self.decision_log is not None:
+            self.decision_log.append([s_date, s_action2,
+                                      state['Position'], f_pnl, reward])
         # Print inputs and agent state
         if DEBUG:
             root.debug(s_rtn.format(self.s_agent_name,
@@ -252,35 +330,58 @@ class BasicAgent(Agent):
         :param t_state: tuple. The inputs to be considered by the agent
         :param msg_env: dict. Order matching message
         '''
+        # keep the information about the previous decision
+        self.old_valid_actions = self.last_valid_actions
+        self.i_old_valid_mask = self.i_valid_mask
+        self.old_chosen_action = self.chosen_action
+        self.f_old_prob = self.f_action_prob
+        self.b_old_fill = self.b_fill
+        self.b_fill = False
+        self.chosen_action = None
+        # the actions allowed in the current position, also kept as the next
+        # state mask of the transitions driven by a fill
+        valid_actions = self._update_valid_actions()
         # check if have occured a trade
         if msg_env:
             if msg_env['order_status'] in ['Filled', 'Partialy Filled']:
+                self.f_action_prob = 1.
+                self.b_fill = True
                 return [msg_env]
-        # select a randon action, but not trade more than the maximum position
-        valid_actions = list(self.actions_to_open)
-        f_pos = self.position['qBid'] - self.position['qAsk']
-        if f_pos <= (self.max_pos * -1):
-            valid_actions = list(self.actions_to_close_when_short)  # copy
-            if abs(self.f_delta_pnl) >= (4.-1e-6):
-                valid_actions = list(self.actions_to_stop_when_short)
-        elif f_pos >= self.max_pos:
-            valid_actions = list(self.actions_to_close_when_long)
-            if abs(self.f_delta_pnl) >= (4.-1e-6):
-                valid_actions = list(self.actions_to_stop_when_long)
         # NOTE: I should change just this function when implementing
         # the learning agent
         s_action = self._choose_an_action(t_state, valid_actions)
+        # keep the action next to the probability of choosing it
+        self.chosen_action = s_action
         # build a list of messages based on the action taken
         l_msg = self._translate_action(t_state, s_action)
         return l_msg
 
+    def _update_valid_actions(self):
+        '''
+        Return the actions allowed by the current position regime, not
+        trading more than the maximum position, and keep them and their bit
+        mask as the last valid actions
+        '''
+        f_pos = self.position['qBid'] - self.position['qAsk']
+        i_regime = 0
+        if f_pos <= (self.max_pos * -1):
+            i_regime = -1
+        elif f_pos >= self.max_pos:
+            i_regime = 1
+        t_key = (i_regime, i_regime != 0 and abs(self.f_delta_pnl) >= 4.-1e-6)
+        valid_actions = self.d_valid_actions[t_key]
+        self.last_valid_actions = valid_actions
+        self.i_valid_mask = self.d_valid_masks[t_key]
+        return valid_actions
+
     def _choose_an_action(self, t_state, valid_actions):
         '''
         Return an action from a list of allowed actions according to the
         agent policy
-        :param valid_actions: list. List of the allowed actions
+        :param valid_actions: tuple. The allowed actions
         :param t_state: tuple. The inputs to be considered by the agent
         '''
+        self.f_action_prob = 1. / len(valid_actions)
         return random.choice(valid_actions)
 
     def _translate_action(self, t_state, s_action):
@@ -349,16 +450,131 @@ class BasicLearningAgent(BasicAgent):
                                                  f_min_time=f_min_time)
         # Initialize any additional variables here
         self.max_pos = 100.
+        # use set_hashed_qtable() to keep it in a compact store
         self.q_table = defaultdict(lambda: defaultdict(float))
+        self.b_hashed = False
+        self.state_key = None  # key of the current state in the tables
+        self.old_key = None
         self.f_gamma = f_gamma
         self.last_reward = None
         self.s_agent_name = 'BasicLearningAgent'
+        # experience replay. Use set_replay() to enable it
+        self.state_index = qtable.StateIndexer()
+        self.replay = None
+        # transitions recorded to offline evaluation. Set by the Simulator
+        self.transition_log = None
+        self.i_batch_size = 32
+        self.i_replay_every = 10
+        self.i_transitions = 0
+        # empirical model solved between sessions. Use set_mdp() to enable it
+        self.mdp = None
+        self.s_mdp_method = 'value_iteration'
+        self.d_mdp_kwargs = {}
+
+    def set_replay(self, i_capacity=10000, i_batch_size=32, i_replay_every=10,
+                   b_prioritized=False, i_seed=None):
+        '''
+        Enable the experience replay. Every i_replay_every transitions, the
+        agent updates its Q-table using a mini-batch sampled from the buffer
+        :*param i_capacity: integer. Maximum number of transitions held
+        :*param i_batch_size: integer. Number of transitions in each update
+        :*param i_replay_every: integer. Transitions between updates
+        :*param b_prioritized: boolean. If should sample by the TD-error
+        :*param i_seed: integer. Seed of the random number generator
+        '''
+        self.replay = ExperienceReplay(i_capacity=i_capacity,
+                                       b_prioritized=b_prioritized,
+                                       i_seed=i_seed)
+        self.i_batch_size = i_batch_size
+        self.i_replay_every = i_replay_every
+        self.i_transitions = 0
+
+    def set_mdp(self, s_method='value_iteration', **kwargs):
+        '''
+        Accumulate the transitions in an empirical MDP. The Q-table is set to
+        the solution of the model at the end of each training session
+        :*param s_method: string. 'value_iteration' or 'prioritized_sweeping'
+        :*param kwargs: dictionary. Other parameters of the method
+        '''
+        assert s_method in ['value_iteration', 'prioritized_sweeping']
+        self.mdp = EmpiricalMDP()
+        self.s_mdp_method = s_method
+        self.d_mdp_kwargs = kwargs
+
+    def solve_mdp(self):
+        '''
+        Solve the empirical MDP, starting from the current Q-table, and update
+        the Q-values of the pairs (s, a) visited
+        '''
+        if self.mdp is None or not len(self.mdp):
+            return
+        f_start = time.time()
+        indexer = self.mdp.indexer
+        na_q0 = qtable.dense_rows(self.q_table, indexer,
+                                  np.arange(len(indexer)))
+        na_q = self.mdp.solve(self.s_mdp_method, f_gamma=self.f_gamma,
+                              na_q0=na_q0, **self.d_mdp_kwargs)
+        qtable.arrays_to_qtable(indexer.l_states, na_q, self.q_table)
+        s_print = '{}.solve_mdp(): {} states solved by {} in {:0.2f} seconds'
+        s_print = s_print.format(self.s_agent_name, len(indexer),
+                                 self.s_mdp_method, time.time() - f_start)
+        if DEBUG:
+            root.debug(s_print)
+        else:
+            print s_print
+
+    def set_hashed_qtable(self, i_capacity=1024):
+        '''
+        Keep the tables of the agent in compact hashed stores instead of
+        dictionaries of dictionaries. The values already learned are kept
+        :*param i_capacity: integer. Number of states expected
+        '''
+        self.q_table = qtable.HashedQStore.from_table(self.q_table, i_capacity)
+        self.b_hashed = True
+        s_print = '{}.set_hashed_qtable(): Using a hashed Q-table with {}'
+        s_print += ' states ({:0.1f} KB)'
+        s_print = s_print.format(self.s_agent_name, len(self.q_table),
+                                 self.q_table.nbytes() / 1024.)
+        if DEBUG:
+            root.debug(s_print)
+        else:
+            print s_print
+
+    def _state_key(self, state):
+        '''
+        Return the key of the state in the tables of the agent: the state
+        packed in an integer, if they are hashed stores, or its string
+        :param state: dictionary. The intern state of the agent
+        '''
+        if self.b_hashed:
+            return qtable.pack_state(state)
+        return str(state)
+
+    def _get_intern_state(self, inputs, state):
+        '''
+        Return a dcitionary representing the intern state of the agent and
+        keep its key in the tables
+        :param inputs: dictionary. traffic light and presence of cars
+        :param state: dictionary. the current position of the agent
+        '''
+        d_rtn = super(BasicLearningAgent, self)._get_intern_state(inputs,
+                                                                   state)
+        self.state_key = self._state_key(d_rtn)
+        return d_rtn
+
+    def _q_values(self, state):
+        '''
+        Return the actions already visited in the current state and their
+        Q-values
+        :param state: dictionary. The inputs to be considered by the agent
+        '''
+        return self.q_table[self.state_key].iteritems()
 
     def _choose_an_action(self, d_state, valid_actions):
         '''
         Return an action from a list of allowed actions according to the
         agent policy
-        :param valid_actions: list. List of the allowed actions
+        :param valid_actions: tuple. The allowed actions
         :param d_state: dictionary. The inputs to be considered by the agent
         '''
         # convert position to float (I should correct that somewhere)
@@ -367,12 +583,16 @@ class BasicLearningAgent(BasicAgent):
         max_val = 0.01
         best_Action = random.choice(valid_actions)
         # arg max Q-value choosing a action better than zero
-        for action, val in self.q_table[str(d_state)].iteritems():
+        i_mask = self.i_valid_mask
+        for action, val in self._q_values(d_state):
             # if the agent is positioned, should check just what is allowed
-            if action in valid_actions:
+            if (i_mask >> qtable.d_action_idx[action]) & 1:
                 if val > max_val:
                     max_val = val
                     best_Action = action
+        self.f_action_prob = 1. / len(valid_actions)
+        if max_val > 0.01:
+            self.f_action_prob = 1.
         if abs(self.position['qBid'] - self.position['qAsk']) > 0:
             if not isinstance(best_Action, type(None)):
                 # s_rtn = '\n\n=================\n best action:{}, position:'
@@ -385,6 +605,22 @@ class BasicLearningAgent(BasicAgent):
                 pass
         return best_Action
 
+    def _max_q(self):
+        '''
+        Return the maximum Q-value of the current state between the actions
+        already visited and allowed by the valid mask, as the updates from the
+        replay buffer do. It is 0. if there is none of them
+        '''
+        max_Q = None
+        i_mask = self.i_valid_mask
+        for s_action, f_val in self.q_table[self.state_key].iteritems():
+            if (i_mask >> qtable.d_action_idx[s_action]) & 1:
+                if max_Q is None or f_val > max_Q:
+                    max_Q = f_val
+        if max_Q is None:
+            return 0.
+        return max_Q
+
     def _apply_policy(self, state, action, reward):
         '''
         Learn policy based on state, action, reward
@@ -397,26 +633,107 @@ class BasicLearningAgent(BasicAgent):
             # apply: Q <- r + y max_a' Q(s', a')
             # note that s' is the result of apply a in s. a' is the action that
             # would maximize the Q-value for the state s'
-            s_state = str(state)
-            max_Q = 0.
-            l_aux = self.q_table[s_state].values()
-            if len(l_aux) > 0:
-                max_Q = max(l_aux)
+            max_Q = self._max_q()
             # update qtable
             gamma_f_max_Q_a_prime = self.f_gamma * max_Q
             f_new = self.last_reward + gamma_f_max_Q_a_prime
-            self.q_table[str(self.old_state)][self.last_action] = f_new
+            self.q_table[self.old_key][self.last_action] = f_new
+            # keep the transition (s, a, r, s')
+            self._store_transition(state)
         # save current state, action and reward to use in the next run
         # apply s <- s'
         self.old_state = state
+        self.old_key = self.state_key
         self.last_action = action
         self.last_reward = reward
         # make sure that the current state has at least the current reward
         # notice that old_state and last_action is related to the current (s,a)
         # at this point, and not to (s', a'), as previously used
-        if not self.q_table[str(self.old_state)][self.last_action]:
-            s_aux = str(self.old_state)
-            self.q_table[s_aux][self.last_action] = self.last_reward
+        if not self.q_table[self.old_key][self.last_action]:
+            self.q_table[self.old_key][self.last_action] = self.last_reward
+
+    def _store_transition(self, state):
+        '''
+        Keep the last transition (old_state, last_action, last_reward, state)
+        in the transition log, the empirical MDP and the replay buffer, if
+        they are enabled, and learn from a mini-batch when it is the time to
+        :param state: dictionary. The state reached by the agent
+        '''
+        if self.replay is None and self.transition_log is None and \
+           self.mdp is None:
+            return
+        i_action = qtable.d_action_idx[self.last_action]
+        i_next_mask = self.i_valid_mask
+        if self.transition_log is not None:
+            # log the action chosen by the policy, the one of the probability
+            # recorded. A fill was not chosen, so it keeps the updated action
+            i_chosen = i_action
+            if not self.b_old_fill:
+                i_chosen = qtable.d_action_idx[self.old_chosen_action]
+            self.transition_log.add(self.old_key,
+                                    self.i_old_valid_mask,
+                                    i_chosen,
+                                    self.last_reward,
+                                    self.state_key,
+                                    i_next_mask,
+                                    self.f_old_prob,
+                                    self.b_old_fill)
+        if self.mdp is not None:
+            self.mdp.add(self.old_key, i_action, self.last_reward,
+                         self.state_key)
+        if self.replay is None:
+            return
+        i_state = self.state_index.get(self.old_key)
+        i_next_state = self.state_index.get(self.state_key)
+        self.replay.add(i_state,
+                        i_action,
+                        self.last_reward,
+                        i_next_state,
+                        i_next_mask)
+        self.i_transitions += 1
+        if self.i_transitions % self.i_replay_every != 0:
+            return
+        if len(self.replay) >= self.i_batch_size:
+            self._learn_from_replay()
+
+    def _replay_alpha(self, na_states, na_actions):
+        '''
+        Return the learning rate of each transition replayed
+        :param na_states: numpy array. Indexes of the states
+        :param na_actions: numpy array. Indexes of the actions
+        '''
+        return np.ones(len(na_states))
+
+    def _learn_from_replay(self):
+        '''
+        Update the Q-table using a mini-batch of transitions from the replay
+        buffer. All the updates are computed at once
+        '''
+        replay = self.replay
+        na_idx, na_weight = replay.sample(self.i_batch_size)
+        na_s = replay.na_state[na_idx]
+        na_a = replay.na_action[na_idx].astype(np.int64)
+        na_r = replay.na_reward[na_idx]
+        na_mask = replay.na_mask[na_idx]
+        i_n = len(na_idx)
+        # recover the Q-values of the states in the batch
+        na_aux = np.concatenate([na_s, replay.na_next_state[na_idx]])
+        na_uniq, na_inv = np.unique(na_aux, return_inverse=True)
+        na_q = qtable.dense_rows(self.q_table, self.state_index, na_uniq)
+        na_row = na_inv[:i_n]
+        # apply: Q <- Q(s,a) + a_n w [r + y max_a' Q(s', a') - Q(s,a)]
+        na_qsa = np.nan_to_num(na_q[na_row, na_a])
+        na_max_q = qtable.max_q(na_q[na_inv[i_n:]], na_mask)
+        na_td = na_r + self.f_gamma * na_max_q - na_qsa
+        na_delta = self._replay_alpha(na_s, na_a) * na_weight * na_td
+        na_new = np.nan_to_num(na_q)
+        np.add.at(na_new, (na_row, na_a), na_delta)
+        # write back just the pairs (s, a) replayed
+        for i_row, i_action in set(zip(na_row, na_a)):
+            s_state = self.state_index[na_uniq[i_row]]
+            s_action = qtable.l_actions[i_action]
+            self.q_table[s_state][s_action] = na_new[i_row, i_action]
+        replay.update_priorities(na_idx, na_td)
 
     def set_qtable(self, s_fname):
         '''
@@ -425,14 +742,12 @@ class BasicLearningAgent(BasicAgent):
         '''
         # freeze policy
         self._freeze_policy()
-        # load qtable and transform in a dictionary
-        df_qtable = pd.read_csv(s_fname, sep='\t', index_col=0)
-        for s_idx, row in df_qtable.iterrows():
-            for s_key, f_val in row.iteritems():
-                if not np.isnan(f_val):
-                    if s_key == 'Unnamed: 1':
-                        s_key = None
-                    self.q_table[s_idx][s_key] = f_val
+        # load qtable (binary or the old tab-separated format)
+        for s_idx, d_row in qtable.read_qtable(s_fname).iteritems():
+            if self.b_hashed:
+                s_idx = qtable.str_to_state(s_idx)
+            for s_key, f_val in d_row.iteritems():
+                self.q_table[s_idx][s_key] = f_val
             # fill stop actions to be desirable over any other action
             for s_key in ['BUY', 'SELL']:
                 f_val = self.q_table[s_idx][s_key]
@@ -473,7 +788,7 @@ class LearningAgent_k(BasicLearningAgent):
     def _choose_an_action(self, t_state, valid_actions):
         '''
         Return an action according to the agent policy
-        :param valid_actions: list. List of the allowed actions
+        :param valid_actions: tuple. The allowed actions
         :param t_state: tuple. The inputs to be considered by the agent
         '''
         # set a random action in case of exploring world
@@ -484,16 +799,17 @@ class LearningAgent_k(BasicLearningAgent):
         best_Action = random.choice(valid_actions)
         # if the policy is frozen and the agent didnt observed the state
         # previously, do nothing (or close out its positions)
+        i_mask = self.i_valid_mask
         if self.FROZEN_POLICY:
             best_Action = None
-            if 'BUY' in valid_actions:
+            if i_mask & BUY_MASK:
                 best_Action = 'BUY'
-            elif 'SELL' in valid_actions:
+            elif i_mask & SELL_MASK:
                 best_Action = 'SELL'
         # arg max Q-value choosing a action better than zero
-        for action, val in self.q_table[str(t_state)].iteritems():
+        for action, val in self._q_values(t_state):
             # if the agent is positioned, should check just what is allowed
-            if action in valid_actions:
+            if (i_mask >> qtable.d_action_idx[action]) & 1:
                 # force to stop loss action be the last desired
                 if action in ['BUY', 'SELL']:
                     val = 0.
@@ -511,6 +827,10 @@ class LearningAgent_k(BasicLearningAgent):
         if self.FROZEN_POLICY:
             # always take the best action recorded if the policy is frozen
             f_prob = 1.
+        # probability of best_Action being chosen when exploiting
+        f_best = 1. / f_aux
+        if max_val > 0.01 or self.FROZEN_POLICY:
+            f_best = 1.
         # print 'PROB: {:.2f}'.format(f_prob)
         # choose the best_action just if: eps <= k**thisQhat / sum(k**Qhat)
         if (random.random() <= f_prob):
@@ -522,6 +842,7 @@ class LearningAgent_k(BasicLearningAgent):
                 root.debug(s_print)
             else:
                 print s_print
+            self.f_action_prob = f_prob * f_best + (1. - f_prob) / f_aux
             return best_Action
         else:
             s_print = '{}.choose_an_action(): '.format(self.s_agent_name)
@@ -532,7 +853,11 @@ class LearningAgent_k(BasicLearningAgent):
                 root.debug(s_print)
             else:
                 print s_print
-            return random.choice(valid_actions)
+            s_action = random.choice(valid_actions)
+            self.f_action_prob = (1. - f_prob) / f_aux
+            if s_action == best_Action:
+                self.f_action_prob += f_prob * f_best
+            return s_action
 
 
 class LearningAgent(LearningAgent_k):
@@ -560,6 +885,30 @@ class LearningAgent(LearningAgent_k):
         self.s_agent_name = 'LearningAgent'
         self.nvisits_table = defaultdict(lambda: defaultdict(float))
 
+    def set_hashed_qtable(self, i_capacity=1024):
+        '''
+        Keep the Q-table and the table of visits of the agent in compact
+        hashed stores. The values already learned are kept
+        :*param i_capacity: integer. Number of states expected
+        '''
+        self.nvisits_table = qtable.HashedQStore.from_table(self.nvisits_table,
+                                                            i_capacity)
+        super(LearningAgent, self).set_hashed_qtable(i_capacity)
+
+    def _replay_alpha(self, na_states, na_actions):
+        '''
+        Return the learning rate of each transition replayed, using the same
+        decay factor of the online updates. Replays do not count as visits
+        :param na_states: numpy array. Indexes of the states
+        :param na_actions: numpy array. Indexes of the actions
+        '''
+        na_visits = np.zeros(len(na_states))
+        for idx, (i_state, i_action) in enumerate(zip(na_states, na_actions)):
+            d_row = self.nvisits_table.get(self.state_index[i_state])
+            if d_row:
+                na_visits[idx] = d_row.get(qtable.l_actions[i_action], 0.)
+        return 1. / (1. + na_visits)
+
     def _apply_policy(self, state, action, reward):
         '''
         Learn policy based on state, action, reward
@@ -567,38 +916,168 @@ class LearningAgent(LearningAgent_k):
         :param action: string. the action selected at this time
         :param reward: integer. the rewards received due to the action
         '''
-        # count the number of times this (s,a) was reached and the decay factor
-        self.nvisits_table[str(self.old_state)][self.last_action] += 1
-        f_alpha = self.nvisits_table[str(self.old_state)][self.last_action]
-        f_alpha = 1./(1.+f_alpha)
-        # f_alpha = 1.
         # check if there is some state in cache
         if self.old_state:
+            # count the number of times this (s,a) was reached and the decay
+            # factor
+            self.nvisits_table[self.old_key][self.last_action] += 1
+            f_alpha = self.nvisits_table[self.old_key][self.last_action]
+            f_alpha = 1./(1.+f_alpha)
+            # f_alpha = 1.
             # apply: Q <- r + y max_a' Q(s', a')
             # note that s' is the result of apply a in s. a' is the action that
             # would maximize the Q-value for the state s'
-            s_state = str(state)
-            max_Q = 0.
-            l_aux = self.q_table[s_state].values()
-            if len(l_aux) > 0:
-                max_Q = max(l_aux)
+            max_Q = self._max_q()
             gamma_f_max_Q_a_prime = self.f_gamma * max_Q
             f_Qhat_prime = self.last_reward + gamma_f_max_Q_a_prime
-            f_Qhat = self.q_table[str(self.old_state)][self.last_action]
+            f_Qhat = self.q_table[self.old_key][self.last_action]
             f_new = (1.-f_alpha) * f_Qhat + f_alpha * f_Qhat_prime
             # apply: Q <- (1-a_n) Q(s,a) + a_n [r + y max_a' Q(s', a')]
-            self.q_table[str(self.old_state)][self.last_action] = f_new
+            self.q_table[self.old_key][self.last_action] = f_new
+            # keep the transition (s, a, r, s')
+            self._store_transition(state)
         # save current state, action and reward to use in the next run
         # apply s <- s'
         self.old_state = state
+        self.old_key = self.state_key
         self.last_action = action
         self.last_reward = reward
         # make sure that the current state has at least the current reward
         # notice that old_state and last_action is related to the current (s,a)
         # at this point, and not to (s', a'), as previously used
-        if not self.q_table[str(self.old_state)][self.last_action]:
-            s_aux = str(self.old_state)
-            self.q_table[s_aux][self.last_action] = self.last_reward
+        if not self.q_table[self.old_key][self.last_action]:
+            self.q_table[self.old_key][self.last_action] = self.last_reward
+
+
+class TileCodingAgent(LearningAgent):
+    '''
+    A representation of an agent that learns to trade approximating the
+    Q-values by a linear function of the tiles activated by the raw inputs,
+    instead of using a table of the clusters of a k-means model
+    '''
+    # the weights are saved by np.savez
+    s_qtable_ext = '.npz'
+
+    def __init__(self, env, i_id, f_min_time=3600., f_gamma=0.5, f_k=0.8,
+                 f_alpha=0.1, i_tilings=8, i_tiles=8, i_memory=65521):
+        '''
+        Initialize a TileCodingAgent. Save all parameters as attributes
+        :param env: Environment object. The grid-like world
+        :*param f_gamma: float. weight of delayed versus immediate rewards
+        :*param f_k: float. How strongly should favor high Q-hat values
+        :*param f_alpha: float. The learning rate, shared by the tilings
+        :*param i_tilings: integer. Number of offset grids
+        :*param i_tiles: integer. Number of tiles of each input in a grid
+        :*param i_memory: integer. Number of weights of each action
+        '''
+        # used by _load_scaler()
+        self.i_tilings = i_tilings
+        self.i_tiles = i_tiles
+        self.i_memory = i_memory
+        super(TileCodingAgent, self).__init__(env=env,
+                                              i_id=i_id,
+                                              f_min_time=f_min_time,
+                                              f_gamma=f_gamma,
+                                              f_k=f_k)
+        # Initialize any additional variables here
+        self.s_agent_name = 'TileCodingAgent'
+        self.f_alpha = f_alpha
+        self.na_weights = np.zeros((i_memory, qtable.N_ACTIONS))
+        self.na_tiles = None
+        self.na_old_tiles = None
+
+    def _load_scaler(self):
+        '''
+        Return the object used to map the inputs to the intern state
+        '''
+        return preprocess.TileCoder(i_tilings=self.i_tilings,
+                                    i_tiles=self.i_tiles,
+                                    i_memory=self.i_memory)
+
+    def _get_intern_state(self, inputs, state):
+        '''
+        Return a dcitionary representing the intern state of the agent and
+        keep the tiles activated by the inputs
+        :param inputs: dictionary. traffic light and presence of cars
+        :param state: dictionary. the current position of the agent
+        '''
+        d_data = {}
+        d_data['OFI'] = inputs['qOfi']
+        d_data['qBID'] = inputs['qBid']
+        d_data['BOOK_RATIO'] = inputs['qBid'] * 1. / max(inputs['qAsk'], 1)
+        d_data['LOG_RET'] = inputs['logret']
+        d_data['SPREAD'] = inputs['spread']
+        d_data['POSITION'] = float(state['Position'])
+        l_flags = [state['best_bid'], state['best_offer']]
+        self.na_tiles = self.scaler.transform(d_data, l_flags)
+
+        d_rtn = {}
+        d_rtn['Position'] = float(state['Position'])
+        d_rtn['best_bid'] = state['best_bid']
+        d_rtn['best_offer'] = state['best_offer']
+
+        return d_rtn
+
+    def _q_values(self, state):
+        '''
+        Return all the actions and their Q-values in the current state
+        :param state: dictionary. The inputs to be considered by the agent
+        '''
+        na_q = self.na_weights[self.na_tiles].sum(axis=0)
+        return zip(qtable.l_actions, na_q)
+
+    def _apply_policy(self, state, action, reward):
+        '''
+        Learn policy based on state, action, reward
+        :param state: dictionary. The current state of the agent
+        :param action: string. the action selected at this time
+        :param reward: integer. the rewards received due to the action
+        '''
+        if self.na_old_tiles is not None:
+            # apply: w <- w + a [r + y max_a' Q(s', a') - Q(s,a)] grad Q(s,a)
+            max_Q = self.na_weights[self.na_tiles].sum(axis=0).max()
+            i_action = qtable.d_action_idx[self.last_action]
+            f_Qhat = self.na_weights[self.na_old_tiles, i_action].sum()
+            f_td = self.last_reward + self.f_gamma * max_Q - f_Qhat
+            f_step = self.f_alpha / self.i_tilings * f_td
+            # the hashed tiles can collide, so accumulate repeated indexes
+            np.add.at(self.na_weights, (self.na_old_tiles, i_action), f_step)
+        # save current state, action and reward to use in the next run
+        self.old_state = state
+        self.last_action = action
+        self.last_reward = reward
+        self.na_old_tiles = self.na_tiles
+
+    def save_weights(self, s_fname):
+        '''
+        Save the weights and the setup of the tile coding in the NumPy format
+        :param s_fname: string. Path to the file, ending with s_qtable_ext
+        '''
+        # np.savez would append .npz to a name with other extension
+        with open(s_fname, 'wb') as fw:
+            np.savez(fw, weights=self.na_weights, tilings=self.i_tilings,
+                     tiles=self.i_tiles, gamma=self.f_gamma, k=self.f_k,
+                     alpha=self.f_alpha)
+
+    def set_qtable(self, s_fname):
+        '''
+        Set up the weights to be used in testing simulation and freeze policy
+        :param s_fname: string. Path to the weights saved by save_weights()
+        '''
+        self._freeze_policy()
+        with np.load(s_fname) as d_load:
+            assert int(d_load['tilings']) == self.i_tilings
+            assert int(d_load['tiles']) == self.i_tiles
+            self.na_weights = d_load['weights'].copy()
+        self.i_memory = len(self.na_weights)
+        self.scaler = self._load_scaler()
+        s_print = '{}.set_qtable(): Setting up the agent to use'
+        s_print = s_print.format(self.s_agent_name)
+        s_print += ' the weights at {}'.format(s_fname)
+        if DEBUG:
+            root.debug(s_print)
+        else:
+            print s_print
 
 
 def run(s_option):
@@ -606,11 +1085,33 @@ def run(s_option):
     Run the agent for a finite number of trials.:
     :param s_option: string. The type of the test
     """
+    # the simulator is only needed here
+    from simulator import Simulator
+    setup_logging()
     i_idx = 15  # 15  # index of the start file to be used in simulations
     n_trials = 10  # number of repetitions of the same sessions
     n_sessions = 1  # number of different days traded
     # Set up environment
     s_fname = 'data/data_0725_0926.zip'
+    if s_option == 'walk_forward':
+        # ==== WALK-FORWARD TEST ====
+        # slide the train and test windows across all files of the archive
+        import walkforward
+        df = walkforward.walk_forward(s_fname=s_fname,
+                                      s_agent='LearningAgent_k',
+                                      d_kwargs={'f_min_time': 2.,
+                                                'f_k': 0.8,
+                                                'f_gamma': 0.5},
+                                      i_train=n_sessions,
+                                      i_test=1,
+                                      n_trials=n_trials)
+        s_print = 'run(): Walk-forward PnL by fold:\n{}'
+        s_print = s_print.format(df.groupby('fold')['pnl'].sum())
+        if DEBUG:
+            root.debug(s_print)
+        else:
+            print s_print
+        return
     e = Environment(s_fname=s_fname, i_idx=i_idx)
     # create agent
     if s_option in ['train_learner', 'test_learner', 'optimize_k',
@@ -619,14 +1120,20 @@ def run(s_option):
                            f_min_time=2.,
                            f_k=0.8,
                            f_gamma=0.5)
+    elif s_option == 'train_tile_coding':
+        a = e.create_agent(TileCodingAgent,
+                           f_min_time=2.,
+                           f_k=0.8,
+                           f_gamma=0.5)
     elif s_option == 'test_random':
         a = e.create_agent(BasicAgent, f_min_time=2.)
     else:
         l_aux = ['train_learner', 'test_learner', 'test_random', 'optimize_k',
-                 'optimize_gamma']
+                 'optimize_gamma', 'walk_forward', 'train_tile_coding']
         s_err = 'Select an <OPTION> between: \n{}'.format(l_aux)
         raise InvalidOptionException(s_err)
     e.set_primary_agent(a)  # specify agent to track
+    e.add_recorder(a)  # keep the PnL series used by eda
 
     # set up the simulation object
     sim = Simulator(e, update_delay=1.00, display=False)
@@ -661,7 +1168,7 @@ def run(s_option):
         else:
             print s_print
         # run for a specified number of trials
-        s_qtable = 'log/qtable/LearningAgent_k_qtable_{}.log'.format(n_trials)
+        s_qtable = 'log/qtable/LearningAgent_k_qtable_{}.qtb'.format(n_trials)
         if e.primary_agent.s_agent_name == 'BasicAgent':
             # run that if is the basicagent
             sim.out_of_sample(s_qtable=s_qtable,
@@ -671,10 +1178,13 @@ def run(s_option):
         else:
             # the learning agent, when the policy is freezed, will always take
             # the same actions. So there is no meaning on test multiple times
+            # and the results can be reused while nothing changes
+            import cache
             sim.out_of_sample(s_qtable=s_qtable,
                               n_start=n_sessions+i_idx,
                               n_trials=1,
-                              n_sessions=1)
+                              n_sessions=1,
+                              result_cache=cache.ResultCache())
 
     elif s_option == 'optimize_k':
         # test the agent
@@ -683,16 +1193,18 @@ def run(s_option):
             root.debug(s_print)
         else:
             print s_print
-        # k tests
-        for f_k in [0.3, 0.8, 1.3, 2.]:
-            e = Environment(s_fname=s_fname, i_idx=i_idx)
-            a = e.create_agent(LearningAgent_k,
-                               f_min_time=2.,
-                               f_k=f_k,
-                               f_gamma=0.5)
-            e.set_primary_agent(a)
-            sim = Simulator(e, update_delay=1.00, display=False)
-            sim.train(n_trials=5, n_sessions=1)
+        # k tests, in workers that keep the environment between the jobs
+        import workers
+        l_kwargs = [{'f_min_time': 2., 'f_k': f_k, 'f_gamma': 0.5}
+                    for f_k in [0.3, 0.8, 1.3, 2.]]
+        pool = workers.WarmPool(s_fname, i_idx, l_agents=['LearningAgent_k'])
+        try:
+            # the jobs would overwrite the same Q-table files, so they are not
+            # saved. The logs of the jobs are read by eda.count_by_k_gamma()
+            pool.sweep('LearningAgent_k', l_kwargs, n_trials=5, n_sessions=1,
+                       b_save_qtable=False)
+        finally:
+            pool.close()
     elif s_option == 'optimize_gamma':
         # test the agent
         s_print = 'run(): Starting training session ! Optimiza_gamma Test.'
@@ -700,16 +1212,18 @@ def run(s_option):
             root.debug(s_print)
         else:
             print s_print
-        # gamma test
-        for f_gamma in [0.3, 0.5, 0.7, 0.9]:
-            e = Environment(s_fname=s_fname, i_idx=i_idx)
-            a = e.create_agent(LearningAgent_k,
-                               f_min_time=2.,
-                               f_gamma=f_gamma,
-                               f_k=0.8)
-            e.set_primary_agent(a)
-            sim = Simulator(e, update_delay=1.00, display=False)
-            sim.train(n_trials=5, n_sessions=1)
+        # gamma test, in workers that keep the environment between the jobs
+        import workers
+        l_kwargs = [{'f_min_time': 2., 'f_gamma': f_gamma, 'f_k': 0.8}
+                    for f_gamma in [0.3, 0.5, 0.7, 0.9]]
+        pool = workers.WarmPool(s_fname, i_idx, l_agents=['LearningAgent_k'])
+        try:
+            # the jobs would overwrite the same Q-table files, so they are not
+            # saved. The logs of the jobs are read by eda.count_by_k_gamma()
+            pool.sweep('LearningAgent_k', l_kwargs, n_trials=5, n_sessions=1,
+                       b_save_qtable=False)
+        finally:
+            pool.close()
 
 
 if __name__ == '__main__':
@@ -720,6 +1234,6 @@ if __name__ == '__main__':
         s_err = '\nRun "python qtrader/agent.py <OPTION>" to simulate'
         s_err += ' the behavior of selected agent.\n'
         l_aux = ['train_learner', 'test_learner', 'test_random', 'optimize_k',
-                 'optimize_gamma']
+                 'optimize_gamma', 'walk_forward', 'train_tile_coding']
         s_err += 'Select an <OPTION> between: {}'.format(l_aux)
         raise InvalidOptionException(s_err)
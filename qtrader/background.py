@@ -0,0 +1,349 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a population of strategic background agents that react to the
+market replayed by the order matching. The decisions of each group of agents
+are taken in batch, using vectorized random numbers
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+from environment import Agent
+import translators
+
+'''
+Begin help functions
+'''
+
+# codes of the actions, following the order of Environment.valid_actions
+HOLD = -1  # do not send any message
+CANCEL_ALL = 0  # the None action of the Environment
+BEST_BID = 1
+BEST_OFFER = 2
+BEST_BOTH = 3
+SELL = 4
+BUY = 5
+
+l_action_names = [None, 'BEST_BID', 'BEST_OFFER', 'BEST_BOTH', 'SELL', 'BUY']
+
+
+def clip_by_position(na_action, na_position, f_max_pos):
+    '''
+    Replace by HOLD the actions that would increase the position of agents
+    already at their limits. Return the array of actions changed in place
+    :param na_action: numpy array. The codes of the actions of each agent
+    :param na_position: numpy array. The current position of each agent
+    :param f_max_pos: float. The maximum absolute position allowed
+    '''
+    na_long = na_position >= f_max_pos
+    na_short = na_position <= -f_max_pos
+    na_action[na_long & ((na_action == BUY) | (na_action == BEST_BID))] = HOLD
+    na_action[na_short & ((na_action == SELL) | (na_action == BEST_OFFER))] = \
+        HOLD
+    na_action[(na_long | na_short) & (na_action == BEST_BOTH)] = HOLD
+    return na_action
+
+
+'''
+End help functions
+'''
+
+
+class BackgroundAgent(Agent):
+    '''
+    A BackgroundAgent keeps track of its orders and position, but its
+    decisions are taken by the BackgroundStrategy it belongs to
+    '''
+
+    def __init__(self, env, i_id, f_spread=0.):
+        '''
+        Initiate a BackgroundAgent object. save all parameters as attributes
+        :param env: Environment Object. The Environment where the agent acts
+        :param i_id: integer. Agent id
+        :*param f_spread: float. Distance from the best prices to quote
+        '''
+        super(BackgroundAgent, self).__init__(env, i_id)
+        self.f_spread = f_spread
+
+    def update(self, msg_env):
+        '''
+        Update the position of the agent when the order matching sends a
+        message related to one of its orders
+        :param msg_env: dict. A message generated by the order matching
+        '''
+        if msg_env:
+            self.env.act(self, msg_env)
+
+
+class BackgroundStrategy(object):
+    '''
+    Base class of the groups of background agents. Each subclass should decide
+    the actions of all of its agents at once
+    '''
+    s_name = 'BackgroundStrategy'
+
+    def __init__(self, n_agents, f_max_pos=500., f_prob_act=0.1):
+        '''
+        Initialize a BackgroundStrategy object. Save all parameters as
+        attributes
+        :param n_agents: integer. Number of agents that follow the strategy
+        :*param f_max_pos: float. Maximum absolute position of each agent
+        :*param f_prob_act: float. Probability of each agent acting in a step
+        '''
+        self.n_agents = n_agents
+        self.f_max_pos = f_max_pos
+        self.f_prob_act = f_prob_act
+        self.l_agents = []
+        self.na_slots = np.zeros(0, dtype=np.int64)
+
+    def get_spreads(self, rng):
+        '''
+        Return the distance in cents from the best prices that each agent
+        should use to quote
+        :param rng: numpy RandomState. The random number generator
+        '''
+        return np.zeros(self.n_agents)
+
+    def decide(self, rng, d_inputs, na_position):
+        '''
+        Return an array with the code of the action of each agent
+        :param rng: numpy RandomState. The random number generator
+        :param d_inputs: dictionary. The market state from Environment.sense
+        :param na_position: numpy array. The current position of each agent
+        '''
+        raise NotImplementedError
+
+
+class MarketMakers(BackgroundStrategy):
+    '''
+    Agents that keep quotes in both sides of the book, leaning to the side
+    that closes their positions when they reach the limits
+    '''
+    s_name = 'MarketMakers'
+
+    def __init__(self, n_agents, f_max_pos=500., f_prob_act=0.2,
+                 i_max_ticks=3):
+        '''
+        Initialize a MarketMakers object. Save all parameters as attributes
+        :param n_agents: integer. Number of agents that follow the strategy
+        :*param f_max_pos: float. Maximum absolute position of each agent
+        :*param f_prob_act: float. Probability of each agent acting in a step
+        :*param i_max_ticks: integer. Maximum distance from the best prices
+        '''
+        super(MarketMakers, self).__init__(n_agents=n_agents,
+                                           f_max_pos=f_max_pos,
+                                           f_prob_act=f_prob_act)
+        self.i_max_ticks = i_max_ticks
+
+    def get_spreads(self, rng):
+        '''
+        Return the distance in cents from the best prices that each agent
+        should use to quote
+        :param rng: numpy RandomState. The random number generator
+        '''
+        return rng.randint(0, self.i_max_ticks + 1, self.n_agents) * 0.01
+
+    def decide(self, rng, d_inputs, na_position):
+        '''
+        Return an array with the code of the action of each agent
+        :param rng: numpy RandomState. The random number generator
+        :param d_inputs: dictionary. The market state from Environment.sense
+        :param na_position: numpy array. The current position of each agent
+        '''
+        na_action = np.empty(self.n_agents, dtype=np.int64)
+        na_action.fill(BEST_BOTH)
+        na_action[na_position >= self.f_max_pos] = BEST_OFFER
+        na_action[na_position <= -self.f_max_pos] = BEST_BID
+        na_action[rng.random_sample(self.n_agents) > self.f_prob_act] = HOLD
+        return na_action
+
+
+class MomentumTakers(BackgroundStrategy):
+    '''
+    Agents that send aggressive orders following the direction of the last
+    price changes, each one with its own sensitivity
+    '''
+    s_name = 'MomentumTakers'
+
+    def __init__(self, n_agents, f_max_pos=500., f_prob_act=0.3,
+                 f_mean_threshold=2e-4):
+        '''
+        Initialize a MomentumTakers object. Save all parameters as attributes
+        :param n_agents: integer. Number of agents that follow the strategy
+        :*param f_max_pos: float. Maximum absolute position of each agent
+        :*param f_prob_act: float. Probability of each agent acting in a step
+        :*param f_mean_threshold: float. Average log return that triggers a
+            trade
+        '''
+        super(MomentumTakers, self).__init__(n_agents=n_agents,
+                                             f_max_pos=f_max_pos,
+                                             f_prob_act=f_prob_act)
+        self.f_mean_threshold = f_mean_threshold
+        self.na_threshold = np.zeros(n_agents)
+
+    def get_spreads(self, rng):
+        '''
+        Draw the sensitivity of each agent and return the distance in cents
+        from the best prices that each agent should use to quote
+        :param rng: numpy RandomState. The random number generator
+        '''
+        self.na_threshold = rng.exponential(self.f_mean_threshold,
+                                            self.n_agents)
+        return np.zeros(self.n_agents)
+
+    def decide(self, rng, d_inputs, na_position):
+        '''
+        Return an array with the code of the action of each agent
+        :param rng: numpy RandomState. The random number generator
+        :param d_inputs: dictionary. The market state from Environment.sense
+        :param na_position: numpy array. The current position of each agent
+        '''
+        f_logret = d_inputs['logret']
+        na_action = np.empty(self.n_agents, dtype=np.int64)
+        na_action.fill(HOLD)
+        na_trigger = self.na_threshold < abs(f_logret)
+        na_trigger &= rng.random_sample(self.n_agents) <= self.f_prob_act
+        if f_logret > 0:
+            na_action[na_trigger] = BUY
+        elif f_logret < 0:
+            na_action[na_trigger] = SELL
+        return clip_by_position(na_action, na_position, self.f_max_pos)
+
+
+class NoiseTraders(BackgroundStrategy):
+    '''
+    Agents that choose their actions at random
+    '''
+    s_name = 'NoiseTraders'
+    l_choices = [CANCEL_ALL, BEST_BID, BEST_OFFER, SELL, BUY]
+
+    def decide(self, rng, d_inputs, na_position):
+        '''
+        Return an array with the code of the action of each agent
+        :param rng: numpy RandomState. The random number generator
+        :param d_inputs: dictionary. The market state from Environment.sense
+        :param na_position: numpy array. The current position of each agent
+        '''
+        na_choices = np.array(self.l_choices, dtype=np.int64)
+        na_action = na_choices[rng.randint(0, len(na_choices), self.n_agents)]
+        na_action[rng.random_sample(self.n_agents) > self.f_prob_act] = HOLD
+        return clip_by_position(na_action, na_position, self.f_max_pos)
+
+
+class BackgroundPopulation(object):
+    '''
+    A population of background agents interacting with the replayed market
+    through the same translators used by the primary agent
+    '''
+
+    def __init__(self, env, l_strategies, f_min_time=1., i_seed=None):
+        '''
+        Initialize a BackgroundPopulation object and create its agents in the
+        environment. Save all parameters as attributes
+        :param env: Environment object. The Environment where the agents act
+        :param l_strategies: list. BackgroundStrategy objects to be used
+        :*param f_min_time: float. Minimum time in seconds between decisions
+        :*param i_seed: integer. Seed of the random number generator
+        '''
+        self.env = env
+        self.l_strategies = l_strategies
+        self.f_min_time = f_min_time
+        self.rng = np.random.RandomState(i_seed)
+        self.next_time = 0.
+        self.l_agents = []
+        for strategy in self.l_strategies:
+            na_spreads = strategy.get_spreads(self.rng)
+            l_slots = []
+            for i_agent in xrange(strategy.n_agents):
+                agent = env.create_agent(BackgroundAgent,
+                                         f_spread=na_spreads[i_agent])
+                strategy.l_agents.append(agent)
+                l_slots.append(env.agent_states.slot(agent))
+                self.l_agents.append(agent)
+            strategy.na_slots = np.array(l_slots, dtype=np.int64)
+
+    def reset(self):
+        '''
+        Reset the time of the next decision
+        '''
+        self.next_time = 0.
+
+    def should_update(self):
+        '''
+        Return a boolean informing if it is time to update the population
+        '''
+        return self.env.order_matching.last_date >= self.next_time
+
+    def step(self):
+        '''
+        Take the decisions of all the background agents and send the resulting
+        messages to the order book
+        '''
+        if not self.l_agents:
+            return
+        d_inputs = self.env.sense(self.l_agents[0])
+        na_all_pos = self.env.agent_states.d_columns['Position']
+        l_decisions = []
+        for strategy in self.l_strategies:
+            na_pos = na_all_pos[strategy.na_slots]
+            na_action = strategy.decide(self.rng, d_inputs, na_pos)
+            for i_agent in np.flatnonzero(na_action != HOLD):
+                l_decisions.append((strategy.l_agents[i_agent],
+                                    na_action[i_agent]))
+        # shuffle the order of execution to not favor any group
+        for idx in self.rng.permutation(len(l_decisions)):
+            agent, i_action = l_decisions[idx]
+            self._submit(agent, i_action)
+        # calculate the next time that the population will react
+        self.next_time = self.env.order_matching.last_date
+        self.next_time += self.f_min_time
+
+    def _submit(self, agent, i_action):
+        '''
+        Translate the action of the agent into messages, update the book and
+        forward each message to the agent related to it
+        :param agent: BackgroundAgent object. The agent taking the action
+        :param i_action: integer. The code of the action taken
+        '''
+        l_msg = self._translate_action(agent, i_action)
+        if not l_msg:
+            return
+        self.env.update_order_book(l_msg)
+        for msg in l_msg:
+            if msg['agent_id'] == agent.i_id:
+                self.env.act(agent, msg)
+            else:
+                # let the counterpart know about the trade
+                other = self.env.agent_states.get_agent(msg['agent_id'])
+                self.env.update_agent_state(agent=other, msg=msg)
+
+    def _translate_action(self, agent, i_action):
+        '''
+        Translate the action taken into messages to the environment
+        :param agent: BackgroundAgent object. The agent taking the action
+        :param i_action: integer. The code of the action taken
+        '''
+        my_ordmatch = self.env.order_matching
+        if i_action in (BUY, SELL):
+            row = my_ordmatch.row.copy()
+            row['Size'] = 100.
+            row['Type'] = 'TRADE'
+            if i_action == BUY:
+                row['Price'] = my_ordmatch.best_ask[0]
+                s_side = 'ASK'
+            else:
+                row['Price'] = my_ordmatch.best_bid[0]
+                s_side = 'BID'
+            return translators.translate_trades(my_ordmatch.i_nrow,
+                                                row,
+                                                my_ordmatch,
+                                                s_side,
+                                                agent.i_id)
+        s_action = l_action_names[i_action]
+        return translators.translate_to_agent(agent,
+                                              s_action,
+                                              my_ordmatch,
+                                              agent.f_spread)
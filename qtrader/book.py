@@ -8,9 +8,9 @@ Library to build a limit order book from data generated by different agents
 Created on 08/19/2016
 """
 # import libraries
+from collections import deque
 from bintrees import FastRBTree
 import numpy as np
-import pandas as pd
 
 
 '''
@@ -35,6 +35,113 @@ class InvalidTypeException(Exception):
     pass
 
 
+class OrderIndex(object):
+    '''
+    A compact map from the ids of the orders resting in a side of the book to
+    their price, quantity and main id. The values are kept in parallel NumPy
+    arrays and a dictionary maps each id to its slot. Slots released are
+    reused, so the memory used follows the number of orders alive
+    '''
+
+    def __init__(self, i_capacity=1024):
+        '''
+        Initialize an OrderIndex object
+        :*param i_capacity: integer. Initial number of slots
+        '''
+        self.d_slot = {}
+        self.l_free = []
+        self.i_top = 0  # first slot never used
+        self.na_order_id = np.zeros(i_capacity, dtype=np.int64)
+        self.na_price = np.zeros(i_capacity, dtype=np.float64)
+        self.na_qty = np.zeros(i_capacity, dtype=np.int64)
+        self.na_main_id = np.zeros(i_capacity, dtype=np.int64)
+        self.na_last_seen = np.zeros(i_capacity, dtype=np.int64)
+
+    def _grow(self):
+        '''
+        Double the size of the arrays
+        '''
+        i_add = len(self.na_price)
+        for s_name in ['na_order_id', 'na_price', 'na_qty', 'na_main_id',
+                       'na_last_seen']:
+            na_old = getattr(self, s_name)
+            setattr(self, s_name,
+                    np.concatenate([na_old, np.zeros(i_add, na_old.dtype)]))
+
+    def set(self, i_order_id, f_price, i_qty, i_main_id, i_tick=0):
+        '''
+        Include or update the order passed
+        :param i_order_id: integer. The order id
+        :param f_price: float. The price of the order
+        :param i_qty: integer. The quantity still in the book
+        :param i_main_id: integer. The id used in the price level tree
+        :*param i_tick: integer. The number of the update of the book
+        '''
+        i_slot = self.d_slot.get(i_order_id)
+        if i_slot is None:
+            if self.l_free:
+                i_slot = self.l_free.pop()
+            else:
+                if self.i_top == len(self.na_price):
+                    self._grow()
+                i_slot = self.i_top
+                self.i_top += 1
+            self.d_slot[i_order_id] = i_slot
+        self.na_order_id[i_slot] = i_order_id
+        self.na_price[i_slot] = f_price
+        self.na_qty[i_slot] = i_qty
+        self.na_main_id[i_slot] = i_main_id
+        self.na_last_seen[i_slot] = i_tick
+
+    def get(self, i_order_id):
+        '''
+        Return the price, quantity and main id of the order passed. Raise
+        KeyError if it is not in the index
+        :param i_order_id: integer. The order id
+        '''
+        i_slot = self.d_slot[i_order_id]
+        return (self.na_price[i_slot].item(),
+                self.na_qty[i_slot].item(),
+                self.na_main_id[i_slot].item())
+
+    def pop(self, i_order_id):
+        '''
+        Remove the order passed and return its price, quantity and main id
+        :param i_order_id: integer. The order id
+        '''
+        t_rtn = self.get(i_order_id)
+        self.l_free.append(self.d_slot.pop(i_order_id))
+        return t_rtn
+
+    def active_slots(self):
+        '''
+        Return an array with the slots in use
+        '''
+        return np.fromiter(self.d_slot.itervalues(), dtype=np.int64,
+                           count=len(self.d_slot))
+
+    def nbytes(self):
+        '''
+        Return the number of bytes used by the arrays
+        '''
+        return sum(getattr(self, s_name).nbytes for s_name in
+                   ['na_order_id', 'na_price', 'na_qty', 'na_main_id',
+                    'na_last_seen'])
+
+    def __contains__(self, i_order_id):
+        '''
+        Return if the order is in the index
+        :param i_order_id: integer. The order id
+        '''
+        return i_order_id in self.d_slot
+
+    def __len__(self):
+        '''
+        Return the number of orders in the index
+        '''
+        return len(self.d_slot)
+
+
 '''
 End help functions
 '''
@@ -203,6 +310,16 @@ class BookSide(object):
     '''
     A side of the lmit order book representation
     '''
+    # check the order index every i_sweep_every updates, dropping the entries
+    # orphaned. If b_trim_depth is set, orders not touched for i_max_age
+    # updates and out of the i_keep_levels best prices are also canceled.
+    # The sizes after the last i_history sweeps are kept
+    i_sweep_every = 5000
+    b_trim_depth = False
+    i_max_age = 100000
+    i_keep_levels = 10
+    i_history = 100
+
     def __init__(self, s_side):
         '''
         Initialize a BookSide object. Save all parameters as attributes
@@ -213,8 +330,15 @@ class BookSide(object):
         self.s_side = s_side
         self.price_tree = FastRBTree()
         self._i_idx = 0
-        self.d_order_map = {}
+        self.order_index = OrderIndex()
         self.last_price = 0.
+        self.i_updates = 0
+        self.i_orphans_evicted = 0
+        self.i_stale_evicted = 0
+        self.l_canceled = []  # messages of the orders canceled by the sweep
+        self.d_evicted = {}  # ids of the orders canceled by the sweep
+        # (update, orders, price levels)
+        self.l_size_history = deque(maxlen=self.i_history)
 
     def update(self, d_data):
         '''
@@ -225,28 +349,33 @@ class BookSide(object):
         # dont process aggresive trades
         if d_data['agressor_indicator'] == 'Agressive':
             return True
+        # check the memory used from time to time
+        self.i_updates += 1
+        if self.i_updates % self.i_sweep_every == 0:
+            self.sweep()
         # update the book information
         order_aux = Order(d_data)
+        i_order_id = order_aux.order_id
         s_status = order_aux['order_status']
         b_sould_update = True
         b_success = True
         # check the order status
         if s_status != 'New':
-            try:
-                i_old_id = self.d_order_map[order_aux]['main_id']
-            except KeyError:
+            if i_order_id not in self.order_index:
+                b_evicted = self.d_evicted.pop(i_order_id, False)
                 if s_status == 'Canceled' or s_status == 'Filled':
                     b_sould_update = False
                     s_status = 'Invalid'
                 elif s_status == 'Replaced':
                     s_status = 'New'
+                elif s_status == 'Partially Filled' and b_evicted:
+                    # the order was canceled as stale by the sweep
+                    s_status = 'New'
         # process the message
         if s_status == 'New':
             b_sould_update = self._new_order(order_aux)
         elif s_status != 'Invalid':
-            i_old_id = self.d_order_map[order_aux]['main_id']
-            f_old_pr = self.d_order_map[order_aux]['price']
-            i_old_q = self.d_order_map[order_aux]['qty']
+            f_old_pr, i_old_q, i_old_id = self.order_index.get(i_order_id)
             # hold the last traded price
             if s_status in ['Partially Filled', 'Filled']:
                 self.last_price = order_aux['order_price']
@@ -270,19 +399,97 @@ class BookSide(object):
                                                         i_old_q)
         # remove from order map
         if s_status not in ['New', 'Invalid']:
-            self.d_order_map.pop(order_aux)
+            self.order_index.pop(i_order_id)
         # update the order map
         if b_sould_update:
-            f_qty = int(order_aux['total_qty_order'])
-            self.d_order_map[order_aux] = {}
-            self.d_order_map[order_aux]['price'] = d_data['order_price']
-            self.d_order_map[order_aux]['order_id'] = order_aux.order_id
-            self.d_order_map[order_aux]['qty'] = f_qty
-            self.d_order_map[order_aux]['main_id'] = order_aux.main_id
+            self.order_index.set(i_order_id,
+                                 d_data['order_price'],
+                                 int(order_aux['total_qty_order']),
+                                 order_aux.main_id,
+                                 self.i_updates)
 
         # return that the update was done
         return True
 
+    def _remove_from_level(self, f_price, i_main_id, i_qty):
+        '''
+        Remove an order from its price level, dropping the level if it gets
+        empty. Return if the order was found
+        :param f_price: float. The price of the order
+        :param i_main_id: integer. The id used in the price level tree
+        :param i_qty: integer. The quantity of the order
+        '''
+        this_price = self.price_tree.get(f_price, None)
+        if this_price is None or i_main_id not in this_price.order_tree:
+            return False
+        if this_price.delete(i_main_id, i_qty):
+            self.price_tree.remove(f_price)
+        return True
+
+    def find_orphans(self):
+        '''
+        Return the ids of the orders in the index that are not in the price
+        trees and a list of (price, main id, qty) of the orders in the price
+        trees that are not in the index
+        '''
+        l_index_orphans = []
+        d_alive = {}
+        for i_order_id, i_slot in self.order_index.d_slot.iteritems():
+            f_price = self.order_index.na_price[i_slot].item()
+            i_main_id = self.order_index.na_main_id[i_slot].item()
+            this_price = self.price_tree.get(f_price, None)
+            if this_price is None or i_main_id not in this_price.order_tree:
+                l_index_orphans.append(i_order_id)
+            else:
+                d_alive[i_main_id] = f_price
+        l_tree_orphans = []
+        for f_price, this_price in self.price_tree.items():
+            for i_main_id, order_aux in this_price.order_tree.items():
+                if d_alive.get(i_main_id) != f_price:
+                    i_qty = int(order_aux['total_qty_order'])
+                    l_tree_orphans.append((f_price, i_main_id, i_qty))
+        return l_index_orphans, l_tree_orphans
+
+    def sweep(self):
+        '''
+        Evict the orphaned entries of the index and of the price trees and, if
+        the depth is trimmed, cancel the stale orders far from the best
+        prices, keeping the messages to their owners. Record the size of the
+        structures after that
+        '''
+        # orphaned entries
+        l_index_orphans, l_tree_orphans = self.find_orphans()
+        for i_order_id in l_index_orphans:
+            self.order_index.pop(i_order_id)
+        for f_price, i_main_id, i_qty in l_tree_orphans:
+            self._remove_from_level(f_price, i_main_id, i_qty)
+        self.i_orphans_evicted += len(l_index_orphans) + len(l_tree_orphans)
+        # stale orders out of the top of the book
+        t_top = self.get_n_top_prices(self.i_keep_levels, False)
+        if self.b_trim_depth and len(t_top) == self.i_keep_levels:
+            f_best = t_top[0][0]
+            f_limit = abs(t_top[-1][0] - f_best) + 1e-4
+            obj_idx = self.order_index
+            na_slots = obj_idx.active_slots()
+            na_age = self.i_updates - obj_idx.na_last_seen[na_slots]
+            na_deep = np.abs(obj_idx.na_price[na_slots] - f_best) > f_limit
+            na_stale = na_slots[(na_age > self.i_max_age) & na_deep]
+            for i_slot in na_stale:
+                i_order_id = obj_idx.na_order_id[i_slot].item()
+                f_price, i_qty, i_main_id = obj_idx.pop(i_order_id)
+                self.d_evicted[i_order_id] = True
+                order_aux = self.price_tree[f_price].order_tree[i_main_id]
+                d_rtn = order_aux.d_msg.copy()
+                d_rtn['order_status'] = 'Canceled'
+                d_rtn['action'] = None
+                self.l_canceled.append(d_rtn)
+                self._remove_from_level(f_price, i_main_id, i_qty)
+            self.i_stale_evicted += len(na_stale)
+        # keep the size of the structures
+        self.l_size_history.append((self.i_updates,
+                                    len(self.order_index),
+                                    len(self.price_tree)))
+
     def _canc_expr_filled_order(self, order_obj, i_old_id, f_old_pr, i_old_q):
         '''
         Update price_tree when passed canceled, expried or filled orders
@@ -347,15 +554,10 @@ class BookSide(object):
         :param order_obj: Order Object. The last order in the file
         '''
         # if it was already in the order map
-        if order_obj in self.d_order_map:
-            i_old_sec_id = self.d_order_map[order_obj]['last_order_id']
-            f_old_price = self.d_order_map[order_obj]['price']
-            i_old_qty = self.d_order_map[order_obj]['qty']
-            this_price = self.price_tree.get(f_old_price)
-            # remove from order map
-            self.d_order_map.pop(order_obj)
-            if this_price.delete(i_old_sec_id, i_old_qty):
-                self.price_tree.remove(f_old_price)
+        if order_obj.order_id in self.order_index:
+            t_old = self.order_index.pop(order_obj.order_id)
+            f_old_price, i_old_qty, i_old_sec_id = t_old
+            self._remove_from_level(f_old_price, i_old_sec_id, i_old_qty)
 
         # insert a empty price level if it is needed
         f_price = order_obj['order_price']
@@ -398,6 +600,7 @@ class BidSide(BookSide):
         :param n: integer. Number of price levels desired
         :param b_return_dataframe: boolean. If should return a dataframe
         '''
+        import pandas as pd
         t_rtn = self.price_tree.nlargest(n)
         if not b_return_dataframe:
             return t_rtn
@@ -411,6 +614,7 @@ class BidSide(BookSide):
         :param n: integer. Number of price levels desired
         :param b_return_dataframe: boolean. If should return a dataframe
         '''
+        import pandas as pd
         t_rtn = self.price_tree.nsmallest(n)
         if not b_return_dataframe:
             return t_rtn
@@ -435,6 +639,7 @@ class AskSide(BookSide):
         :param n: integer. Number of price levels desired
         :param b_return_dataframe: boolean. If should return a dataframe
         '''
+        import pandas as pd
         t_rtn = self.price_tree.nsmallest(n)
         if not b_return_dataframe:
             return t_rtn
@@ -448,6 +653,7 @@ class AskSide(BookSide):
         :param n: integer. Number of price levels desired
         :param b_return_dataframe: boolean. If should return a dataframe
         '''
+        import pandas as pd
         t_rtn = self.price_tree.nlargest(n)
         if not b_return_dataframe:
             return t_rtn
@@ -492,6 +698,7 @@ class LimitOrderBook(object):
         Return a dataframe with the n top prices of the current order book
         :param n: integer. Number of price levels desired
         '''
+        import pandas as pd
         t_rtn1 = self.book_bid.get_n_top_prices(n, b_return_dataframe=False)
         t_rtn2 = self.book_ask.get_n_top_prices(n, b_return_dataframe=False)
         df1 = pd.DataFrame(t_rtn1, columns=['Bid', 'qBid'])
@@ -503,6 +710,16 @@ class LimitOrderBook(object):
 
         return df_rtn
 
+    def pop_canceled(self):
+        '''
+        Return the messages of the orders canceled by the sweeps of both sides
+        since the last call
+        '''
+        l_rtn = self.book_bid.l_canceled + self.book_ask.l_canceled
+        self.book_bid.l_canceled = []
+        self.book_ask.l_canceled = []
+        return l_rtn
+
     def get_best_price(self, s_side):
         '''
         Return the best price of the specified side
@@ -544,19 +761,34 @@ class LimitOrderBook(object):
     def get_basic_stats(self):
         '''
         Return the number of price levels and number of orders remain in the
-        dictionaries and trees
-        '''
-        i_n_order_bid = len(self.book_bid.d_order_map.keys())
-        i_n_order_ask = len(self.book_ask.d_order_map.keys())
-        i_n_price_bid = len([x for x in self.book_bid.price_tree.keys()])
-        i_n_price_ask = len([x for x in self.book_ask.price_tree.keys()])
-        i_n_order_bid, i_n_order_ask, i_n_price_bid, i_n_price_ask
-        d_rtn = {'n_order_bid': i_n_order_bid,
-                 'n_order_ask': i_n_order_ask,
-                 'n_price_bid': i_n_price_bid,
-                 'n_price_ask': i_n_price_ask}
+        dictionaries and trees, the memory used by the order indexes and how
+        many entries were evicted
+        '''
+        d_rtn = {'n_order_bid': len(self.book_bid.order_index),
+                 'n_order_ask': len(self.book_ask.order_index),
+                 'n_price_bid': len(self.book_bid.price_tree),
+                 'n_price_ask': len(self.book_ask.price_tree),
+                 'index_bytes_bid': self.book_bid.order_index.nbytes(),
+                 'index_bytes_ask': self.book_ask.order_index.nbytes(),
+                 'n_orphans_evicted': (self.book_bid.i_orphans_evicted +
+                                       self.book_ask.i_orphans_evicted),
+                 'n_stale_evicted': (self.book_bid.i_stale_evicted +
+                                     self.book_ask.i_stale_evicted)}
         return d_rtn
 
+    def get_size_history(self):
+        '''
+        Return a dataframe with the number of orders and price levels in each
+        side of the book over the updates
+        '''
+        import pandas as pd
+        l_cols = ['update', 'n_orders', 'n_prices']
+        df_bid = pd.DataFrame(self.book_bid.l_size_history, columns=l_cols)
+        df_ask = pd.DataFrame(self.book_ask.l_size_history, columns=l_cols)
+        df_bid['side'] = 'BID'
+        df_ask['side'] = 'ASK'
+        return pd.concat([df_bid, df_ask], ignore_index=True)
+
     def update(self, d_data):
         '''
         Update the book based on the message passed
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a content-addressed cache of the results of test sessions. Each
+entry is keyed by the hash of the day file, the Q-table, the agent class and
+parameters and the version of the code, so a session is just simulated again
+when any of them change
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import glob
+import hashlib
+import json
+import os
+import zipfile
+
+import qtable
+
+'''
+Begin help functions
+'''
+
+s_code_version = None  # hash of the sources, computed once per process
+
+
+def code_version():
+    '''
+    Return a hash of the source files of the package
+    '''
+    global s_code_version
+    if s_code_version is None:
+        obj_md5 = hashlib.md5()
+        s_dir = os.path.dirname(os.path.abspath(__file__))
+        for s_fname in sorted(glob.glob(os.path.join(s_dir, '*.py'))):
+            obj_md5.update(os.path.basename(s_fname))
+            with open(s_fname, 'rb') as fr:
+                obj_md5.update(fr.read())
+        s_code_version = obj_md5.hexdigest()
+    return s_code_version
+
+
+def day_file_hash(s_fname, s_member):
+    '''
+    Return a hash of a file inside a zip archive, using the CRC and the size
+    stored in the archive instead of reading the file
+    :param s_fname: string. the container zip file
+    :param s_member: string. the name of the file inside the archive
+    '''
+    with zipfile.ZipFile(s_fname, 'r') as archive:
+        obj_info = archive.getinfo(s_member)
+    s_aux = '{}:{}:{}'.format(s_member, obj_info.CRC, obj_info.file_size)
+    return hashlib.md5(s_aux).hexdigest()
+
+
+def qtable_file_hash(s_fname):
+    '''
+    Return a hash of the content of a Q-table file. The binary files already
+    keep it in their header
+    :param s_fname: string. Path to the file
+    '''
+    if s_fname is None or not os.path.exists(s_fname):
+        return None
+    try:
+        return qtable.read_header(s_fname)[0]['digest']
+    except (qtable.InvalidQTableException, ValueError, KeyError):
+        obj_md5 = hashlib.md5()
+        with open(s_fname, 'rb') as fr:
+            obj_md5.update(fr.read())
+        return obj_md5.hexdigest()
+
+
+'''
+End help functions
+'''
+
+
+class ResultCache(object):
+    '''
+    A size-bounded folder of JSON files with the results of test sessions.
+    The least recently used entries are evicted when the folder exceeds the
+    size limit
+    '''
+
+    def __init__(self, s_dir='log/cache', i_max_bytes=512 * 1024 ** 2):
+        '''
+        Initialize a ResultCache object. Save all parameters as attributes
+        :*param s_dir: string. Folder where the entries are stored
+        :*param i_max_bytes: integer. Maximum size of the folder
+        '''
+        self.s_dir = s_dir
+        self.i_max_bytes = i_max_bytes
+        self.i_hits = 0
+        self.i_misses = 0
+        if not os.path.exists(s_dir):
+            os.makedirs(s_dir)
+
+    def make_key(self, s_day_hash, s_qtable_hash, d_agent, i_seed=None):
+        '''
+        Return the key of a test session
+        :param s_day_hash: string. Hash of the file replayed
+        :param s_qtable_hash: string. Hash of the Q-table used
+        :param d_agent: dictionary. Agent class and parameters
+        :*param i_seed: integer. Seed of the random number generators
+        '''
+        d_key = {'day': s_day_hash,
+                 'qtable': s_qtable_hash,
+                 'agent': d_agent,
+                 'seed': i_seed,
+                 'code': code_version()}
+        return hashlib.sha1(json.dumps(d_key, sort_keys=True)).hexdigest()
+
+    def _path(self, s_key):
+        '''
+        Return the path to the file of the entry
+        :param s_key: string. The key of the entry
+        '''
+        return os.path.join(self.s_dir, s_key + '.json')
+
+    def get(self, s_key):
+        '''
+        Return the result stored or None if there is no entry for the key
+        :param s_key: string. The key of the entry
+        '''
+        s_path = self._path(s_key)
+        try:
+            with open(s_path, 'r') as fr:
+                d_rtn = json.load(fr)
+        except (IOError, ValueError):
+            self.i_misses += 1
+            return None
+        # mark as recently used
+        os.utime(s_path, None)
+        self.i_hits += 1
+        return d_rtn
+
+    def put(self, s_key, d_result):
+        '''
+        Store the result of a session and evict old entries if needed
+        :param s_key: string. The key of the entry
+        :param d_result: dictionary. Anything that can be saved as JSON
+        '''
+        s_path = self._path(s_key)
+        s_tmp = s_path + '.tmp'
+        with open(s_tmp, 'w') as fw:
+            json.dump(d_result, fw)
+        os.rename(s_tmp, s_path)
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the folder fits in the
+        size limit
+        '''
+        l_entries = []
+        i_total = 0
+        for s_path in glob.glob(os.path.join(self.s_dir, '*.json')):
+            obj_stat = os.stat(s_path)
+            l_entries.append((obj_stat.st_mtime, obj_stat.st_size, s_path))
+            i_total += obj_stat.st_size
+        for f_mtime, i_size, s_path in sorted(l_entries):
+            if i_total <= self.i_max_bytes:
+                break
+            os.remove(s_path)
+            i_total -= i_size
@@ -10,6 +10,9 @@ Created on 09/18/2016
 """
 from collections import defaultdict
 import csv
+import multiprocessing
+import os
+import re
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as dates
@@ -18,6 +21,10 @@ import pandas as pd
 import seaborn as sns
 import zipfile
 
+import kernels
+import pipeline
+import recorder
+
 
 '''
 Begin help functions
@@ -51,11 +58,44 @@ def convert_float_to_time(f_time):
     return '{:02d}:{:02d}:{:02d}'.format(i_hour, i_minute, i_seconds)
 
 
-def make_df(d_data):
+def read_series(s_dir, s_agent):
+    '''
+    Return a dictionary with the PnL, the position and the reward of each
+    phase and trial recorded by the environment, keeping the last value of
+    each minute, like simple_counts() does with the log files
+    :param s_dir: string. Folder of the files saved by the recorders
+    :param s_agent: string. Name of the agent
+    '''
+    d_rtn = {}
+    for s_col in ['pnl', 'position', 'reward']:
+        d_rtn[s_col] = {'test': defaultdict(dict), 'train': defaultdict(dict)}
+    for s_fname in recorder.list_series(s_dir, s_agent):
+        na_series, d_info = recorder.load_series(s_fname)
+        if not len(na_series):
+            continue
+        ts_day = pd.to_datetime(d_info['date'])
+        na_date = ts_day + pd.to_timedelta(na_series['time'], unit='s')
+        df = pd.DataFrame({'pnl': na_series['pnl'],
+                           'position': na_series['position'],
+                           'reward': na_series['reward']},
+                          index=pd.DatetimeIndex(na_date).floor('min'))
+        df = df.groupby(level=0).last()
+        for s_col in ['pnl', 'position', 'reward']:
+            d_aux = d_rtn[s_col][d_info['phase']][d_info['trial']]
+            d_aux.update(df[s_col].to_dict())
+    return d_rtn
+
+
+def make_df(d_data, s_agent=None, s_phase='test'):
     '''
     Reshape the data passed to acumulate the pnl from previous days
-    :param d_data: dict. PnL data from tests performed
+    :param d_data: dict. PnL data from tests performed or the folder of the
+        files saved by the recorders
+    :*param s_agent: string. Name of the agent, when reading the recorders
+    :*param s_phase: string. The phase to use, when reading the recorders
     '''
+    if isinstance(d_data, basestring):
+        d_data = read_series(d_data, s_agent)['pnl'][s_phase]
     df_aux = pd.DataFrame(d_data)
     df_filter = pd.Series([x.day for x in df_aux.index])
     df_aux2 = pd.DataFrame(np.zeros(df_aux.shape))
@@ -89,6 +129,7 @@ def test_ofi_indicator(s_fname, f_min_time=10.):
     f_ofi = 0.
     f_mid = None
     f_next_time = 10 * 3600 + 5 * 60 + f_min_time
+    parse_time = pipeline.TimeParser()
     for idx_row, row in enumerate(csv.DictReader(archive.open(x))):
         if idx_row == 0:
             f_first_price = row['Price']
@@ -97,8 +138,8 @@ def test_ofi_indicator(s_fname, f_min_time=10.):
             # converte string para float
             row['Price'] = float(row['Price'].replace(',', '.'))
             row['Size'] = float(row['Size'])
-            f_current_time = sum([float(x)*60**(2.-i_aux) for i_aux, x in
-                                 enumerate(row['Date'][-8:].split(':'))])
+            f_current_time = parse_time(row['Date'][-8:])
+            f_current_time /= float(pipeline.US_PER_SECOND)
             if f_current_time > f_next_time:
                 # imprime resultado
                 s_time = convert_float_to_time(f_next_time)
@@ -137,6 +178,43 @@ def test_ofi_indicator(s_fname, f_min_time=10.):
             f_ofi += f_e_n
 
 
+def ofi_windows(s_fname, l_windows=(1, 10, 60)):
+    '''
+    Return a dataframe with the best quotes after each update of the first
+    file of the zip file passed and the order flow imbalance over the last
+    seconds of each window, computed at once over the whole file. The rows
+    start when both sides have a quote
+    :param s_fname: string. The zip file where is the information
+    :*param l_windows: tuple. The lengths of the windows, in seconds
+    '''
+    archive = zipfile.ZipFile(s_fname, 'r')
+    d_best_price = {'BID': (0., 0.), 'ASK': (0., 0.)}
+    parse_time = pipeline.TimeParser()
+    l_rows = []
+    for row in csv.DictReader(archive.open(archive.filelist[0])):
+        if row['Type'] not in ['BID', 'ASK']:
+            continue
+        f_price = float(row['Price'].replace(',', '.'))
+        d_best_price[row['Type']] = (f_price, float(row['Size']))
+        # the first quote of a side is not a change of the flow
+        if not d_best_price['BID'][0] or not d_best_price['ASK'][0]:
+            continue
+        l_rows.append((parse_time(row['Date'][-8:]),
+                       d_best_price['BID'][0], d_best_price['BID'][1],
+                       d_best_price['ASK'][0], d_best_price['ASK'][1]))
+    na_rows = np.array(l_rows)
+    na_time = na_rows[:, 0].astype(np.int64)
+    na_ofi = kernels.accumulate_ofi(na_rows[:, 1], na_rows[:, 2],
+                                    na_rows[:, 3], na_rows[:, 4])
+    df_rtn = pd.DataFrame(na_rows[:, 1:], index=na_time,
+                          columns=['BID', 'qBID', 'ASK', 'qASK'])
+    for i_window in l_windows:
+        i_window_us = i_window * pipeline.US_PER_SECOND
+        df_rtn['OFI_{}'.format(i_window)] = kernels.rolling_sum(
+            na_time, na_ofi, i_window_us)
+    return df_rtn
+
+
 def cluster_results(reduced_data, preds, centers):
     '''
     Visualizes the reduced cluster data in two dimensions
@@ -224,147 +302,243 @@ def pca_results(good_data, pca):
     return pd.concat([variance_ratios, components], axis=1)
 
 
+# kinds of the lines of the log files used by the analysis
+UPDATE, CHOOSE, TRIAL_ENDED, TEST_STARTED = 1, 2, 3, 4
+# one match per line of interest: the update of an agent, the choice of an
+# action, the end of a trial or the start of the test phase
+LOG_RE = re.compile(
+    r'^[^;\n]*;(?:'
+    r'(?P<agent>\w+)\.update\(\): time = (?P<time>[^,\n]*)'
+    r'(?:[^\n]*?, action = (?P<action>[^,\n]*))?'
+    r'(?:[^\n]*?, pnl = (?P<pnl>[^,\n]*))?'
+    r'(?:[^\n]*?delta_pnl = (?P<dpnl>[^,\n]*))?'
+    r'(?:[^\n]*?reward = (?P<reward>[^,\n]*))?'
+    r'|[^\n]*?\.choose_an_action\(\)[^\n]*?gamma = (?P<gamma>[^,\n]*)'
+    r'[^\n]*?k = (?P<k>[^,\n]*)'
+    r'|(?P<ended>[^\n]*?Trial Ended)'
+    r'|(?P<testing>[^\n]*?run\(\): Starting testing phase !)'
+    r')', re.M)
+l_event_cols = ['kind', 'agent', 'time', 'action', 'pnl', 'dpnl', 'reward',
+                'gamma', 'k']
+
+
+def _to_float(s_val):
+    '''
+    Return the float of the string passed or NaN if it is missing
+    :param s_val: string. The value captured
+    '''
+    if s_val is None:
+        return np.nan
+    return float(s_val)
+
+
+def parse_log(s_fname, i_chunk=1 << 26):
+    '''
+    Return a dictionary of arrays with the lines of interest of a log file,
+    reading it in chunks of i_chunk bytes
+    :param s_fname: string. Name of the log file
+    :*param i_chunk: integer. Number of bytes read at once
+    '''
+    d_data = dict((s_col, []) for s_col in l_event_cols)
+    s_rest = ''
+    with open(s_fname, 'rb') as fr:
+        while True:
+            s_block = fr.read(i_chunk)
+            if not s_block:
+                s_text, s_rest = s_rest, ''
+            else:
+                s_text = s_rest + s_block
+                i_end = s_text.rfind('\n') + 1
+                s_text, s_rest = s_text[:i_end], s_text[i_end:]
+            for obj_match in LOG_RE.finditer(s_text):
+                d_match = obj_match.groupdict()
+                if d_match['agent'] is not None:
+                    i_kind = UPDATE
+                elif d_match['gamma'] is not None:
+                    i_kind = CHOOSE
+                elif d_match['ended'] is not None:
+                    i_kind = TRIAL_ENDED
+                else:
+                    i_kind = TEST_STARTED
+                d_data['kind'].append(i_kind)
+                for s_col in ['agent', 'time', 'action', 'gamma', 'k']:
+                    d_data[s_col].append(d_match[s_col] or '')
+                for s_col in ['pnl', 'dpnl', 'reward']:
+                    d_data[s_col].append(_to_float(d_match[s_col]))
+            if not s_block:
+                break
+    d_rtn = {'kind': np.array(d_data['kind'], dtype=np.int8)}
+    for s_col in ['agent', 'time', 'action', 'gamma', 'k']:
+        d_rtn[s_col] = np.array(d_data[s_col], dtype=str)
+    for s_col in ['pnl', 'dpnl', 'reward']:
+        d_rtn[s_col] = np.array(d_data[s_col], dtype=np.float64)
+    return d_rtn
+
+
+def load_events(s_fname, b_cache=True):
+    '''
+    Return the lines of interest of a log file, using the columnar file saved
+    next to the log when it was created from the same version of the log
+    :param s_fname: string. Name of the log file
+    :*param b_cache: boolean. If should read and write the cache file
+    '''
+    s_cache = s_fname + '.events.npz'
+    obj_stat = os.stat(s_fname)
+    if b_cache and os.path.exists(s_cache):
+        with np.load(s_cache) as d_load:
+            if int(d_load['source_size']) == obj_stat.st_size and \
+               float(d_load['source_mtime']) == obj_stat.st_mtime:
+                return dict((s_col, d_load[s_col]) for s_col in l_event_cols)
+    d_rtn = parse_log(s_fname)
+    if b_cache:
+        np.savez(s_cache, source_size=obj_stat.st_size,
+                 source_mtime=obj_stat.st_mtime, **d_rtn)
+    return d_rtn
+
+
+def parse_logs(l_fnames, n_workers=None):
+    '''
+    Parse and cache many log files in parallel. Return the list of events of
+    each file, in the same order
+    :param l_fnames: list. Names of the log files
+    :*param n_workers: integer. Number of processes. Default is the cpu count
+    '''
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        return pool.map(load_events, l_fnames)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _minutes(na_time):
+    '''
+    Return the timestamps of the minutes of the times passed, parsing each
+    distinct minute just once
+    :param na_time: numpy array. Strings like '2016-07-25 10:30:05'
+    '''
+    l_minutes = [s_time[:-3] + ':00' for s_time in na_time]
+    na_uniq, na_inv = np.unique(l_minutes, return_inverse=True)
+    return list(pd.to_datetime(na_uniq)[na_inv])
+
+
 def simple_counts(s_fname, s_agent):
     '''
     Analyze thew log files generated by the agents
     :param s_fname: string. Name of the log file
     :param s_agent: string. Name of the agent in the logfile
     '''
-    with open(s_fname) as fr:
-        d_cumrewr = {'test': defaultdict(lambda: defaultdict(float)),
-                     'train': defaultdict(lambda: defaultdict(float))}
-        d_pnl = {'test': defaultdict(lambda: defaultdict(float)),
+    d_events = load_events(s_fname)
+    d_cumrewr = {'test': defaultdict(lambda: defaultdict(float)),
                  'train': defaultdict(lambda: defaultdict(float))}
-        # d_position = {'test': defaultdict(lambda: defaultdict(int)),
-        #               'train': defaultdict(lambda: defaultdict(int))}
-        d_cumrewr = {'test': defaultdict(lambda: defaultdict(float)),
-                     'train': defaultdict(lambda: defaultdict(float))}
-        d_reward = {'test': defaultdict(int),
-                    'train': defaultdict(int)}
-        d_delta_pnl = defaultdict(int)
-        d_action = defaultdict(int)
-        f_reward = 0.
-        f_count_step = 0
-        last_reward = 0.
-        i_trial = 0
-        s_phase = 'train'
-
-        for idx, row in enumerate(fr):
-            if row == '\n':
-                continue
-            s_aux = row.strip().split(';')[1]
-            # extract desired information
-            if '{}.update'.format(s_agent) in s_aux:
-                # s_x = row.split('time = ')[1].split(' ')[1].split(',')[0]
-                s_x = row.split('time = ')[1].split(',')[0]
-                s_date_all = s_x
-                s_x = s_date_all[:-3]
-                s_date = s_x
-                ts_date_all = pd.to_datetime(s_date_all)
-                ts_date = pd.to_datetime(s_date + ':00')
-                last_reward = float(s_aux.split('reward = ')[1].split(',')[0])
-                f_x = float(s_aux.split('position = ')[1].split(',')[0])
-                # d_position[s_phase][i_trial+1][ts_date_all] = f_x
-                d_cumrewr[s_phase][i_trial+1][ts_date] = f_reward + last_reward
-                f_reward += last_reward
-                f_count_step += 1.
-                if 'delta_pnl = ' in s_aux:
-                    f_val = float(s_aux.split('delta_pnl = ')[1].split(',')[0])
-                    d_delta_pnl[int(f_val)] += 1
-                if ', action = ' in s_aux:
-                    s_action = s_aux.split(', action = ')[1].split(',')[0]
-                    d_action[s_action] += 1
-                if ', pnl = ' in s_aux:
-                    s_action = s_aux.split(', pnl = ')[1].split(',')[0]
-                    d_pnl[s_phase][i_trial+1][ts_date] = float(s_action)
-            elif 'Trial Ended' in s_aux:
-                # store cumulative data
-                if f_count_step > 0:
-                    d_reward[s_phase][i_trial+1] = f_reward / f_count_step
-                i_trial += 1
-                b_already_finish = False
-                f_count_step = 0
-                f_reward = 0
-            elif 'run(): Starting testing phase !' in s_aux:
-                i_trial = 0
-                s_phase = 'test'
-
-        d_summary = {}
-        d_summary['cumulative_reward'] = d_cumrewr
-        d_summary['avg_reward'] = d_reward
-        # d_summary['position'] = d_position
-        d_summary['delta_pnl'] = d_delta_pnl
-        d_summary['pnl'] = d_pnl
-        d_summary['action'] = d_action
-
-        return d_summary
+    d_pnl = {'test': defaultdict(lambda: defaultdict(float)),
+             'train': defaultdict(lambda: defaultdict(float))}
+    d_reward = {'test': defaultdict(int),
+                'train': defaultdict(int)}
+    d_delta_pnl = defaultdict(int)
+    d_action = defaultdict(int)
+    f_reward = 0.
+    f_count_step = 0
+    i_trial = 0
+    s_phase = 'train'
+
+    na_kind = d_events['kind']
+    na_mine = (na_kind == UPDATE) & (d_events['agent'] == s_agent)
+    na_keep = na_mine | (na_kind == TRIAL_ENDED) | (na_kind == TEST_STARTED)
+    # parse the dates of all updates at once
+    l_dates = iter(_minutes(d_events['time'][na_mine]))
+    for idx in np.flatnonzero(na_keep):
+        i_kind = na_kind[idx]
+        if i_kind == UPDATE:
+            ts_date = next(l_dates)
+            last_reward = d_events['reward'][idx]
+            d_cumrewr[s_phase][i_trial+1][ts_date] = f_reward + last_reward
+            f_reward += last_reward
+            f_count_step += 1.
+            f_val = d_events['dpnl'][idx]
+            if not np.isnan(f_val):
+                d_delta_pnl[int(f_val)] += 1
+            if d_events['action'][idx]:
+                d_action[d_events['action'][idx]] += 1
+            f_val = d_events['pnl'][idx]
+            if not np.isnan(f_val):
+                d_pnl[s_phase][i_trial+1][ts_date] = f_val
+        elif i_kind == TRIAL_ENDED:
+            # store cumulative data
+            if f_count_step > 0:
+                d_reward[s_phase][i_trial+1] = f_reward / f_count_step
+            i_trial += 1
+            f_count_step = 0
+            f_reward = 0
+        else:
+            i_trial = 0
+            s_phase = 'test'
+
+    d_summary = {}
+    d_summary['cumulative_reward'] = d_cumrewr
+    d_summary['avg_reward'] = d_reward
+    d_summary['delta_pnl'] = d_delta_pnl
+    d_summary['pnl'] = d_pnl
+    d_summary['action'] = d_action
+
+    return d_summary
 
 
 def count_by_k_gamma(s_fname, s_agent, s_split):
     '''
     Analyze thew log files generated by the agents, separating the information
     by k or gamma values
-    :param s_fname: string. Name of the log file
+    :param s_fname: string or list. Name of the log file or the names of the
+        log files of the jobs of a sweep, read in order
     :param s_agent: string. Name of the agent in the logfile
     :param s_split: string. 'gamma' or 'k'. Key to use to split data
     '''
     assert s_split in ['k', 'gamma'], 's_split should be k or gamma'
-    with open(s_fname) as fr:
-        d_rtn = {}
-        d_gamma = {}
-        d_delta_pnl = defaultdict(int)
-        d_action = defaultdict(int)
-        f_reward = 0.
-        f_count_step = 0
-        last_reward = 0.
-        i_trial = 0
-
-        for idx, row in enumerate(fr):
-            if row == '\n':
-                continue
-            s_aux = row.strip().split(';')[1]
-            # extract desired information
-            if '.choose_an_action()' in s_aux:
-                if s_split == 'gamma':
-                    s_key = s_aux.split('gamma = ')[1].split(',')[0]
-                if s_split == 'k':
-                    s_key = s_aux.split('k = ')[1].split(',')[0]
-                if s_key not in d_rtn:
-                    d_rtn[s_key] = defaultdict(lambda: defaultdict(float))
-                    i_trial = 0
-                    b_already_finish = False
-                    f_count_step = 0
-                    f_reward = 0
-            if '{}.update'.format(s_agent) in s_aux:
-                s_x = row.split('time = ')[1].split(',')[0]
-                s_date_all = s_x
-                s_x = s_date_all[:-3]
-                s_date = s_x
-                ts_date_all = pd.to_datetime(s_date_all)
-                ts_date = pd.to_datetime(s_date + ':00')
-                last_reward = float(s_aux.split('reward = ')[1].split(',')[0])
-                f_x = float(s_aux.split('position = ')[1].split(',')[0])
-                f_reward += last_reward
-                f_count_step += 1.
-                if ', pnl = ' in s_aux:
-                    s_action = s_aux.split(', pnl = ')[1].split(',')[0]
-                    f_aux = float(s_action)
-                    d_rtn[s_key][i_trial+1][ts_date] = f_aux
-            elif 'Trial Ended' in s_aux:
-                i_trial += 1
-                b_already_finish = False
-                f_count_step = 0
-                f_reward = 0
-
-        return d_rtn
-
-
-def plot_train_test_sim(d_rtn):
+    if isinstance(s_fname, basestring):
+        d_events = load_events(s_fname)
+    else:
+        l_events = [load_events(s_aux) for s_aux in s_fname]
+        d_events = dict((s_col, np.concatenate([d_aux[s_col] for d_aux in
+                                                l_events]))
+                        for s_col in l_event_cols)
+    d_rtn = {}
+    i_trial = 0
+    s_key = None
+
+    na_kind = d_events['kind']
+    na_mine = (na_kind == UPDATE) & (d_events['agent'] == s_agent)
+    na_keep = na_mine | (na_kind == CHOOSE) | (na_kind == TRIAL_ENDED)
+    # parse the dates of all updates at once
+    l_dates = iter(_minutes(d_events['time'][na_mine]))
+    na_split = d_events[s_split]
+    for idx in np.flatnonzero(na_keep):
+        i_kind = na_kind[idx]
+        if i_kind == CHOOSE:
+            s_key = na_split[idx]
+            if s_key not in d_rtn:
+                d_rtn[s_key] = defaultdict(lambda: defaultdict(float))
+                i_trial = 0
+        elif i_kind == UPDATE:
+            ts_date = next(l_dates)
+            f_val = d_events['pnl'][idx]
+            if s_key is not None and not np.isnan(f_val):
+                d_rtn[s_key][i_trial+1][ts_date] = f_val
+        else:
+            i_trial += 1
+
+    return d_rtn
+
+
+def plot_train_test_sim(d_rtn, s_agent='LearningAgent_k'):
     '''
     Plot the PnL curves from simulations to compare the performance of each
     policy learned on the traning phase in on the test phase
-    :param d_rtn: dict. Data from simulation
+    :param d_rtn: dict. Data from simulation or the folder of the files saved
+        by the recorders
+    :*param s_agent: string. Name of the agent, when reading the recorders
     '''
+    if isinstance(d_rtn, basestring):
+        d_rtn = read_series(d_rtn, s_agent)
     f, na_ax = plt.subplots(2, 5, sharex=True, sharey=True)
     df_test = make_df(d_rtn['pnl']['test'])
     df_train = make_df(d_rtn['pnl']['train'])
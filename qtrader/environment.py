@@ -9,11 +9,15 @@ Created on 08/18/2016
 """
 import time
 import random
-from collections import OrderedDict
 import numpy as np
 from bintrees import FastRBTree
 
 from matching_engine import BloombergMatching
+from registry import AgentRegistry
+from recorder import SeriesRecorder, series_fname
+from translators import ZOMBIE_ID
+import latency
+import rolling
 import logging
 
 # global variable
@@ -57,13 +61,13 @@ class Environment(object):
         self.s_instrument = 'PETR4'
         self.done = False
         self.t = 0
-        self.agent_states = OrderedDict()
+        self.agent_states = AgentRegistry()
         self.initial_idx = i_idx
         self.count_trials = 1
 
         # Include Dummy agents
         self.num_dummies = 1  # no. of dummy agents
-        self.last_id_agent = 10
+        self.last_id_agent = ZOMBIE_ID
         for i in xrange(self.num_dummies):
             self.create_agent(ZombieAgent)
 
@@ -71,6 +75,13 @@ class Environment(object):
         self.primary_agent = None  # to be set explicitly
         self.enforce_deadline = False
 
+        # background agents. Use add_background() to include them
+        self.background = None
+
+        # recorders of the PnL series of each agent, by agent id. Use
+        # add_recorder() to include them
+        self.d_recorders = {}
+
         # Initiate Matching Engine
         s_aux = self.s_instrument
         i_naux = self.num_dummies+1
@@ -118,15 +129,7 @@ class Environment(object):
 
         kwargs['i_id'] = self.last_id_agent
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'qBid': 0,
-                                    'Bid': 0.,
-                                    'Ask': 0.,
-                                    'qAsk': 0,
-                                    'Position': 0,
-                                    'Pnl': 0,
-                                    'Agent': agent,
-                                    'best_bid': False,
-                                    'best_offer': False}
+        self.agent_states.add(agent)
         self.last_id_agent += 1
         return agent
 
@@ -136,15 +139,67 @@ class Environment(object):
         :param agent: Agent Object. The agent used as primary
         '''
         self.primary_agent = agent
-        self.agent_states[agent] = {'qBid': 0,
-                                    'Bid': 0.,
-                                    'Ask': 0.,
-                                    'qAsk': 0,
-                                    'Position': 0,
-                                    'Pnl': 0,
-                                    'Agent': agent,
-                                    'best_bid': False,
-                                    'best_offer': False}
+        self.agent_states.add(agent)
+
+    def remove_agent(self, agent):
+        '''
+        Exclude an agent from the environment, so it can be reused with other
+        agents
+        :param agent: Agent Object. The agent to be removed
+        '''
+        self.agent_states.remove(agent)
+        self.d_recorders.pop(agent.i_id, None)
+        if self.primary_agent is agent:
+            self.primary_agent = None
+
+    def add_recorder(self, agent, i_capacity=8192):
+        '''
+        Record the PnL series of the agent passed in each session. The series
+        are saved by flush_recorders() in files named by agent, phase, trial
+        and session, so only one environment should record to a folder
+        :param agent: Agent Object. The agent to be recorded
+        :*param i_capacity: integer. Initial number of rows of the recorder
+        '''
+        self.d_recorders[agent.i_id] = SeriesRecorder(i_capacity)
+
+    def flush_recorders(self, s_phase, i_trial, i_session, s_dir='log/series'):
+        '''
+        Save the series recorded in the session and clear the recorders
+        :param s_phase: string. 'train' or 'test'
+        :param i_trial: integer. id of the trial
+        :param i_session: integer. id of the session in the trial
+        :*param s_dir: string. Folder where the files are saved
+        '''
+        s_date = ''
+        if self.order_matching.row:
+            s_date = self.order_matching.row['Date'].split(' ')[0]
+        for i_id, recorder in self.d_recorders.iteritems():
+            if not len(recorder):
+                continue
+            agent = self.agent_states.get_agent(i_id)
+            s_agent = getattr(agent, 's_agent_name', 'Agent{}'.format(i_id))
+            s_fname = series_fname(s_dir, s_agent, s_phase, i_trial,
+                                   i_session)
+            recorder.flush(s_fname, {'agent': s_agent,
+                                     'phase': s_phase,
+                                     'trial': i_trial,
+                                     'session': i_session,
+                                     'date': s_date})
+
+    def add_background(self, l_strategies, f_min_time=1., i_seed=None):
+        '''
+        Include a population of background agents in the environment. The
+        historical flow is still attributed to the ZombieAgent
+        :param l_strategies: list. BackgroundStrategy objects to be used
+        :*param f_min_time: float. Minimum time in seconds between decisions
+        :*param i_seed: integer. Seed of the random number generator
+        '''
+        from background import BackgroundPopulation
+        self.background = BackgroundPopulation(self,
+                                               l_strategies,
+                                               f_min_time=f_min_time,
+                                               i_seed=i_seed)
+        return self.background
 
     def log_trial(self):
         '''
@@ -157,6 +212,8 @@ class Environment(object):
                 logging.info(s_msg)
             else:
                 print s_msg
+        # log the latencies of the decisions taken in the trial
+        latency.tracker.end_trial()
 
     def reset_order_matching_idx(self, i_idx=None):
         '''
@@ -194,17 +251,13 @@ class Environment(object):
                 print s_msg.format(s_name)
 
         # Initialize agent(s)
+        self.agent_states.reset()
         for agent in self.agent_states.iterkeys():
-            self.agent_states[agent] = {'qBid': 0,
-                                        'Bid': 0.,
-                                        'Ask': 0.,
-                                        'qAsk': 0,
-                                        'Position': 0,
-                                        'Pnl': 0,
-                                        'Agent': agent,
-                                        'best_bid': False,
-                                        'best_offer': False}
             agent.reset()
+        for recorder in self.d_recorders.itervalues():
+            recorder.i_size = 0
+        if self.background:
+            self.background.reset()
 
     def step(self):
         '''
@@ -216,22 +269,33 @@ class Environment(object):
         l_msg_aux = []
         # update the agents
         for msg in l_msg:
-            agent_aux = self.agent_states[msg['agent_id']]['Agent']
+            agent_aux = self.agent_states.get_agent(msg['agent_id'])
             self.update_agent_state(agent=agent_aux, msg=msg)
+        # notify the owners of the orders canceled by the book itself
+        for msg in self.order_matching.my_book.pop_canceled():
+            if msg['agent_id'] not in self.agent_states:
+                continue
+            agent_aux = self.agent_states.get_agent(msg['agent_id'])
+            if msg['order_id'] in agent_aux.d_order_map:
+                agent_aux.act(msg)
+        # ensure that the market is opened
+        # TODO: modify this line
+        b_are_there_orders = True
+        if self.order_matching.my_book.book_ask.price_tree.count == 0:
+            b_are_there_orders = False
+        if self.order_matching.my_book.book_bid.price_tree.count == 0:
+            b_are_there_orders = False
+        b_market_open = self.order_matching.last_date >= (10*60**2 + 30 * 60)
+        b_market_open = b_market_open and b_are_there_orders
+        # check if should update the background agents
+        if self.background and b_market_open:
+            if self.background.should_update():
+                self.background.step()
         # check if should update the primary
-        if self.primary_agent:
-            # ensure that the market is opened
-            # TODO: modify this line
-            b_are_there_orders = True
-            if self.order_matching.my_book.book_ask.price_tree.count == 0:
-                b_are_there_orders = False
-            if self.order_matching.my_book.book_bid.price_tree.count == 0:
-                b_are_there_orders = False
-            if self.order_matching.last_date >= (10*60**2 + 30 * 60):
-                if b_are_there_orders:
-                    if self.primary_agent.should_update():
-                        self.update_agent_state(agent=self.primary_agent,
-                                                msg=None)
+        if self.primary_agent and b_market_open:
+            if self.primary_agent.should_update():
+                self.update_agent_state(agent=self.primary_agent,
+                                        msg=None)
         # check if the market is closed
         if self.order_matching.last_date >= (16*60**2 + 30 * 60):
             self.done = True
@@ -255,39 +319,35 @@ class Environment(object):
         assert agent in self.agent_states, 'Unknown agent!'
 
         state = self.agent_states[agent]
-        # total traded in the last 10 seconds
-        i_traded_qty = self.order_matching.i_qty_traded_at_bid
-        i_traded_qty += self.order_matching.i_qty_traded_at_ask
-        i_traded_qty -= self.order_matching.i_qty_traded_at_bid_10s
-        i_traded_qty -= self.order_matching.i_qty_traded_at_ask_10s
-        # total aggressed in 10 seconds
-        i_aggr_qty = self.order_matching.i_qty_traded_at_bid
-        i_aggr_qty -= self.order_matching.i_qty_traded_at_bid_10s
-        i_aggr_qty -= self.order_matching.i_qty_traded_at_ask
-        i_aggr_qty += self.order_matching.i_qty_traded_at_ask_10s
-        # ofi in 10 seconds
-        i_ofi = self.order_matching.i_ofi
-        i_ofi -= self.order_matching.i_ofi_10s
+        obj_rolling = self.order_matching.rolling
+        na_values = obj_rolling.na_values
         # price related inputs
         f_mid = self.order_matching.best_ask[0]
         i_spread = (f_mid - self.order_matching.best_bid[0]) / 0.01
         i_spread = int(np.around(i_spread, 0))  # 0.01 is the minimum tick size
         f_mid += self.order_matching.best_bid[0]
         f_mid /= 2.
-        f_mid_change = f_mid - self.order_matching.mid_price_10s
-        f_log_ret = 0.
-        if self.order_matching.mid_price_10s != 0.:
-            f_log_ret = np.log(f_mid/self.order_matching.mid_price_10s)
-
-        d_rtn = {'qOfi': i_ofi,
-                 'qAggr': i_aggr_qty,
-                 'qTraded': i_traded_qty,
-                 'spread': i_spread,
+
+        d_rtn = {'spread': i_spread,
                  'qBid': self.order_matching.best_bid[1],
                  'qAsk': self.order_matching.best_ask[1],
-                 'midPrice': np.around(f_mid, 2),
-                 'deltaMid': f_mid_change,
-                 'logret': f_log_ret}
+                 'midPrice': np.around(f_mid, 2)}
+        # total traded, aggressed and ofi in each rolling window
+        l_keys = obj_rolling.l_keys
+        for i_win in xrange(len(obj_rolling.l_windows)):
+            f_bid = na_values[i_win, rolling.TRADED_BID]
+            f_ask = na_values[i_win, rolling.TRADED_ASK]
+            d_rtn[l_keys[4 * i_win]] = na_values[i_win, rolling.OFI]
+            d_rtn[l_keys[4 * i_win + 1]] = f_bid - f_ask
+            d_rtn[l_keys[4 * i_win + 2]] = f_bid + f_ask
+            d_rtn[l_keys[4 * i_win + 3]] = na_values[i_win, rolling.LOG_RET]
+        # the main inputs use the window chosen by the order matching
+        i_win = obj_rolling.d_window_idx[self.order_matching.i_sense_window]
+        d_rtn['qOfi'] = d_rtn[l_keys[4 * i_win]]
+        d_rtn['qAggr'] = d_rtn[l_keys[4 * i_win + 1]]
+        d_rtn['qTraded'] = d_rtn[l_keys[4 * i_win + 2]]
+        d_rtn['deltaMid'] = na_values[i_win, rolling.DELTA_MID]
+        d_rtn['logret'] = d_rtn[l_keys[4 * i_win + 3]]
 
         return d_rtn
 
@@ -328,9 +388,11 @@ class Environment(object):
             state['best_offer'] = True
 
         # calculate the current PnL
-        sense = self.sense(agent)
+        f_mid = self.order_matching.best_ask[0]
+        f_mid += self.order_matching.best_bid[0]
+        f_mid = np.around(f_mid / 2., 2)
         f_pnl = state['Ask'] - state['Bid']
-        f_pnl += state['Position'] * sense['midPrice']
+        f_pnl += state['Position'] * f_mid
         # include costs
         f_pnl -= ((state['Ask'] + state['Bid']) * 0.00035)
         # measure the reward
@@ -340,6 +402,17 @@ class Environment(object):
         # substitute the last pnl by the current value
         state['Pnl'] = f_pnl
 
+        # keep the series of the agent, if it is recorded
+        recorder = self.d_recorders.get(agent.i_id)
+        if recorder is not None:
+            recorder.append(self.order_matching.last_date,
+                            state['Position'],
+                            state['Bid'],
+                            state['Ask'],
+                            f_mid,
+                            f_pnl,
+                            reward)
+
         # NOTE: I could include a stop loss here
 
         return reward
@@ -352,12 +425,13 @@ class Environment(object):
         :param msg: dict. Order matching message
         '''
         # hold current information about position
-        assert agent in self.agent_states, 'Unknown agent!'
+        i_slot = self.agent_states.slot(agent)
+        d_columns = self.agent_states.d_columns
         for s_key in ['qBid', 'Bid', 'Ask', 'qAsk']:
-            self.agent_states[agent][s_key] = agent[s_key]
-        qBid = self.agent_states[agent]['qBid']
-        qAsk = self.agent_states[agent]['qAsk']
-        self.agent_states[agent]['Position'] = qBid - qAsk
+            d_columns[s_key][i_slot] = agent[s_key]
+        qBid = d_columns['qBid'][i_slot]
+        qAsk = d_columns['qAsk'][i_slot]
+        d_columns['Position'][i_slot] = qBid - qAsk
         # execute new action that can change current position
         agent.update(msg_env=msg)
 
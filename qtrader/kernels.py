@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement the tight numeric loops used over whole files (the order flow
+imbalance of a series of best quotes and its sums over rolling windows) as
+plain functions over scalars and NumPy arrays. When numba is installed they
+are compiled in the first call, otherwise the same Python code is used. The
+pure Python versions stay available with the prefix py_ to check both paths
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import types
+import numpy as np
+
+# the kernels already compiled, by name
+d_kernels = {}
+
+# the kernels called by each kernel
+d_calls = {'accumulate_ofi': ['e_n']}
+
+
+'''
+Begin help functions
+'''
+
+
+def py_e_n(f_price, f_qty, f_last_price, f_last_qty, b_bid):
+    '''
+    Return the contribution of a change of the best level of a side to the
+    order flow imbalance. It is zero when the level has not changed
+    :param f_price: float. The current best price of the side
+    :param f_qty: float. The quantity at the current best price
+    :param f_last_price: float. The last best price of the side
+    :param f_last_qty: float. The quantity at the last best price
+    :param b_bid: boolean. If it is the bid side
+    '''
+    f_en = 0.
+    if b_bid:
+        if f_price >= f_last_price:
+            f_en += f_qty
+        if f_price <= f_last_price:
+            f_en -= f_last_qty
+    else:
+        if f_price <= f_last_price:
+            f_en -= f_qty
+        if f_price >= f_last_price:
+            f_en += f_last_qty
+    return f_en
+
+
+def py_accumulate_ofi(na_bid, na_bid_qty, na_ask, na_ask_qty):
+    '''
+    Return the cumulative order flow imbalance after each best quote of the
+    arrays passed, starting from zero at the first one
+    :param na_bid: numpy array. The best bid prices
+    :param na_bid_qty: numpy array. The quantities at the best bid
+    :param na_ask: numpy array. The best ask prices
+    :param na_ask_qty: numpy array. The quantities at the best ask
+    '''
+    i_n = na_bid.shape[0]
+    na_ofi = np.zeros(i_n)
+    f_ofi = 0.
+    for i in range(1, i_n):
+        f_ofi += py_e_n(na_bid[i], na_bid_qty[i], na_bid[i - 1],
+                        na_bid_qty[i - 1], True)
+        f_ofi += py_e_n(na_ask[i], na_ask_qty[i], na_ask[i - 1],
+                        na_ask_qty[i - 1], False)
+        na_ofi[i] = f_ofi
+    return na_ofi
+
+
+def py_rolling_sum(na_time, na_cum, i_window):
+    '''
+    Return the change of a cumulative measure over a window ending at each
+    entry. Entries whose window starts before the first one use zero as base
+    :param na_time: numpy array. The times, in increasing order
+    :param na_cum: numpy array. The cumulative measure at each time
+    :param i_window: integer. The length of the window, in the unit of time
+    '''
+    i_n = na_time.shape[0]
+    na_out = np.zeros(i_n)
+    i_ptr = -1
+    for i in range(i_n):
+        i_start = na_time[i] - i_window
+        while i_ptr < i and na_time[i_ptr + 1] <= i_start:
+            i_ptr += 1
+        if i_ptr < 0:
+            na_out[i] = na_cum[i]
+        else:
+            na_out[i] = na_cum[i] - na_cum[i_ptr]
+    return na_out
+
+
+'''
+End help functions
+'''
+
+
+def get_kernel(s_name):
+    '''
+    Return the compiled version of the kernel passed, when numba is
+    installed, or its pure Python version. A compiled function can only call
+    other compiled functions, so the kernels it calls are replaced by their
+    compiled versions in a copy of it. numba is imported only here, as it
+    takes a while to load
+    :param s_name: string. The name of the kernel, without the prefix py_
+    '''
+    if s_name in d_kernels:
+        return d_kernels[s_name]
+    func = globals()['py_' + s_name]
+    try:
+        import numba
+    except ImportError:
+        d_kernels[s_name] = func
+        return func
+    l_calls = d_calls.get(s_name, [])
+    if l_calls:
+        d_globals = dict(func.__globals__)
+        for s_call in l_calls:
+            d_globals['py_' + s_call] = get_kernel(s_call)
+        func = types.FunctionType(func.__code__, d_globals, s_name)
+    d_kernels[s_name] = numba.njit(cache=True)(func)
+    return d_kernels[s_name]
+
+
+def accumulate_ofi(na_bid, na_bid_qty, na_ask, na_ask_qty):
+    '''
+    Return the cumulative order flow imbalance after each best quote. See
+    py_accumulate_ofi()
+    :param na_bid: numpy array. The best bid prices
+    :param na_bid_qty: numpy array. The quantities at the best bid
+    :param na_ask: numpy array. The best ask prices
+    :param na_ask_qty: numpy array. The quantities at the best ask
+    '''
+    return get_kernel('accumulate_ofi')(na_bid, na_bid_qty, na_ask,
+                                        na_ask_qty)
+
+
+def rolling_sum(na_time, na_cum, i_window):
+    '''
+    Return the change of a cumulative measure over a window ending at each
+    entry. See py_rolling_sum()
+    :param na_time: numpy array. The times, in increasing order
+    :param na_cum: numpy array. The cumulative measure at each time
+    :param i_window: integer. The length of the window, in the unit of time
+    '''
+    return get_kernel('rolling_sum')(na_time, na_cum, i_window)
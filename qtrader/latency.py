@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Capture the latency of each stage of the decisions of the agents in
+log-linear histograms (in the style of HdrHistogram), so the tails can be
+tracked with a small and fixed overhead per decision
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import logging
+import timeit
+import numpy as np
+
+# global variable
+DEBUG = True
+
+clock = timeit.default_timer
+
+'''
+Begin help functions
+'''
+
+
+def bucket_index(i_value, i_sub_bits):
+    '''
+    Return the bucket of a non-negative integer. Values smaller than
+    2 ** i_sub_bits have their own bucket, the others share a bucket with the
+    values with the same i_sub_bits most significant bits
+    :param i_value: integer. The value to be recorded
+    :param i_sub_bits: integer. Number of significant bits kept
+    '''
+    i_exp = i_value.bit_length() - i_sub_bits
+    if i_exp <= 0:
+        return i_value
+    return (i_exp << i_sub_bits) + (i_value >> i_exp)
+
+
+def bucket_value(i_idx, i_sub_bits):
+    '''
+    Return the value in the middle of the bucket passed
+    :param i_idx: integer. The index of the bucket
+    :param i_sub_bits: integer. Number of significant bits kept
+    '''
+    i_exp = i_idx >> i_sub_bits
+    i_mant = i_idx & ((1 << i_sub_bits) - 1)
+    if i_exp == 0:
+        return float(i_mant)
+    return ((i_mant << i_exp) + ((1 << i_exp) - 1) / 2.)
+
+
+'''
+End help functions
+'''
+
+
+class LatencyHistogram(object):
+    '''
+    A histogram of latencies in nanoseconds with buckets growing with the
+    value, keeping a relative precision of 2 ** -i_sub_bits
+    '''
+
+    def __init__(self, i_sub_bits=7, i_max_bits=44):
+        '''
+        Initialize a LatencyHistogram object. Save all parameters as
+        attributes
+        :*param i_sub_bits: integer. Number of significant bits kept
+        :*param i_max_bits: integer. Bits of the largest value recorded
+        '''
+        self.i_sub_bits = i_sub_bits
+        self.i_max_value = (1 << i_max_bits) - 1
+        i_nbuckets = bucket_index(self.i_max_value, i_sub_bits) + 1
+        self.na_counts = np.zeros(i_nbuckets, dtype=np.int64)
+        self.i_count = 0
+        self.i_max = 0
+
+    def record(self, f_seconds):
+        '''
+        Include a latency in the histogram
+        :param f_seconds: float. The latency in seconds
+        '''
+        i_value = min(max(int(f_seconds * 1e9), 0), self.i_max_value)
+        self.na_counts[bucket_index(i_value, self.i_sub_bits)] += 1
+        self.i_count += 1
+        if i_value > self.i_max:
+            self.i_max = i_value
+
+    def percentile(self, f_pct):
+        '''
+        Return the latency in seconds below which f_pct percent of the values
+        recorded are
+        :param f_pct: float. The percentile desired, from 0 to 100
+        '''
+        if not self.i_count:
+            return 0.
+        i_rank = max(int(np.ceil(f_pct / 100. * self.i_count)), 1)
+        i_idx = np.searchsorted(np.cumsum(self.na_counts), i_rank)
+        f_value = min(bucket_value(i_idx, self.i_sub_bits), self.i_max)
+        return f_value / 1e9
+
+    def merge(self, other):
+        '''
+        Include the values recorded by other histogram
+        :param other: LatencyHistogram object. A histogram with the same setup
+        '''
+        self.na_counts += other.na_counts
+        self.i_count += other.i_count
+        self.i_max = max(self.i_max, other.i_max)
+
+    def reset(self):
+        '''
+        Clear the values recorded
+        '''
+        self.na_counts[:] = 0
+        self.i_count = 0
+        self.i_max = 0
+
+
+class LatencyTracker(object):
+    '''
+    Keep a LatencyHistogram for each agent class and stage of its decisions
+    '''
+    l_percentiles = [50., 99., 99.9]
+
+    def __init__(self):
+        '''
+        Initialize a LatencyTracker object
+        '''
+        self.b_enabled = True
+        self.d_hist = {}
+        self.l_reports = []
+
+    def histogram(self, s_agent, s_stage):
+        '''
+        Return the histogram of the stage of the agent class passed
+        :param s_agent: string. The name of the agent class
+        :param s_stage: string. The name of the stage
+        '''
+        t_key = (s_agent, s_stage)
+        if t_key not in self.d_hist:
+            self.d_hist[t_key] = LatencyHistogram()
+        return self.d_hist[t_key]
+
+    def record_stages(self, s_agent, l_stages, l_times):
+        '''
+        Record the latency of consecutive stages of a decision. The last stage
+        should be the total and gets the whole interval
+        :param s_agent: string. The name of the agent class
+        :param l_stages: list. The names of the stages
+        :param l_times: list. Clock readings, one more than the stages
+        '''
+        for i_stage, s_stage in enumerate(l_stages[:-1]):
+            f_elapsed = l_times[i_stage + 1] - l_times[i_stage]
+            self.histogram(s_agent, s_stage).record(f_elapsed)
+        f_total = l_times[-1] - l_times[0]
+        self.histogram(s_agent, l_stages[-1]).record(f_total)
+
+    def report(self):
+        '''
+        Return a list of dictionaries with the count and the percentiles in
+        microseconds of each agent class and stage
+        '''
+        l_rtn = []
+        for (s_agent, s_stage), hist in sorted(self.d_hist.iteritems()):
+            if not hist.i_count:
+                continue
+            d_row = {'agent': s_agent, 'stage': s_stage,
+                     'count': hist.i_count, 'max_us': hist.i_max / 1e3}
+            for f_pct in self.l_percentiles:
+                s_key = 'p{}_us'.format(('%g' % f_pct).replace('.', ''))
+                d_row[s_key] = hist.percentile(f_pct) * 1e6
+            l_rtn.append(d_row)
+        return l_rtn
+
+    def end_trial(self):
+        '''
+        Log the percentiles of the trial, keep them and clear the histograms
+        '''
+        l_report = self.report()
+        if not l_report:
+            return
+        self.l_reports.append(l_report)
+        s_msg = 'LatencyTracker.end_trial(): Decision latencies (us):'
+        s_row = '\n    {agent}.{stage}: n = {count}, p50 = {p50_us:0.1f}'
+        s_row += ', p99 = {p99_us:0.1f}, p99.9 = {p999_us:0.1f}'
+        s_row += ', max = {max_us:0.1f}'
+        for d_row in l_report:
+            s_msg += s_row.format(**d_row)
+        if DEBUG:
+            logging.info(s_msg)
+        else:
+            print s_msg
+        for hist in self.d_hist.itervalues():
+            hist.reset()
+
+    def export(self):
+        '''
+        Return a dictionary with the bucket counts of each histogram and the
+        reports of the trials already ended
+        '''
+        d_hist = {}
+        for (s_agent, s_stage), hist in self.d_hist.iteritems():
+            na_idx = np.flatnonzero(hist.na_counts)
+            d_hist['{}.{}'.format(s_agent, s_stage)] = {
+                'sub_bits': hist.i_sub_bits,
+                'buckets': na_idx.tolist(),
+                'counts': hist.na_counts[na_idx].tolist()}
+        return {'histograms': d_hist, 'trials': self.l_reports}
+
+
+# the tracker used by the agents of the process
+tracker = LatencyTracker()
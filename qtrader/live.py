@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a live-replay mode. A local socket server replays the files of the
+archive pacing the rows by their timestamps (at 1x, 10x or at maximum speed)
+and the order matching consumes them from the socket, so the time spent by
+the environment and the agents can be compared to real-time latency budgets
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import csv
+import logging
+import Queue
+import socket
+import SocketServer
+import threading
+import time
+import zipfile
+import numpy as np
+
+import pipeline
+
+# global variable
+DEBUG = True
+
+'''
+Begin help functions
+'''
+
+
+class _ReplayHandler(SocketServer.StreamRequestHandler):
+    '''
+    Read the name of a file from the client and replay it, line by line,
+    respecting the speed of the server
+    '''
+
+    def handle(self):
+        '''
+        Replay the file requested by the client
+        '''
+        s_member = self.rfile.readline().strip()
+        f_speed = self.server.f_speed
+        with zipfile.ZipFile(self.server.s_fname, 'r') as archive:
+            fr = archive.open(s_member)
+            s_header = fr.readline()
+            self.wfile.write(s_header)
+            l_header = csv.reader([s_header]).next()
+            if 'Date' not in l_header:
+                # there is no way to pace the rows
+                f_speed = None
+            else:
+                i_date = l_header.index('Date')
+            f_wall_start = None
+            parse_time = pipeline.TimeParser()
+            for s_line in fr:
+                if f_speed:
+                    s_date = csv.reader([s_line]).next()[i_date]
+                    i_time = parse_time(s_date)
+                    if f_wall_start is None:
+                        f_wall_start = time.time()
+                        i_first = i_time
+                    f_wait = (i_time - i_first) / f_speed
+                    f_wait /= pipeline.US_PER_SECOND
+                    f_wait -= time.time() - f_wall_start
+                    if f_wait > 0:
+                        time.sleep(f_wait)
+                try:
+                    self.wfile.write(s_line)
+                except socket.error:
+                    # the client has gone
+                    return
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+'''
+End help functions
+'''
+
+
+class ReplayServer(object):
+    '''
+    A local stand-in of a market data feed, replaying the files of a zip
+    archive through a TCP or a Unix socket
+    '''
+
+    def __init__(self, s_fname, f_speed=1., address=('127.0.0.1', 0)):
+        '''
+        Initialize a ReplayServer object. Save all parameters as attributes
+        :param s_fname: string. the container zip file to be replayed
+        :*param f_speed: float. Multiple of the real time to replay the files.
+            None to send the rows as fast as possible
+        :*param address: tuple or string. (host, port) of a TCP socket or the
+            path of a Unix socket
+        '''
+        if isinstance(address, basestring):
+            self.server = _UnixServer(address, _ReplayHandler)
+        else:
+            self.server = _TCPServer(address, _ReplayHandler)
+        self.server.s_fname = s_fname
+        self.server.f_speed = f_speed
+        self.address = self.server.server_address
+        self.thread = None
+
+    def start(self):
+        '''
+        Start serving in a background thread. Return the address used
+        '''
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        '''
+        Stop the server
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SocketSource(object):
+    '''
+    Callable used by the order matching in place of the archive to get the
+    rows of a file. Keep the time when the last row has arrived. The socket
+    is read by a separate thread, so the rows are taken from the socket as
+    they arrive even when the agents fall behind, and the time waited in the
+    queue is part of the latency
+    '''
+
+    def __init__(self, address):
+        '''
+        Initialize a SocketSource object. Save all parameters as attributes
+        :param address: tuple or string. The address of a ReplayServer
+        '''
+        self.address = address
+        self.f_last_arrival = None
+
+    def __call__(self, s_member):
+        '''
+        Return a generator of the rows of the file replayed by the server
+        :param s_member: string. the name of the file inside the archive
+        '''
+        if isinstance(self.address, basestring):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect(self.address)
+        sock.sendall(s_member + '\n')
+        return self._read(sock)
+
+    def _receive(self, sock, queue):
+        '''
+        Put in the queue each line received with the time it arrived, until
+        the end of the file or until the socket is shut down
+        :param sock: socket object. The connection to the server
+        :param queue: Queue object. Where the lines are put
+        '''
+        fr = sock.makefile('r')
+        try:
+            for s_line in fr:
+                queue.put((time.time(), s_line))
+        except socket.error:
+            pass
+        finally:
+            queue.put(None)
+            fr.close()
+
+    def _lines(self, queue):
+        '''
+        Yield the lines received, keeping when the last one arrived
+        :param queue: Queue object. The lines put by _receive()
+        '''
+        while True:
+            t_item = queue.get()
+            if t_item is None:
+                return
+            self.f_last_arrival, s_line = t_item
+            yield s_line
+
+    def _read(self, sock):
+        '''
+        Yield the rows received. The last line read by the csv reader is the
+        one of the row yielded, so f_last_arrival is the time it arrived
+        :param sock: socket object. The connection to the server
+        '''
+        queue = Queue.Queue()
+        receiver = threading.Thread(target=self._receive, args=(sock, queue))
+        receiver.daemon = True
+        receiver.start()
+        try:
+            for row in csv.DictReader(self._lines(queue)):
+                yield row
+        finally:
+            # wake up the receiver, when the session ends before the file
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+
+
+class LatencyMonitor(object):
+    '''
+    Measure the time between the arrival of each row and the end of its
+    processing by the environment, comparing it to a latency budget
+    '''
+
+    def __init__(self, f_budget=1e-3):
+        '''
+        Initialize a LatencyMonitor object. Save all parameters as attributes
+        :*param f_budget: float. The latency budget in seconds
+        '''
+        self.f_budget = f_budget
+        self.l_latency = []
+        self.l_step = []
+
+    def record(self, f_arrival, f_start, f_end):
+        '''
+        Keep the latency of a step
+        :param f_arrival: float. When the row arrived from the socket
+        :param f_start: float. When the environment started the step
+        :param f_end: float. When the environment finished the step
+        '''
+        self.l_step.append(f_end - f_start)
+        if f_arrival is not None:
+            self.l_latency.append(f_end - f_arrival)
+
+    def report(self):
+        '''
+        Return a dictionary with the percentiles of the latencies and the
+        fraction of the steps over the budget
+        '''
+        d_rtn = {'n_steps': len(self.l_step), 'budget': self.f_budget}
+        for s_name, l_values in [('latency', self.l_latency),
+                                 ('step', self.l_step)]:
+            if not l_values:
+                continue
+            na_aux = np.array(l_values)
+            for f_pct in [50., 99., 99.9]:
+                s_key = '{}_p{}'.format(s_name, f_pct).replace('.0', '')
+                d_rtn[s_key] = np.percentile(na_aux, f_pct)
+            d_rtn['{}_over_budget'.format(s_name)] = \
+                (na_aux > self.f_budget).mean()
+        return d_rtn
+
+
+def run_live(sim, f_speed=1., address=('127.0.0.1', 0), n_sessions=1,
+             f_budget=1e-3):
+    '''
+    Replay the sessions through a local socket server and return the report
+    of the latencies measured
+    :param sim: Simulator object. The simulator with the agents set up
+    :*param f_speed: float. Multiple of the real time. None for max speed
+    :*param address: tuple or string. The address used by the server
+    :*param n_sessions: integer. Number of files to replay
+    :*param f_budget: float. The latency budget in seconds
+    '''
+    server = ReplayServer(sim.env.order_matching.s_fname, f_speed, address)
+    obj_source = SocketSource(server.start())
+    monitor = LatencyMonitor(f_budget)
+    my_ordmatch = sim.env.order_matching
+    my_ordmatch.live_source = obj_source
+    try:
+        sim.env.reset_order_matching_idx()
+        for i_sess in xrange(n_sessions):
+            sim.env.reset()
+            while True:
+                f_start = time.time()
+                try:
+                    sim.env.step()
+                except StopIteration:
+                    break
+                monitor.record(obj_source.f_last_arrival, f_start,
+                               time.time())
+                if sim.env.done:
+                    break
+    finally:
+        my_ordmatch.live_source = None
+        server.stop()
+    d_report = monitor.report()
+    s_msg = 'run_live(): latencies measured at {}x: {}'
+    s_msg = s_msg.format(f_speed or 'max', d_report)
+    if DEBUG:
+        logging.info(s_msg)
+    else:
+        print s_msg
+    return d_report
@@ -8,11 +8,13 @@ in the environment
 
 Created on 08/19/2016
 """
+from collections import defaultdict
 import random
 import logging
 import zipfile
-import csv
 import book
+import pipeline
+import rolling
 import pprint
 from translators import translate_trades, translate_row
 
@@ -100,21 +102,29 @@ class BloombergMatching(OrderMatching):
         self.idx = 0.
         self.i_nrow = 0.
         self.s_time = ''
-        self.last_date = 0
+        self.last_date = 0  # seconds since midnight
+        self.i_time_us = 0  # microseconds since midnight
         self.best_bid = (0, 0)
         self.best_ask = (0, 0)
         self.obj_best_bid = None
         self.obj_best_ask = None
         self.i_ofi = 0
-        self.i_ofi_10s = 0
-        self.i_qty_traded_at_bid_10s = 0
-        self.i_qty_traded_at_ask_10s = 0
         self.i_qty_traded_at_bid = 0
         self.i_qty_traded_at_ask = 0
-        self.mid_price_10s = 0.
-        self.b_get_new_row = True
-        self.f_last_bucket = 0.
-        self.f_seconds_to_group = 21.
+        # rolling sums of the order flow measures. The window of i_sense_window
+        # seconds is the one used by the inputs of the agents
+        self.rolling = rolling.RollingWindows(l_windows=(1, 10, 60))
+        self.i_sense_window = 10
+        self.row = None
+        self.stream = None
+        self.b_print = False
+        self.live_source = None  # callable returning the rows of a file
+        self.s_member = None  # the file being replayed
+        # number of times the book was crossed and of the trades used to
+        # uncross it, by file. Each file is counted from its last replay
+        self.d_cross_events = defaultdict(int)
+        self.d_cross_rounds = defaultdict(int)
+        self.l_stages = list(pipeline.l_default_stages)
         if i_idx:
             self.idx = i_idx
 
@@ -143,19 +153,16 @@ class BloombergMatching(OrderMatching):
         if self.i_nrow != 0:
             self.i_nrow = 0
             self.idx += 1
-            self.i_qty_traded_at_bid_10s = 0
-            self.i_qty_traded_at_ask_10s = 0
             self.i_qty_traded_at_bid = 0
             self.i_qty_traded_at_ask = 0
-            self.i_ofi_10s = 0
             self.i_ofi = 0
             self.last_date = 0
+            self.i_time_us = 0
             self.best_bid = (0, 0)
             self.best_ask = (0, 0)
             self.obj_best_bid = None
             self.obj_best_ask = None
-            self.mid_price_10s = 0.
-            self.f_last_bucket = 0.
+            self.rolling.reset()
 
     def update(self, l_msg, b_print=False):
         '''
@@ -163,6 +170,16 @@ class BloombergMatching(OrderMatching):
         :param l_msg: list. messages to use to update the book
         :*param b_print: boolean. If should print the messaged generated
         '''
+        self.apply_messages(l_msg, b_print=b_print)
+        self.update_features()
+
+    def apply_messages(self, l_msg, b_print=False):
+        '''
+        Update the Book with the messages passed and account the quantities
+        traded by the aggressors
+        :param l_msg: list. messages to use to update the book
+        :*param b_print: boolean. If should print the messaged generated
+        '''
         if l_msg:
             # process each message generated by translator
             for msg in l_msg:
@@ -180,6 +197,60 @@ class BloombergMatching(OrderMatching):
                         self.i_qty_traded_at_ask += msg['order_qty']
                     else:
                         self.i_qty_traded_at_bid += msg['order_qty']
+
+    def is_crossed(self):
+        '''
+        Return if the best bid is equal or greater than the best offer
+        '''
+        f_bid = self.best_bid[0]
+        f_ask = self.best_ask[0]
+        if f_bid < f_ask or f_bid == 0 or f_ask == 0:
+            return False
+        my_book = self.my_book
+        if my_book.book_bid.price_tree.count == 0:
+            return False
+        return my_book.book_ask.price_tree.count > 0
+
+    def resolve_cross(self, row):
+        '''
+        Trade the crossed quantities against both best levels until the book
+        is not crossed anymore. The trades are applied to the book as they are
+        generated. Return all the messages in a single list
+        :param row: dict. The row that found the book crossed
+        '''
+        l_fills = []
+        d_trade = {'': row[''], 'Type': 'TRADE', 'Price': 0., 'Size': 0.}
+        while self.is_crossed():
+            f_qty = float(min(self.best_ask[1], self.best_bid[1]))
+            if f_qty % 100 != 0:
+                break
+            d_trade['Size'] = f_qty
+            l_msg = translate_trades(self.i_nrow, d_trade, self, 'ASK')
+            l_msg += translate_trades(self.i_nrow, d_trade, self, 'BID')
+            if not l_msg:
+                break
+            self.apply_messages(l_msg, b_print=self.b_print)
+            self.update_best_prices()
+            l_fills += l_msg
+            self.d_cross_rounds[self.s_member] += 1
+        if l_fills:
+            self.d_cross_events[self.s_member] += 1
+        return l_fills
+
+    def get_cross_stats(self):
+        '''
+        Return a dictionary with the number of times the book was crossed and
+        of the trades used to uncross it by file, in the last replay of each
+        '''
+        return dict((s_key, {'events': i_events,
+                             'rounds': self.d_cross_rounds[s_key]})
+                    for s_key, i_events in self.d_cross_events.iteritems())
+
+    def update_best_prices(self):
+        '''
+        Update the best prices and the order flow imbalance from the current
+        state of the Book
+        '''
         # keep the best- bid and offer in a variable
         i_bid_count = self.my_book.book_bid.price_tree.count
         i_ask_count = self.my_book.book_ask.price_tree.count
@@ -208,20 +279,36 @@ class BloombergMatching(OrderMatching):
             self.i_ofi += f_en
             self.best_bid = best_bid
             self.best_ask = best_ask
-        # hold some variables from the start of 10s fold
-        if self.last_date % self.f_seconds_to_group == 0 and \
-           self.f_last_bucket != self.last_date:
-            self.f_last_bucket = self.last_date + 1 - 1
-            self.i_ofi_10s = self.i_ofi
-            self.i_ofi_10s += 1 - 1
-            self.i_qty_traded_at_bid_10s = self.i_qty_traded_at_bid
-            self.i_qty_traded_at_bid_10s += 1 - 1  # it is ugly
-            self.i_qty_traded_at_ask_10s = self.i_qty_traded_at_ask
-            self.i_qty_traded_at_ask_10s += 1 - 1
-            self.mid_price_10s = (self.best_bid[0] + self.best_ask[0])/2.
+
+    def update_features(self):
+        '''
+        Update the best prices and the order flow measures from the current
+        state of the Book
+        '''
+        self.update_best_prices()
+        # update the rolling windows when there are prices in both sides
+        if self.best_bid[0] != 0 and self.best_ask[0] != 0:
+            self.rolling.update(self.i_time_us,
+                                self.i_ofi,
+                                self.i_qty_traded_at_bid,
+                                self.i_qty_traded_at_ask,
+                                (self.best_bid[0] + self.best_ask[0]) / 2.)
         # terminate
         self.i_nrow += 1
 
+    def build_stream(self, s_member):
+        '''
+        Return the iterator of the messages of the file passed, composing the
+        stages of the pipeline. The rows are read from the live source, when
+        it is set, or from the archive
+        :param s_member: string. The name of the file inside the archive
+        '''
+        if self.live_source is not None:
+            stream = self.live_source(s_member)
+        else:
+            stream = pipeline.source(self.archive.open(s_member))
+        return pipeline.compose(stream, self.l_stages, self)
+
     def next(self, b_print=False):
         '''
         Return a list of messages from the agents related to the current step
@@ -234,83 +321,37 @@ class BloombergMatching(OrderMatching):
             raise StopIteration
         # if it is the first line of the file, open it and cerate a new book
         if self.i_nrow == 0:
-            s_fname = self.l_fnames[int(self.idx)]
-            self.fr_open = csv.DictReader(self.archive.open(s_fname))
+            s_fname = self.l_fnames[int(self.idx)].filename
             self.my_book = book.LimitOrderBook(self.s_instrument)
-        # try to read a row of an already opened file
+            self.s_member = s_fname
+            self.d_cross_events.pop(s_fname, None)
+            self.d_cross_rounds.pop(s_fname, None)
+            self.stream = self.build_stream(s_fname)
+        # pull the next event of the file through all stages
         try:
-            # check if should get a new row form the file
-            l_msg = []
-            if self.b_get_new_row:
-                row = self.fr_open.next()
-                self.row = row
-            else:
-                row = self.row
-                self.b_get_new_row = True
-                # [debug] start PRINT BOOKS WHEN THE BID-ASK CROSSED
-                # print 'corrected'
-                # print self.my_book.get_n_top_prices(5)
-                # print ''
-                # [debug] end PRINT BOOKS WHEN THE BID-ASK CROSSED
-            # check if the prices have crossed themselfs
-            b_test = True
-            # make sure that there are prices in the both sides
-            if int(self.row['']) <= 5:
-                b_test = False
-            if self.my_book.book_ask.price_tree.count == 0:
-                b_test = False
-            if self.my_book.book_bid.price_tree.count == 0:
-                b_test = False
-            i_idrow = int(self.row[''])
-            if self.best_bid[0] != 0 and self.best_ask[0] != 0 and b_test:
-                if self.best_bid[0] >= self.best_ask[0]:
-                    # set to not get a new row before correct that
-                    self.b_get_new_row = False
-                    row_aux = row.copy()
-                    row_aux['Type'] = 'TRADE'
-                    row_aux['Size'] = min(self.best_ask[1], self.best_bid[1])
-                    # determine a trade to this round
-                    row = row_aux.copy()
-                    # reshape the row to messages to order book
-                    row['Price'] = self.best_bid[0]
-                    l_msg_aux = self.reshape_row(self.i_nrow, row, 'BID')
-                    row['Price'] = self.best_ask[0]
-                    l_msg = self.reshape_row(self.i_nrow, row, 'ASK')
-                    l_msg += l_msg_aux
-                    # [debug] start PRINT BOOKS WHEN THE BID-ASK CROSSED
-                    # print 'id: {}, date: {}'.format(self.row[''],
-                    #                                 self.row['Date'])
-                    # # pprint.pprint(l_msg)
-                    # print self.my_book.get_n_top_prices(5)
-                    # print ''
-                    # [debug] end PRINT BOOKS WHEN THE BID-ASK CROSSED
-                # check if should update the primary agent
-                if len(l_msg) == 0:  # just pass here if there is no trade
-                    pass
-            # reshape the row to messages to order book when it wasnt yet
-            if len(l_msg) == 0:
-                # reshape the row to messages to order book
-                l_msg = self.reshape_row(self.i_nrow, row)
-            # measure the time in seconds
-            l_aux = row['Date'].split(' ')[1].split(':')
-            i_aux = sum([int(a)*60**b for a, b in zip(l_aux, [2, 1, 0])])
-            self.last_date = i_aux
-            # update the book
-            self.update(l_msg, b_print=b_print)
-            return l_msg
+            self.b_print = b_print
+            return self.stream.next()
         except StopIteration:
+            if self.d_cross_events[self.s_member]:
+                s_msg = 'BloombergMatching.next(): {} crossed the book {} '
+                s_msg += 'times, uncrossed by {} trades'
+                s_msg = s_msg.format(self.s_member,
+                                     self.d_cross_events[self.s_member],
+                                     self.d_cross_rounds[self.s_member])
+                if DEBUG:
+                    logging.info(s_msg)
+                else:
+                    print s_msg
             self.i_nrow = 0
             self.idx += 1
-            self.i_qty_traded_at_bid_10s = 0
-            self.i_qty_traded_at_ask_10s = 0
             self.i_qty_traded_at_bid = 0
             self.i_qty_traded_at_ask = 0
-            self.i_ofi_10s = 0
             self.i_ofi = 0
             self.last_date = 0
+            self.i_time_us = 0
             self.best_bid = (0, 0)
             self.best_ask = (0, 0)
             self.obj_best_bid = None
             self.obj_best_ask = None
-            self.mid_price_10s = 0.
+            self.rolling.reset()
             raise StopIteration
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Accumulate the transitions experienced by a learning agent in an empirical
+MDP (visits, mean rewards and transition probabilities kept as sparse
+arrays) and solve it for the Q-values between the sessions, using value
+iteration or prioritized sweeping
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import heapq
+import numpy as np
+
+import qtable
+
+
+'''
+Begin help functions
+'''
+
+
+def _grow(na_old, i_size):
+    '''
+    Return a copy of the array passed with the new size
+    :param na_old: numpy array. The array to be copied
+    :param i_size: integer. The new size of the array
+    '''
+    na_new = np.zeros(i_size, dtype=na_old.dtype)
+    na_new[:len(na_old)] = na_old
+    return na_new
+
+
+'''
+End help functions
+'''
+
+
+class EmpiricalMDP(object):
+    '''
+    The transitions (state, action, reward, next state) observed by an agent.
+    The model estimated from them has, for each pair (s, a) visited, the mean
+    reward and the probability of reaching each next state
+    '''
+
+    def __init__(self, i_capacity=4096):
+        '''
+        Initialize an EmpiricalMDP object
+        :*param i_capacity: integer. Number of transitions allocated at start
+        '''
+        self.indexer = qtable.StateIndexer()
+        self.i_size = 0
+        self.na_cell = np.zeros(i_capacity, dtype=np.int64)
+        self.na_next = np.zeros(i_capacity, dtype=np.int64)
+        self.na_reward = np.zeros(i_capacity, dtype=np.float64)
+
+    def add(self, s_state, i_action, f_reward, s_next_state):
+        '''
+        Include a transition in the counts
+        :param s_state: string or integer. The key of the state where the
+            action was taken
+        :param i_action: integer. The index of the action taken
+        :param f_reward: float. The reward received
+        :param s_next_state: string or integer. The key of the state reached
+        '''
+        i_pos = self.i_size
+        if i_pos == len(self.na_cell):
+            self.na_cell = _grow(self.na_cell, i_pos * 2)
+            self.na_next = _grow(self.na_next, i_pos * 2)
+            self.na_reward = _grow(self.na_reward, i_pos * 2)
+        i_state = self.indexer.get(s_state)
+        self.na_cell[i_pos] = i_state * qtable.N_ACTIONS + i_action
+        self.na_next[i_pos] = self.indexer.get(s_next_state)
+        self.na_reward[i_pos] = f_reward
+        self.i_size += 1
+
+    def __len__(self):
+        '''
+        Return the number of transitions recorded
+        '''
+        return self.i_size
+
+    def model(self):
+        '''
+        Return a dictionary with the estimated model. The cells are the pairs
+        (s, a) flattened as s * N_ACTIONS + a. The transitions are kept as
+        sparse (cell, next state, probability) arrays sorted by cell
+        '''
+        i_states = len(self.indexer)
+        i_cells = i_states * qtable.N_ACTIONS
+        na_cell = self.na_cell[:self.i_size]
+        na_next = self.na_next[:self.i_size]
+        na_count = np.bincount(na_cell, minlength=i_cells).astype(float)
+        na_rsum = np.bincount(na_cell, weights=self.na_reward[:self.i_size],
+                              minlength=i_cells)
+        na_seen = na_count > 0
+        na_rbar = np.zeros(i_cells)
+        na_rbar[na_seen] = na_rsum[na_seen] / na_count[na_seen]
+        # sum the repeated transitions
+        na_key, na_n = np.unique(na_cell * i_states + na_next,
+                                 return_counts=True)
+        na_pair_cell = na_key // i_states
+        na_pair_next = na_key % i_states
+        na_pair_prob = na_n / na_count[na_pair_cell]
+        return {'n_states': i_states,
+                'seen': na_seen,
+                'reward': na_rbar,
+                'cell': na_pair_cell,
+                'next': na_pair_next,
+                'prob': na_pair_prob}
+
+    def _initial_q(self, d_model, na_q0):
+        '''
+        Return the flat Q-values used to start the solvers. Cells not visited
+        are NaN
+        :param d_model: dictionary. The model from model()
+        :param na_q0: numpy array. Q-values to start from (n_states x
+            N_ACTIONS), NaN where unknown. None to start from zero
+        '''
+        na_seen = d_model['seen']
+        na_q = np.empty(len(na_seen))
+        na_q.fill(np.nan)
+        na_q[na_seen] = 0.
+        if na_q0 is not None:
+            na_aux = np.ravel(na_q0)
+            na_known = na_seen & ~np.isnan(na_aux)
+            na_q[na_known] = na_aux[na_known]
+        return na_q
+
+    def value_iteration(self, f_gamma=0.5, na_q0=None, n_iter=1000,
+                        f_tol=1e-6):
+        '''
+        Return the Q-values (n_states x N_ACTIONS) of the model, updating all
+        the pairs at once:
+            Q(s,a) <- r(s,a) + y sum_s' P(s'|s,a) max_a' Q(s',a')
+        :*param f_gamma: float. weight of delayed versus immediate rewards
+        :*param na_q0: numpy array. Q-values to start from
+        :*param n_iter: integer. Maximum number of iterations
+        :*param f_tol: float. Stop when the maximum change is smaller than that
+        '''
+        d_model = self.model()
+        i_states = d_model['n_states']
+        na_seen = d_model['seen']
+        na_cell = d_model['cell']
+        na_next = d_model['next']
+        na_prob = d_model['prob']
+        na_q = self._initial_q(d_model, na_q0)
+        if not na_seen.any():
+            return na_q.reshape(i_states, qtable.N_ACTIONS)
+        for i_iter in xrange(n_iter):
+            na_v = qtable.max_q(na_q.reshape(i_states, qtable.N_ACTIONS))
+            na_ev = np.bincount(na_cell, weights=na_prob * na_v[na_next],
+                                minlength=len(na_q))
+            na_new = na_q.copy()
+            na_new[na_seen] = d_model['reward'][na_seen] + \
+                f_gamma * na_ev[na_seen]
+            f_change = np.abs(na_new[na_seen] - na_q[na_seen]).max()
+            na_q = na_new
+            if f_change < f_tol:
+                break
+        return na_q.reshape(i_states, qtable.N_ACTIONS)
+
+    def prioritized_sweeping(self, f_gamma=0.5, na_q0=None, n_updates=100000,
+                             f_theta=1e-6):
+        '''
+        Return the Q-values (n_states x N_ACTIONS) of the model, backing up
+        one state at a time in the order of the largest expected change and
+        propagating the changes to the predecessors of each state
+        :*param f_gamma: float. weight of delayed versus immediate rewards
+        :*param na_q0: numpy array. Q-values to start from
+        :*param n_updates: integer. Maximum number of state backups
+        :*param f_theta: float. Smallest change that is propagated
+        '''
+        d_model = self.model()
+        i_states = d_model['n_states']
+        i_n = qtable.N_ACTIONS
+        na_cell = d_model['cell']
+        na_next = d_model['next']
+        na_prob = d_model['prob']
+        na_rbar = d_model['reward']
+        na_seen = d_model['seen'].reshape(i_states, i_n)
+        na_q = self._initial_q(d_model, na_q0).reshape(i_states, i_n)
+        if not na_seen.any():
+            return na_q
+        # where the transitions of each cell start and the predecessors
+        na_cell_start = np.searchsorted(na_cell, np.arange(i_states * i_n + 1))
+        na_order = np.argsort(na_next, kind='mergesort')
+        na_pred_start = np.searchsorted(na_next[na_order],
+                                        np.arange(i_states + 1))
+        na_pred_state = na_cell[na_order] // i_n
+        na_pred_prob = na_prob[na_order]
+        # start with the residuals of a full backup
+        na_v = qtable.max_q(na_q)
+        na_ev = np.bincount(na_cell, weights=na_prob * na_v[na_next],
+                            minlength=i_states * i_n).reshape(i_states, i_n)
+        na_target = na_rbar.reshape(i_states, i_n) + f_gamma * na_ev
+        na_res = np.where(na_seen, np.abs(na_target - np.nan_to_num(na_q)),
+                          0.).max(axis=1)
+        l_heap = [(-f_res, i_state) for i_state, f_res in enumerate(na_res)
+                  if f_res > f_theta]
+        heapq.heapify(l_heap)
+        i_updates = 0
+        while l_heap and i_updates < n_updates:
+            f_prio, i_state = heapq.heappop(l_heap)
+            i_updates += 1
+            for i_action in np.flatnonzero(na_seen[i_state]):
+                i_cell = i_state * i_n + i_action
+                i_lo, i_hi = na_cell_start[i_cell], na_cell_start[i_cell + 1]
+                f_ev = np.dot(na_prob[i_lo:i_hi], na_v[na_next[i_lo:i_hi]])
+                na_q[i_state, i_action] = na_rbar[i_cell] + f_gamma * f_ev
+            f_v = na_q[i_state, na_seen[i_state]].max()
+            f_delta = abs(f_v - na_v[i_state])
+            na_v[i_state] = f_v
+            if f_delta <= f_theta:
+                continue
+            i_lo, i_hi = na_pred_start[i_state], na_pred_start[i_state + 1]
+            for i_pred, f_prob in zip(na_pred_state[i_lo:i_hi],
+                                      na_pred_prob[i_lo:i_hi]):
+                f_prio = f_prob * f_delta
+                if f_prio > f_theta:
+                    heapq.heappush(l_heap, (-f_prio, i_pred))
+        return na_q
+
+    def solve(self, s_method='value_iteration', f_gamma=0.5, na_q0=None,
+              **kwargs):
+        '''
+        Return the Q-values (n_states x N_ACTIONS) of the model
+        :*param s_method: string. 'value_iteration' or 'prioritized_sweeping'
+        :*param f_gamma: float. weight of delayed versus immediate rewards
+        :*param na_q0: numpy array. Q-values to start from
+        :*param kwargs: dictionary. Other parameters of the method
+        '''
+        assert s_method in ['value_iteration', 'prioritized_sweeping']
+        func = getattr(self, s_method)
+        return func(f_gamma=f_gamma, na_q0=na_q0, **kwargs)
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Export the parameters of the scikit-learn models used by the scalers (the
+min-max scalers, the PCA and the k-means) to a single binary archive and
+implement the same predictions with plain NumPy. The arrays of the archive
+are aligned and read through a memory map, so the processes using the same
+file share its pages instead of keeping a copy of each model
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import json
+import os
+import pickle
+import struct
+import numpy as np
+
+'''
+Begin help functions
+'''
+
+# format of the archive: magic, version and length of the JSON header,
+# followed by the header and by the float64 arrays aligned to ALIGN bytes
+MAGIC = 'QTMODELS'
+VERSION = 1
+ALIGN = 64
+S_ARCHIVE = 'data/models.bin'
+
+# the pickled models exported, by name
+d_pickles = {'kmeans': 'data/kmeans.dat',
+             'kmeans_2': 'data/kmeans_2.dat',
+             'pca': 'data/pca.dat',
+             'scale_ofi': 'data/scale_ofi.dat',
+             'scale_ofi_2': 'data/scale_ofi_2.dat',
+             'scale_qbid': 'data/scale_qbid.dat',
+             'scale_bookratio': 'data/scale_bookratio.dat',
+             'scale_bookratio_2': 'data/scale_bookratio_2.dat',
+             'logret': 'data/logret.dat'}
+
+# archives loaded by the process, by file name
+d_archives = {}
+
+
+class InvalidArchiveException(Exception):
+    """
+    InvalidArchiveException is raised by the load_archive() function to
+    indicate that the file is not an archive of models or that its version is
+    not supported
+    """
+    pass
+
+
+def _align(i_pos):
+    '''
+    Return the first position aligned to ALIGN bytes not before the one passed
+    :param i_pos: integer. A position in the file
+    '''
+    return (i_pos + ALIGN - 1) // ALIGN * ALIGN
+
+
+def model_to_arrays(obj_model):
+    '''
+    Return a dictionary with the arrays needed to predict with the fitted
+    scikit-learn model passed
+    :param obj_model: MinMaxScaler, PCA or KMeans object. The fitted model
+    '''
+    if hasattr(obj_model, 'cluster_centers_'):
+        return {'centers': obj_model.cluster_centers_}
+    if hasattr(obj_model, 'components_'):
+        na_whiten = np.ones(len(obj_model.components_))
+        if obj_model.whiten:
+            na_whiten = 1. / np.sqrt(obj_model.explained_variance_)
+        return {'mean': obj_model.mean_,
+                'components': obj_model.components_,
+                'whiten': na_whiten}
+    return {'min': obj_model.min_, 'scale': obj_model.scale_}
+
+
+def save_archive(s_fname, d_arrays):
+    '''
+    Save the arrays passed in an archive
+    :param s_fname: string. Path to the file
+    :param d_arrays: dictionary. float arrays by name
+    '''
+    d_header = {'version': VERSION, 'arrays': {}}
+    i_pos = 0
+    l_arrays = []
+    for s_name in sorted(d_arrays):
+        na_aux = np.ascontiguousarray(d_arrays[s_name], dtype='<f8')
+        d_header['arrays'][s_name] = {'offset': i_pos,
+                                      'shape': list(na_aux.shape)}
+        l_arrays.append(na_aux)
+        i_pos = _align(i_pos + na_aux.nbytes)
+    s_header = json.dumps(d_header, sort_keys=True)
+    i_data = _align(len(MAGIC) + 8 + len(s_header))
+    with open(s_fname, 'wb') as fw:
+        fw.write(MAGIC)
+        fw.write(struct.pack('<II', VERSION, len(s_header)))
+        fw.write(s_header)
+        for s_name, na_aux in zip(sorted(d_arrays), l_arrays):
+            fw.seek(i_data + d_header['arrays'][s_name]['offset'])
+            fw.write(na_aux.tostring())
+        # the map of the file needs a whole number of float64 values. When
+        # the file already has this size, the last byte is header or data
+        if fw.tell() < i_data + i_pos:
+            fw.seek(i_data + i_pos - 1)
+            fw.write('\0')
+
+
+def load_archive(s_fname=S_ARCHIVE):
+    '''
+    Return a dictionary with read-only views of the arrays of the archive,
+    by name. The file is mapped once by process
+    :*param s_fname: string. Path to the file
+    '''
+    if s_fname in d_archives:
+        return d_archives[s_fname]
+    with open(s_fname, 'rb') as fr:
+        s_magic = fr.read(len(MAGIC))
+        if s_magic != MAGIC:
+            raise InvalidArchiveException('{} is not an archive of models'
+                                          .format(s_fname))
+        i_version, i_len = struct.unpack('<II', fr.read(8))
+        if i_version != VERSION:
+            s_err = 'The archive {} has version {}. Expected version {}'
+            raise InvalidArchiveException(s_err.format(s_fname, i_version,
+                                                       VERSION))
+        d_header = json.loads(fr.read(i_len))
+    i_data = _align(len(MAGIC) + 8 + i_len)
+    na_map = np.memmap(s_fname, dtype='<f8', mode='r')
+    d_rtn = {}
+    for s_name, d_info in d_header['arrays'].iteritems():
+        i_start = (i_data + d_info['offset']) // 8
+        i_size = int(np.prod(d_info['shape']))
+        na_aux = na_map[i_start:i_start + i_size]
+        d_rtn[str(s_name)] = na_aux.reshape(d_info['shape'])
+    d_archives[s_fname] = d_rtn
+    return d_rtn
+
+
+'''
+End help functions
+'''
+
+
+class MinMaxScaler(object):
+    '''
+    The transform of a fitted MinMaxScaler, using the arrays of an archive
+    '''
+
+    def __init__(self, s_name, s_fname=S_ARCHIVE):
+        '''
+        Initialize a MinMaxScaler object
+        :param s_name: string. The name of the model in the archive
+        :*param s_fname: string. Path to the archive
+        '''
+        d_arrays = load_archive(s_fname)
+        self.na_min = d_arrays[s_name + '.min']
+        self.na_scale = d_arrays[s_name + '.scale']
+
+    def transform(self, na_x):
+        '''
+        Return the values scaled to the range used to fit the model
+        :param na_x: numpy array. samples x features
+        '''
+        return na_x * self.na_scale + self.na_min
+
+
+class PCA(object):
+    '''
+    The transform of a fitted PCA, using the arrays of an archive
+    '''
+
+    def __init__(self, s_name, s_fname=S_ARCHIVE):
+        '''
+        Initialize a PCA object
+        :param s_name: string. The name of the model in the archive
+        :*param s_fname: string. Path to the archive
+        '''
+        d_arrays = load_archive(s_fname)
+        self.na_mean = d_arrays[s_name + '.mean']
+        self.na_components = d_arrays[s_name + '.components']
+        self.na_whiten = d_arrays[s_name + '.whiten']
+
+    def transform(self, na_x):
+        '''
+        Return the projection of the values in the principal components
+        :param na_x: numpy array. samples x features
+        '''
+        na_rtn = np.dot(na_x - self.na_mean, self.na_components.T)
+        return na_rtn * self.na_whiten
+
+
+class KMeans(object):
+    '''
+    The prediction of a fitted KMeans, using the arrays of an archive
+    '''
+
+    def __init__(self, s_name, s_fname=S_ARCHIVE):
+        '''
+        Initialize a KMeans object
+        :param s_name: string. The name of the model in the archive
+        :*param s_fname: string. Path to the archive
+        '''
+        self.na_centers = load_archive(s_fname)[s_name + '.centers']
+
+    def predict(self, na_x):
+        '''
+        Return the index of the closest center to each sample
+        :param na_x: numpy array. samples x features
+        '''
+        na_diff = na_x[:, np.newaxis, :] - self.na_centers[np.newaxis]
+        return (na_diff ** 2).sum(axis=2).argmin(axis=1)
+
+
+# the class that implements each kind of model exported
+d_model_class = {'centers': KMeans, 'components': PCA, 'scale': MinMaxScaler}
+
+
+def get_model(s_name, s_fname=S_ARCHIVE):
+    '''
+    Return the model with the name passed, from the archive
+    :param s_name: string. The name of the model in the archive
+    :*param s_fname: string. Path to the archive
+    '''
+    d_arrays = load_archive(s_fname)
+    for s_key, model_class in d_model_class.iteritems():
+        if '{}.{}'.format(s_name, s_key) in d_arrays:
+            return model_class(s_name, s_fname)
+    raise KeyError('There is no model {} in {}'.format(s_name, s_fname))
+
+
+def export_models(s_out=S_ARCHIVE, d_fnames=None):
+    '''
+    Load the pickled scikit-learn models and save their parameters in an
+    archive. Return the names of the models exported. Raise IOError if none
+    of the pickles exists
+    :*param s_out: string. Path to the archive
+    :*param d_fnames: dictionary. Paths of the pickled models by name
+    '''
+    if not d_fnames:
+        d_fnames = d_pickles
+    d_arrays = {}
+    l_names = []
+    for s_name, s_pickle in d_fnames.iteritems():
+        if not os.path.exists(s_pickle):
+            continue
+        l_names.append(s_name)
+        with open(s_pickle, 'r') as fr:
+            obj_model = pickle.load(fr)
+        for s_key, na_aux in model_to_arrays(obj_model).iteritems():
+            d_arrays['{}.{}'.format(s_name, s_key)] = na_aux
+    if not l_names:
+        raise IOError('None of the pickled models was found: {}'.format(
+            ', '.join(sorted(d_fnames.itervalues()))))
+    save_archive(s_out, d_arrays)
+    d_archives.pop(s_out, None)
+    return sorted(l_names)
+
+
+if __name__ == '__main__':
+    # export the models of the data folder
+    print 'models.py: Exported {}'.format(export_models())
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Record the transitions experienced by the learning agents and evaluate or fit
+policies offline, using just the arrays recorded, without replaying the market
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import qtable
+
+
+'''
+Begin help functions
+'''
+
+
+def _grow(na_old, i_size):
+    '''
+    Return a copy of the array passed with the new size
+    :param na_old: numpy array. The array to be copied
+    :param i_size: integer. The new size of the array
+    '''
+    na_new = np.zeros(i_size, dtype=na_old.dtype)
+    na_new[:len(na_old)] = na_old
+    return na_new
+
+
+def qtable_to_dense(q_table, indexer):
+    '''
+    Return a matrix with the Q-values of all states known by the indexer
+    :param q_table: dictionary. A Q-table from a learning agent
+    :param indexer: StateIndexer object. States used in the transitions
+    '''
+    na_states = np.arange(len(indexer))
+    return qtable.dense_rows(q_table, indexer, na_states)
+
+
+def frozen_policy_probs(na_q, na_mask):
+    '''
+    Return the probability of each action (n x N_ACTIONS) under the policy of
+    a LearningAgent_k with the policy frozen, that always takes the best action
+    :param na_q: numpy array. Q-values of the states (NaN if not visited)
+    :param na_mask: numpy array. bit masks of the valid actions
+    '''
+    return k_policy_probs(na_q, na_mask, f_k=None)
+
+
+def k_policy_probs(na_q, na_mask, f_k):
+    '''
+    Return the probability of each action (n x N_ACTIONS) under the policy of
+    LearningAgent_k. If f_k is None, the policy is considered frozen
+    :param na_q: numpy array. Q-values of the states (NaN if not visited)
+    :param na_mask: numpy array. bit masks of the valid actions
+    :param f_k: float. How strongly should favor high Q-hat values
+    '''
+    na_valid = qtable.masks_to_bool(na_mask)
+    na_aux = na_q.copy()
+    na_aux[~na_valid] = np.nan
+    # force to stop loss action be the last desired
+    for s_action in ['BUY', 'SELL']:
+        i_col = qtable.d_action_idx[s_action]
+        na_seen = ~np.isnan(na_aux[:, i_col])
+        na_aux[na_seen, i_col] = 0.
+    na_n_valid = na_valid.sum(axis=1).astype(float)
+    # best action is the one with the greatest value above 0.01
+    na_cand = np.where(np.isnan(na_aux), -np.inf, na_aux)
+    na_best = na_cand.argmax(axis=1)
+    na_max = na_cand.max(axis=1)
+    na_has_best = na_max > 0.01
+    i_n = len(na_q)
+    na_best_prob = np.zeros((i_n, qtable.N_ACTIONS))
+    na_best_prob[na_has_best, na_best[na_has_best]] = 1.
+    if f_k is None:
+        # when frozen and there is no best action, close out the position
+        na_default = np.zeros(i_n, dtype=np.int64)
+        for s_action in ['SELL', 'BUY']:
+            i_col = qtable.d_action_idx[s_action]
+            na_default[na_valid[:, i_col]] = i_col
+        na_none = ~na_has_best
+        na_best_prob[na_none, na_default[na_none]] = 1.
+        return na_best_prob
+    # otherwise, the best action is a random one
+    na_uniform = na_valid / na_n_valid[:, None]
+    na_best_prob[~na_has_best] = na_uniform[~na_has_best]
+    # eps <= k**max_Qhat / sum(k**Qhat)
+    na_pos = ~np.isnan(na_aux) & (na_aux >= 0.)
+    na_count = na_pos.sum(axis=1)
+    na_cum = 1. + np.where(na_pos, f_k ** np.where(na_pos, na_aux, 0.),
+                           0.).sum(axis=1)
+    na_max_val = np.where(na_has_best, na_max, 0.01)
+    na_prob = (f_k ** na_max_val) / ((na_n_valid - na_count) * 0.15 + na_cum)
+    na_prob = np.minimum(na_prob, 1.)[:, None]
+    return na_prob * na_best_prob + (1. - na_prob) * na_uniform
+
+
+'''
+End help functions
+'''
+
+
+class TransitionLog(object):
+    '''
+    Growable arrays with the transitions (state, valid actions, action, reward,
+    next state) experienced by an agent, split by episodes (sessions)
+    '''
+
+    def __init__(self, i_capacity=4096):
+        '''
+        Initialize a TransitionLog object. Save all parameters as attributes
+        :*param i_capacity: integer. Number of transitions allocated at start
+        '''
+        self.indexer = qtable.StateIndexer()
+        self.i_size = 0
+        self.i_episode = 0
+        self.d_data = {'state': np.zeros(i_capacity, dtype=np.int64),
+                       'mask': np.zeros(i_capacity, dtype=np.int16),
+                       'action': np.zeros(i_capacity, dtype=np.int8),
+                       'reward': np.zeros(i_capacity, dtype=np.float64),
+                       'next_state': np.zeros(i_capacity, dtype=np.int64),
+                       'next_mask': np.zeros(i_capacity, dtype=np.int16),
+                       'prob': np.zeros(i_capacity, dtype=np.float64),
+                       'fill': np.zeros(i_capacity, dtype=np.bool_),
+                       'episode': np.zeros(i_capacity, dtype=np.int32)}
+
+    def new_episode(self):
+        '''
+        Mark the start of a new episode. It is called at each session
+        '''
+        if self.i_size > 0:
+            self.i_episode += 1
+
+    def add(self, s_state, i_mask, i_action, f_reward, s_next_state,
+            i_next_mask, f_prob, b_fill=False):
+        '''
+        Include a transition in the log
+        :param s_state: string or integer. The key of the state where the
+            action was taken
+        :param i_mask: integer. Bit mask of the actions valid in the state
+        :param i_action: integer. The index of the action taken
+        :param f_reward: float. The reward received
+        :param s_next_state: string or integer. The key of the state reached
+        :param i_next_mask: integer. Bit mask of the valid actions in there
+        :param f_prob: float. The probability of the behavior policy of
+            choosing the action taken
+        :*param b_fill: boolean. If the action was a fill of a resting order,
+            not chosen by the policy
+        '''
+        i_pos = self.i_size
+        if i_pos == len(self.d_data['state']):
+            for s_key in self.d_data:
+                self.d_data[s_key] = _grow(self.d_data[s_key], i_pos * 2)
+        d_data = self.d_data
+        d_data['state'][i_pos] = self.indexer.get(s_state)
+        d_data['mask'][i_pos] = i_mask
+        d_data['action'][i_pos] = i_action
+        d_data['reward'][i_pos] = f_reward
+        d_data['next_state'][i_pos] = self.indexer.get(s_next_state)
+        d_data['next_mask'][i_pos] = i_next_mask
+        d_data['prob'][i_pos] = f_prob
+        d_data['fill'][i_pos] = b_fill
+        d_data['episode'][i_pos] = self.i_episode
+        self.i_size += 1
+
+    def __getitem__(self, s_key):
+        '''
+        Return the array of the column s_key, with the transitions recorded
+        :param s_key: string. The name of the column
+        '''
+        return self.d_data[s_key][:self.i_size]
+
+    def __len__(self):
+        '''
+        Return the number of transitions recorded
+        '''
+        return self.i_size
+
+    def save(self, s_fname):
+        '''
+        Save the transitions recorded in a NumPy archive
+        :param s_fname: string. The path to the file
+        '''
+        d_save = dict((s_key, self[s_key]) for s_key in self.d_data)
+        d_save['states'] = np.array(self.indexer.l_states)
+        np.savez(s_fname, **d_save)
+
+    @classmethod
+    def load(cls, s_fname):
+        '''
+        Return a TransitionLog object from a file saved previously
+        :param s_fname: string. The path to the file
+        '''
+        d_load = np.load(s_fname)
+        obj_log = cls(i_capacity=max(1, len(d_load['state'])))
+        for s_state in d_load['states']:
+            obj_log.indexer.get(s_state.item())
+        for s_key in obj_log.d_data:
+            if s_key not in d_load:
+                # files saved before the column existed
+                continue
+            na_aux = d_load[s_key]
+            obj_log.d_data[s_key][:len(na_aux)] = na_aux
+        obj_log.i_size = len(d_load['state'])
+        if obj_log.i_size > 0:
+            obj_log.i_episode = int(obj_log['episode'].max())
+        return obj_log
+
+
+def fitted_q(obj_log, f_gamma=0.5, n_iter=100, f_tol=1e-6):
+    '''
+    Return the Q-values (n_states x N_ACTIONS) fitted to the transitions,
+    iterating Q(s,a) <- mean[r + y max_a' Q(s', a')]. Pairs (s, a) never
+    observed are NaN
+    :param obj_log: TransitionLog object. The transitions recorded
+    :*param f_gamma: float. weight of delayed versus immediate rewards
+    :*param n_iter: integer. Maximum number of iterations
+    :*param f_tol: float. Stop when the maximum change is smaller than that
+    '''
+    i_states = len(obj_log.indexer)
+    i_cells = i_states * qtable.N_ACTIONS
+    na_s = obj_log['state']
+    na_a = obj_log['action'].astype(np.int64)
+    na_cell = na_s * qtable.N_ACTIONS + na_a
+    na_count = np.bincount(na_cell, minlength=i_cells).astype(float)
+    na_seen = na_count > 0
+    na_q = np.empty(i_cells)
+    na_q.fill(np.nan)
+    na_q[na_seen] = 0.
+    if not na_seen.any():
+        return na_q.reshape(i_states, qtable.N_ACTIONS)
+    na_next = obj_log['next_state']
+    na_next_mask = obj_log['next_mask']
+    na_r = obj_log['reward']
+    for i_iter in xrange(n_iter):
+        na_qm = na_q.reshape(i_states, qtable.N_ACTIONS)
+        na_target = na_r + f_gamma * qtable.max_q(na_qm[na_next], na_next_mask)
+        na_sum = np.bincount(na_cell, weights=na_target, minlength=i_cells)
+        na_new = na_q.copy()
+        na_new[na_seen] = na_sum[na_seen] / na_count[na_seen]
+        f_change = np.abs(na_new[na_seen] - na_q[na_seen]).max()
+        na_q = na_new
+        if f_change < f_tol:
+            break
+    return na_q.reshape(i_states, qtable.N_ACTIONS)
+
+
+def importance_sampling(obj_log, na_target_probs, f_gamma=1.,
+                        b_weighted=True):
+    '''
+    Return the per-decision importance sampling estimate of the average return
+    by episode of a target policy, using the behavior policy recorded. The
+    transitions driven by fills were not chosen by any of the policies, so
+    their ratios are 1
+    :param obj_log: TransitionLog object. The transitions recorded
+    :param na_target_probs: numpy array. Probabilities of each action under
+        the target policy in each transition (n x N_ACTIONS)
+    :*param f_gamma: float. Discount applied to the rewards
+    :*param b_weighted: boolean. If should normalize the weights
+    '''
+    na_a = obj_log['action'].astype(np.int64)
+    na_pi = na_target_probs[np.arange(len(na_a)), na_a]
+    na_mu = obj_log['prob']
+    na_rho = na_pi / np.maximum(na_mu, 1e-12)
+    na_rho[obj_log['fill']] = 1.
+    na_episode = obj_log['episode']
+    na_r = obj_log['reward']
+    # cumulative weights and discounts inside each episode
+    na_start = np.flatnonzero(np.r_[True, na_episode[1:] != na_episode[:-1]])
+    na_end = np.r_[na_start[1:], len(na_a)]
+    na_w = np.empty(len(na_a))
+    na_disc = np.empty(len(na_a))
+    for i_start, i_end in zip(na_start, na_end):
+        na_w[i_start:i_end] = np.cumprod(na_rho[i_start:i_end])
+        na_disc[i_start:i_end] = f_gamma ** np.arange(i_end - i_start)
+    if not b_weighted:
+        return (na_w * na_disc * na_r).sum() / len(na_start)
+    # normalize the weights of each decision step across the episodes
+    na_step = np.arange(len(na_a)) - np.repeat(na_start, na_end - na_start)
+    na_wsum = np.bincount(na_step, weights=na_w)
+    na_nep = np.bincount(na_step).astype(float)
+    na_norm = na_wsum[na_step] / na_nep[na_step]
+    na_norm[na_norm == 0.] = 1.
+    return (na_w / na_norm * na_disc * na_r).sum() / len(na_start)
+
+
+def evaluate_qtable(obj_log, q_table, f_k=None):
+    '''
+    Return the estimate of the average PnL by episode of a LearningAgent_k
+    using the Q-table passed
+    :param obj_log: TransitionLog object. The transitions recorded
+    :param q_table: dictionary. A Q-table from a learning agent
+    :*param f_k: float. The k parameter. If None, the policy is frozen
+    '''
+    na_q = qtable_to_dense(q_table, obj_log.indexer)
+    na_probs = k_policy_probs(na_q[obj_log['state']], obj_log['mask'], f_k)
+    return importance_sampling(obj_log, na_probs)
+
+
+def screen(obj_log, l_gamma, l_k):
+    '''
+    Return a dataframe with the estimates of the average PnL by episode of the
+    policies fitted using each gamma and followed using each k
+    :param obj_log: TransitionLog object. The transitions recorded
+    :param l_gamma: list. gamma values to test
+    :param l_k: list. k values to test. None stands for a frozen policy
+    '''
+    import pandas as pd
+    l_rtn = []
+    na_states = obj_log['state']
+    na_mask = obj_log['mask']
+    for f_gamma in l_gamma:
+        na_q = fitted_q(obj_log, f_gamma=f_gamma)
+        for f_k in l_k:
+            na_probs = k_policy_probs(na_q[na_states], na_mask, f_k)
+            f_value = importance_sampling(obj_log, na_probs)
+            l_rtn.append({'gamma': f_gamma, 'k': f_k, 'value': f_value})
+    return pd.DataFrame(l_rtn)
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Train learning agents in parallel. Each worker process replays a different
+session with a local copy of the Q-table and, at each synchronization point,
+the tables are merged into a master one, weighting each value by the number of
+visits of its pair (state, action)
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import logging
+import multiprocessing
+import random
+import numpy as np
+
+from simulator import Simulator
+import qtable
+import workers
+
+# global variable
+DEBUG = True
+
+'''
+Begin help functions
+'''
+
+
+def table_to_arrays(d_table, l_states):
+    '''
+    Return a matrix (len(l_states) x N_ACTIONS) with the values of the
+    dictionary of dictionaries passed. Missing entries are NaN
+    :param d_table: dictionary. A Q-table or a table of visits
+    :param l_states: list. The states desired, in order
+    '''
+    na_rtn = np.empty((len(l_states), qtable.N_ACTIONS))
+    na_rtn.fill(np.nan)
+    for i_row, s_state in enumerate(l_states):
+        d_row = d_table.get(s_state)
+        if not d_row:
+            continue
+        for s_action, f_val in d_row.iteritems():
+            na_rtn[i_row, qtable.d_action_idx[s_action]] = f_val
+    return na_rtn
+
+
+def merge_tables(t_master, l_results):
+    '''
+    Return the master table (states, Q-values, visits) updated with the
+    results of the workers. Each Q-value is the average of the values of the
+    workers weighted by the visits made in the last round. Pairs not visited
+    by any worker keep the master value
+    :param t_master: tuple. states list, Q-values and visits of the master
+    :param l_results: list. tuples with the same format from each worker
+    '''
+    l_master_states, na_master_q, na_master_n = t_master
+    indexer = qtable.StateIndexer()
+    for s_state in l_master_states:
+        indexer.get(s_state)
+    for l_states, na_q, na_n in l_results:
+        for s_state in l_states:
+            indexer.get(s_state)
+    i_states = len(indexer)
+    t_shape = (i_states, qtable.N_ACTIONS)
+    # expand the master to all states known
+    na_new_q = np.empty(t_shape)
+    na_new_q.fill(np.nan)
+    na_new_n = np.zeros(t_shape)
+    na_rows = np.array([indexer.find(s) for s in l_master_states],
+                       dtype=np.int64)
+    if len(na_rows):
+        na_new_q[na_rows] = na_master_q
+        na_new_n[na_rows] = na_master_n
+    # accumulate the weighted values from the workers
+    na_wsum = np.zeros(t_shape)
+    na_qsum = np.zeros(t_shape)
+    for l_states, na_q, na_n in l_results:
+        if not len(l_states):
+            continue
+        na_rows = np.array([indexer.find(s) for s in l_states],
+                           dtype=np.int64)
+        # visits made in this round, beyond the ones the master knew
+        na_round = na_n - na_new_n[na_rows]
+        na_round[np.isnan(na_q)] = 0.
+        na_round = np.maximum(na_round, 0.)
+        na_qsum[na_rows] += na_round * np.nan_to_num(na_q)
+        na_wsum[na_rows] += na_round
+    na_visited = na_wsum > 0
+    na_new_q[na_visited] = na_qsum[na_visited] / na_wsum[na_visited]
+    na_new_n += na_wsum
+    return indexer.l_states, na_new_q, na_new_n
+
+
+def master_visits(t_master, l_states, na_q):
+    '''
+    Return the visits of the master aligned to the states passed and a
+    boolean matrix flagging the Q-values that differ from the master ones
+    :param t_master: tuple. states list, Q-values and visits of the master
+    :param l_states: list. The states of the worker, in order
+    :param na_q: numpy array. The Q-values of the worker
+    '''
+    l_master_states, na_master_q, na_master_n = t_master
+    d_rows = dict((s_state, i_row) for i_row, s_state in
+                  enumerate(l_master_states))
+    na_n = np.zeros(na_q.shape)
+    na_old = np.empty(na_q.shape)
+    na_old.fill(np.nan)
+    for i_row, s_state in enumerate(l_states):
+        i_master = d_rows.get(s_state)
+        if i_master is None:
+            continue
+        na_n[i_row] = na_master_n[i_master]
+        na_old[i_row] = na_master_q[i_master]
+    na_changed = ~np.isnan(na_q) & (na_q != na_old)
+    return na_n, na_changed
+
+
+def _train_worker(d_job):
+    '''
+    Train an agent starting from the master table and return its tables as
+    arrays. Used by the process pool
+    :param d_job: dictionary. The description of the job
+    '''
+    random.seed(d_job['i_seed'])
+    np.random.seed(d_job['i_seed'])
+    # reuse the environment of the process from the previous jobs
+    e = workers.warm_env(d_job['s_fname'], d_job['i_idx'], d_job['s_agent'],
+                         d_job['d_kwargs'])
+    a = e.primary_agent
+    # start from the master table
+    l_states, na_q, na_n = d_job['t_master']
+    qtable.arrays_to_qtable(l_states, na_q, a.q_table)
+    b_visits = hasattr(a, 'nvisits_table')
+    if b_visits:
+        na_aux = na_n.copy()
+        na_aux[np.isnan(na_q)] = np.nan
+        qtable.arrays_to_qtable(l_states, na_aux, a.nvisits_table)
+    # train the agent
+    sim = Simulator(e, update_delay=1.00, display=False)
+    sim.train(n_trials=d_job['n_trials'],
+              n_sessions=d_job['n_sessions'],
+              b_save_qtable=False)
+    # return the tables. Without visits counting, each entry updated in this
+    # round weights one and the ones left untouched keep the master visits
+    l_states = sorted(a.q_table.keys())
+    na_q = table_to_arrays(a.q_table, l_states)
+    if b_visits:
+        na_n = np.nan_to_num(table_to_arrays(a.nvisits_table, l_states))
+    else:
+        na_n, na_changed = master_visits(d_job['t_master'], l_states, na_q)
+        na_n[na_changed] += 1.
+    return l_states, na_q, na_n
+
+
+'''
+End help functions
+'''
+
+
+def train_parallel(s_fname, l_idx, s_agent='LearningAgent', d_kwargs=None,
+                   n_workers=None, n_rounds=1, n_trials=1, n_sessions=1,
+                   i_seed=0):
+    '''
+    Train an agent using a pool of processes. In each round, every worker
+    replays the sessions starting at one index of l_idx and, at the end of the
+    round, the tables are merged into the master. Return the master Q-table
+    :param s_fname: string. the container zip file to be used in simulation
+    :param l_idx: list. the index of the start file used by each worker
+    :*param s_agent: string. The name of the agent class
+    :*param d_kwargs: dictionary. Parameters used to create the agent
+    :*param n_workers: integer. Number of processes. Default is the cpu count
+    :*param n_rounds: integer. Number of synchronization points
+    :*param n_trials: integer. Iterations over the same files in each round
+    :*param n_sessions: integer. Number of files read in each trial
+    :*param i_seed: integer. Base seed of the random number generators
+    '''
+    if not d_kwargs:
+        d_kwargs = {}
+    t_master = ([], np.zeros((0, qtable.N_ACTIONS)),
+                np.zeros((0, qtable.N_ACTIONS)))
+    if not n_workers:
+        n_workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        for i_round in xrange(n_rounds):
+            l_jobs = []
+            for i_job, i_idx in enumerate(l_idx):
+                l_jobs.append({'s_fname': s_fname,
+                               'i_idx': i_idx,
+                               's_agent': s_agent,
+                               'd_kwargs': d_kwargs,
+                               'n_trials': n_trials,
+                               'n_sessions': n_sessions,
+                               'i_seed': i_seed + i_round * 1000 + i_job,
+                               't_master': t_master})
+            l_results = pool.map(_train_worker, l_jobs)
+            t_master = merge_tables(t_master, l_results)
+            s_msg = 'train_parallel(): Round {} merged. {} states known'
+            s_msg = s_msg.format(i_round + 1, len(t_master[0]))
+            if DEBUG:
+                logging.info(s_msg)
+            else:
+                print s_msg
+    finally:
+        pool.close()
+        pool.join()
+    # save the master table
+    l_states, na_q, na_n = t_master
+    q_table = qtable.arrays_to_qtable(l_states, na_q)
+    s_out = 'log/qtable/{}_qtable_parallel.qtb'.format(s_agent)
+    d_params = dict(d_kwargs)
+    d_params.update({'agent': s_agent, 'n_rounds': n_rounds,
+                     'n_workers': n_workers})
+    qtable.save_qtable(s_out, q_table, d_params=d_params)
+    return q_table
@@ -0,0 +1,314 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement the stages used by the order matching to replay a file as plain
+generators, so they can be composed, reordered, profiled and moved to other
+threads. The stages after the parse depend on the state of the book left by
+the previous event, so they pull one event at a time and should not be
+buffered
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import csv
+import Queue
+import threading
+import time
+
+'''
+Begin help functions
+'''
+
+
+class _StageError(object):
+    '''
+    Wrap an exception raised in a thread to re-raise it in the consumer
+    '''
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()  # marks the end of a threaded stream
+
+
+US_PER_SECOND = 1000000
+
+
+def _clock_to_us(s_clock):
+    '''
+    Return the number of microseconds since the midnight of a time like
+    '10:30:00'
+    :param s_clock: string. The time, without fractions of second
+    '''
+    l_aux = s_clock.split(':')
+    i_sec = int(l_aux[0]) * 3600 + int(l_aux[1]) * 60 + int(l_aux[2])
+    return i_sec * US_PER_SECOND
+
+
+class TimeParser(object):
+    '''
+    Callable that converts dates like '2016-07-25 10:30:00' or
+    '2016-07-25 10:30:00.250' to integer microseconds since midnight. The
+    last second parsed is cached, as consecutive rows usually share it. Use
+    one object by stream
+    '''
+
+    def __init__(self):
+        '''
+        Initialize a TimeParser object
+        '''
+        self.s_last = None
+        self.i_last = 0
+
+    def __call__(self, s_date):
+        '''
+        Return the microseconds since midnight of the date passed
+        :param s_date: string. The date and time of the row
+        '''
+        s_clock = s_date[s_date.find(' ') + 1:]
+        s_sec, _, s_frac = s_clock.partition('.')
+        if s_sec != self.s_last:
+            self.i_last = _clock_to_us(s_sec)
+            self.s_last = s_sec
+        if s_frac:
+            return self.i_last + int((s_frac + '00000')[:6])
+        return self.i_last
+
+
+def parse_seconds(s_date):
+    '''
+    Return the number of seconds since the midnight of a date like
+    '2016-07-25 10:30:00'
+    :param s_date: string. The date and time of the row
+    '''
+    s_clock = s_date[s_date.find(' ') + 1:].partition('.')[0]
+    return _clock_to_us(s_clock) // US_PER_SECOND
+
+
+'''
+End help functions
+'''
+
+
+def source(fr):
+    '''
+    Yield each row of a Bloomberg file as a dictionary. The file is closed
+    when the stream ends or is dropped
+    :param fr: file object. An opened file from the zip archive
+    '''
+    try:
+        for row in csv.DictReader(fr):
+            yield row
+    finally:
+        fr.close()
+
+
+def parse(stream):
+    '''
+    Yield each row with the time of the event in integer microseconds since
+    midnight
+    :param stream: iterator. rows from source()
+    '''
+    parse_time = TimeParser()
+    for row in stream:
+        yield row, parse_time(row['Date'])
+
+
+def cross_correct(stream, ordmatch):
+    '''
+    Yield the events to be translated. When the best prices of the book are
+    crossed, the order matching trades the crossed quantities and all the
+    trades are yielded as a single event, already applied to the book,
+    before the original row
+    :param stream: iterator. (row, microseconds) from parse()
+    :param ordmatch: BloombergMatching object. The order matching
+    '''
+    for row, i_time in stream:
+        ordmatch.row = row
+        if ordmatch.is_crossed() and int(row['']) > 5:
+            l_fills = ordmatch.resolve_cross(row)
+            if l_fills:
+                yield row, i_time, l_fills
+        yield row, i_time, None
+
+
+def translate(stream, ordmatch):
+    '''
+    Yield the messages to the order book related to each event and if they
+    were already applied to the book
+    :param stream: iterator. (row, microseconds, trades) from
+        cross_correct()
+    :param ordmatch: BloombergMatching object. The order matching
+    '''
+    for row, i_time, l_fills in stream:
+        if l_fills is not None:
+            yield l_fills, i_time, True
+            continue
+        # reshape the row to messages to order book
+        yield ordmatch.reshape_row(ordmatch.i_nrow, row), i_time, False
+
+
+def apply(stream, ordmatch):
+    '''
+    Update the order book with the messages of each event and yield them
+    :param stream: iterator. (messages, microseconds, applied) from
+        translate()
+    :param ordmatch: BloombergMatching object. The order matching
+    '''
+    for l_msg, i_time, b_applied in stream:
+        ordmatch.i_time_us = i_time
+        ordmatch.last_date = i_time // US_PER_SECOND
+        if not b_applied:
+            ordmatch.apply_messages(l_msg, b_print=ordmatch.b_print)
+        yield l_msg
+
+
+def features(stream, ordmatch):
+    '''
+    Update the best prices and the order flow measures after each event and
+    yield its messages
+    :param stream: iterator. messages from apply()
+    :param ordmatch: BloombergMatching object. The order matching
+    '''
+    for l_msg in stream:
+        ordmatch.update_features()
+        yield l_msg
+
+
+# the stages used by the order matching, in order. The ones that receive the
+# order matching as the second parameter are marked
+l_default_stages = [(parse, False),
+                    (cross_correct, True),
+                    (translate, True),
+                    (apply, True),
+                    (features, True)]
+
+
+def compose(stream, l_stages, ordmatch=None):
+    '''
+    Return an iterator that chains the stages passed
+    :param stream: iterator. The first stream, usually from source()
+    :param l_stages: list. tuples (stage, if it needs the order matching)
+    :*param ordmatch: BloombergMatching object. The order matching
+    '''
+    for func_stage, b_needs_ordmatch in l_stages:
+        if b_needs_ordmatch:
+            stream = func_stage(stream, ordmatch)
+        else:
+            stream = func_stage(stream)
+    return stream
+
+
+def threaded(stream, i_maxsize=1024):
+    '''
+    Consume the stream in a separate thread, holding at most i_maxsize items
+    in a queue. Just use it with stages that do not depend on the book. When
+    the consumer stops before the end, as the sessions closed at 16:30 do,
+    the thread stops and closes the stream
+    :param stream: iterator. The stream to be consumed
+    :*param i_maxsize: integer. The size of the queue
+    '''
+    queue = Queue.Queue(maxsize=i_maxsize)
+    stop = threading.Event()
+
+    def _put(obj):
+        # wait for room in the queue while the consumer is still reading
+        while not stop.is_set():
+            try:
+                queue.put(obj, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for obj in stream:
+                if not _put(obj):
+                    return
+            _put(_END)
+        except Exception, e:
+            _put(_StageError(e))
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+    producer = threading.Thread(target=_produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            obj = queue.get()
+            if obj is _END:
+                break
+            if isinstance(obj, _StageError):
+                raise obj.error
+            yield obj
+    finally:
+        # also reached by GeneratorExit, when the consumer drops the stream
+        stop.set()
+
+
+def threaded_parse(stream, i_maxsize=1024):
+    '''
+    Read and parse the rows in a separate thread. It can replace parse() in
+    the stages used by the order matching
+    :param stream: iterator. rows from source()
+    :*param i_maxsize: integer. The size of the queue
+    '''
+    return threaded(parse(stream), i_maxsize)
+
+
+def timed(stream, s_name, d_times):
+    '''
+    Yield the items of the stream, accumulating in d_times the time spent to
+    get them (including the upstream stages)
+    :param stream: iterator. The stream to be measured
+    :param s_name: string. The name of the stage
+    :param d_times: dictionary. Where the seconds elapsed are accumulated
+    '''
+    d_times.setdefault(s_name, 0.)
+    iterator = iter(stream)
+    while True:
+        f_start = time.time()
+        try:
+            obj = iterator.next()
+        except StopIteration:
+            d_times[s_name] += time.time() - f_start
+            return
+        d_times[s_name] += time.time() - f_start
+        yield obj
+
+
+def profile(stream, l_stages, ordmatch=None):
+    '''
+    Return the composed stream wrapped to measure each stage and the
+    dictionary where the times are accumulated. Use stage_times() to get the
+    time spent just in each stage
+    :param stream: iterator. The first stream, usually from source()
+    :param l_stages: list. tuples (stage, if it needs the order matching)
+    :*param ordmatch: BloombergMatching object. The order matching
+    '''
+    d_times = {}
+    stream = timed(stream, 'source', d_times)
+    for func_stage, b_needs_ordmatch in l_stages:
+        stream = compose(stream, [(func_stage, b_needs_ordmatch)], ordmatch)
+        stream = timed(stream, func_stage.__name__, d_times)
+    return stream, d_times
+
+
+def stage_times(d_times, l_names):
+    '''
+    Return a list of (stage, seconds) with the time spent in each stage,
+    removing the time of the stages before it
+    :param d_times: dictionary. The times accumulated by profile()
+    :param l_names: list. The names of the stages, in order
+    '''
+    l_rtn = []
+    f_before = 0.
+    for s_name in l_names:
+        f_total = d_times.get(s_name, 0.)
+        l_rtn.append((s_name, f_total - f_before))
+        f_before = f_total
+    return l_rtn
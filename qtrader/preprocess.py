@@ -11,10 +11,40 @@ Created on 09/01/2016
 import zipfile
 import csv
 import numpy as np
-import pandas as pd
+import os
 import pickle
 import time
 
+import models
+
+# models loaded by the process, shared by all scalers
+d_models = {}
+
+
+def load_model(s_fname):
+    '''
+    Return the object pickled in the file passed. Each file is loaded once by
+    process and the same object is returned to all the callers, so it should
+    not be changed
+    :param s_fname: string. Path to the file
+    '''
+    if s_fname not in d_models:
+        with open(s_fname, 'r') as fr:
+            d_models[s_fname] = pickle.load(fr)
+    return d_models[s_fname]
+
+
+def get_model(s_name):
+    '''
+    Return the model with the name passed. It is read from the archive of
+    models, exported by models.export_models(), when it exists, or from the
+    pickled scikit-learn object
+    :param s_name: string. The name of the model, as in models.d_pickles
+    '''
+    if os.path.exists(models.S_ARCHIVE):
+        return models.get_model(s_name)
+    return load_model(models.d_pickles[s_name])
+
 
 def make_zip_file(s_fname):
     '''
@@ -170,14 +200,14 @@ class ClusterScaler(object):
         '''
         Initialize a Scaler object
         '''
-        self.kmeans = pickle.load(open('data/kmeans.dat', 'r'))
-        self.pca = pickle.load(open('data/pca.dat', 'r'))
+        self.kmeans = get_model('kmeans')
+        self.pca = get_model('pca')
         self.d_scale = {}
-        self.d_scale['OFI'] = pickle.load(open('data/scale_ofi.dat', 'r'))
-        self.d_scale['qBID'] = pickle.load(open('data/scale_qbid.dat', 'r'))
-        scale_aux = pickle.load(open('data/scale_bookratio.dat', 'r'))
+        self.d_scale['OFI'] = get_model('scale_ofi')
+        self.d_scale['qBID'] = get_model('scale_qbid')
+        scale_aux = get_model('scale_bookratio')
         self.d_scale['BOOK_RATIO'] = scale_aux
-        self.d_scale['LOG_RET'] = pickle.load(open('data/logret.dat', 'r'))
+        self.d_scale['LOG_RET'] = get_model('logret')
 
     def transform(self, d_feat):
         '''
@@ -195,7 +225,8 @@ class ClusterScaler(object):
             f_value = np.array([1. * d_data[s_key]]).reshape(1, -1)
             d_data[s_key] = float(self.d_scale[s_key].transform(f_value))
         # aplpy PCA to reduce to two dimensions
-        na_val_pca = pd.Series(d_data).values.reshape(1, -1)
+        na_val_pca = np.array([d_data[s_key] for s_key in sorted(d_data)])
+        na_val_pca = na_val_pca.reshape(1, -1)
         na_val_pca = self.pca.transform(na_val_pca)
         # return the cluster (from 10) using kmeans
         return int(self.kmeans.predict(na_val_pca))
@@ -209,10 +240,10 @@ class LessClustersScaler(object):
         '''
         Initialize a Scaler object
         '''
-        self.kmeans = pickle.load(open('data/kmeans_2.dat', 'r'))
+        self.kmeans = get_model('kmeans_2')
         self.d_scale = {}
-        self.d_scale['OFI'] = pickle.load(open('data/scale_ofi_2.dat', 'r'))
-        scale_aux = pickle.load(open('data/scale_bookratio_2.dat', 'r'))
+        self.d_scale['OFI'] = get_model('scale_ofi_2')
+        scale_aux = get_model('scale_bookratio_2')
         self.d_scale['BOOK_RATIO'] = scale_aux
 
     def transform(self, d_feat):
@@ -234,7 +265,8 @@ class LessClustersScaler(object):
                 d_data[s_key] = 0.
 
         # return the cluster (from 10) using kmeans
-        na_val = pd.Series(d_data).values.reshape(1, -1)
+        na_val = np.array([d_data[s_key] for s_key in sorted(d_data)])
+        na_val = na_val.reshape(1, -1)
         return int(self.kmeans.predict(na_val))
 
 
@@ -247,8 +279,8 @@ class ZeroOneScaler(object):
         Initialize a Scaler object
         '''
         self.d_scale = {}
-        self.d_scale['OFI'] = pickle.load(open('data/scale_ofi.dat', 'r'))
-        scale_aux = pickle.load(open('data/scale_bookratio.dat', 'r'))
+        self.d_scale['OFI'] = get_model('scale_ofi')
+        scale_aux = get_model('scale_bookratio')
         self.d_scale['BOOK_RATIO'] = scale_aux
 
     def transform(self, d_feat):
@@ -275,3 +307,68 @@ class ZeroOneScaler(object):
 
         # return the cluster (from 10) using kmeans
         return l_rtn
+
+
+class TileCoder(object):
+    '''
+    Map the raw inputs of the learner to the active tiles of several offset
+    grids (tile coding). The tiles are hashed to a fixed number of weights,
+    so the representation does not depend on any fitted model
+    '''
+    l_features = ['OFI', 'qBID', 'BOOK_RATIO', 'LOG_RET', 'SPREAD',
+                  'POSITION']
+    # bounds of each feature after the log of qBID and BOOK_RATIO
+    d_bounds = {'OFI': (-5000., 5000.),
+                'qBID': (np.log(100.), np.log(100000.)),
+                'BOOK_RATIO': (-3., 3.),
+                'LOG_RET': (-0.002, 0.002),
+                'SPREAD': (1., 6.),
+                'POSITION': (-100., 100.)}
+
+    def __init__(self, i_tilings=8, i_tiles=8, i_memory=65521, d_bounds=None):
+        '''
+        Initialize a TileCoder object. Save all parameters as attributes
+        :*param i_tilings: integer. Number of offset grids
+        :*param i_tiles: integer. Number of tiles of each feature in a grid
+        :*param i_memory: integer. Number of weights. Should be a prime
+        :*param d_bounds: dictionary. Bounds to replace the default ones
+        '''
+        self.i_tilings = i_tilings
+        self.i_tiles = i_tiles
+        self.i_memory = i_memory
+        d_aux = dict(self.d_bounds)
+        d_aux.update(d_bounds or {})
+        na_bounds = np.array([d_aux[s_key] for s_key in self.l_features])
+        self.na_low = na_bounds[:, 0]
+        self.na_width = (na_bounds[:, 1] - na_bounds[:, 0]) / i_tiles
+        # asymmetric offsets of each grid, as fractions of a tile
+        i_dim = len(self.l_features)
+        na_disp = 2 * np.arange(i_dim) + 1
+        self.na_offsets = (np.arange(i_tilings)[:, None] * na_disp) % i_tilings
+        self.na_offsets = self.na_offsets / float(i_tilings)
+        self.na_strides = (i_tiles + 1) ** np.arange(i_dim, dtype=np.int64)
+        na_aux = np.arange(i_tilings, dtype=np.int64)
+        self.na_tiling_key = na_aux * (i_tiles + 1) ** i_dim
+
+    def transform(self, d_feat, l_flags=()):
+        '''
+        Return the indexes of the weights of the active tiles, one for each
+        grid
+        :param d_feat: dictionary. Original Input data from one instamce
+        :*param l_flags: list. Binary inputs that split all the grids
+        '''
+        na_x = np.array([d_feat['OFI'],
+                         np.log(max(d_feat['qBID'], 1.)),
+                         np.log(max(d_feat['BOOK_RATIO'], 1e-6)),
+                         d_feat['LOG_RET'],
+                         d_feat['SPREAD'],
+                         d_feat['POSITION']])
+        na_x = np.clip((na_x - self.na_low) / self.na_width, 0.,
+                       self.i_tiles - 1e-9)
+        na_coords = (na_x + self.na_offsets).astype(np.int64)
+        na_key = na_coords.dot(self.na_strides) + self.na_tiling_key
+        i_flags = 0
+        for b_flag in l_flags:
+            i_flags = i_flags * 2 + int(bool(b_flag))
+        na_key = na_key * (1 << len(l_flags)) + i_flags
+        return (na_key * 2654435761) % self.i_memory
@@ -0,0 +1,669 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Helpers to handle the Q-tables of the learning agents as NumPy arrays, mapping
+states and actions to integer indexes
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import ast
+from collections import defaultdict
+import hashlib
+import json
+import os
+import struct
+import sys
+import numpy as np
+
+
+'''
+Begin help functions
+'''
+
+
+class InvalidQTableException(Exception):
+    """
+    InvalidQTableException is raised by read_header() when the file passed is
+    not a binary Q-table
+    """
+    pass
+
+
+# the actions in the same order of Environment.valid_actions
+l_actions = [None, 'BEST_BID', 'BEST_OFFER', 'BEST_BOTH', 'SELL', 'BUY']
+d_action_idx = dict((s_action, i) for i, s_action in enumerate(l_actions))
+N_ACTIONS = len(l_actions)
+ALL_ACTIONS_MASK = (1 << N_ACTIONS) - 1
+# added to the position when packing a state, so it is not negative
+POSITION_OFFSET = 1 << 31
+
+
+def actions_to_mask(l_valid_actions):
+    '''
+    Return an integer whose bits flag the actions passed
+    :param l_valid_actions: list. The actions allowed
+    '''
+    i_mask = 0
+    for s_action in l_valid_actions:
+        i_mask |= 1 << d_action_idx[s_action]
+    return i_mask
+
+
+def pack_state(d_state):
+    '''
+    Return the state of a learning agent packed in an integer: the cluster,
+    the position (in shares) and the flags of orders at the best prices
+    :param d_state: dictionary. cluster, Position, best_bid and best_offer
+    '''
+    i_key = (int(d_state['cluster']) << 32) | \
+        (int(round(d_state['Position'])) + POSITION_OFFSET)
+    i_key = (i_key << 2) | (bool(d_state['best_bid']) << 1)
+    return i_key | bool(d_state['best_offer'])
+
+
+def state_to_str(i_key):
+    '''
+    Return the string used to save the state packed in the integer passed,
+    equal to the str() of the state dictionary of the agent
+    :param i_key: integer. The state packed by pack_state()
+    '''
+    d_state = {}
+    d_state['cluster'] = i_key >> 34
+    d_state['Position'] = float(((i_key >> 2) & 0xffffffff) - POSITION_OFFSET)
+    d_state['best_bid'] = bool((i_key >> 1) & 1)
+    d_state['best_offer'] = bool(i_key & 1)
+    return str(d_state)
+
+
+def str_to_state(s_state):
+    '''
+    Return the integer that packs the state saved as the string passed
+    :param s_state: string. The str() of the state dictionary of the agent
+    '''
+    return pack_state(ast.literal_eval(s_state))
+
+
+def masks_to_bool(na_mask):
+    '''
+    Return a boolean matrix (n x N_ACTIONS) from an array of bit masks
+    :param na_mask: numpy array. bit masks of the valid actions
+    '''
+    na_bits = np.arange(N_ACTIONS)
+    return ((np.asarray(na_mask)[:, None] >> na_bits) & 1).astype(bool)
+
+
+def dense_rows(q_table, indexer, na_states):
+    '''
+    Return a matrix with the Q-values of the states passed. Actions not visited
+    are filled with NaN. Reading the table does not create new entries
+    :param q_table: dictionary. The Q-table of an agent
+    :param indexer: StateIndexer object. Map from indexes to states
+    :param na_states: numpy array. indexes of the states desired
+    '''
+    if isinstance(q_table, HashedQStore):
+        return q_table.dense_rows([indexer[i_state] for i_state in na_states])
+    na_q = np.empty((len(na_states), N_ACTIONS))
+    na_q.fill(np.nan)
+    for i_row, i_state in enumerate(na_states):
+        d_row = q_table.get(indexer[i_state])
+        if not d_row:
+            continue
+        for s_action, f_val in d_row.iteritems():
+            na_q[i_row, d_action_idx[s_action]] = f_val
+    return na_q
+
+
+def max_q(na_q, na_mask=None):
+    '''
+    Return the maximum Q-value of each row, considering just the actions
+    already visited and allowed by the masks. Rows without any of them are 0.
+    :param na_q: numpy array. Q-values, NaN where the action was not visited
+    :*param na_mask: numpy array. bit masks of the valid actions in each row
+    '''
+    na_aux = na_q.copy()
+    if na_mask is not None:
+        na_aux[~masks_to_bool(na_mask)] = np.nan
+    na_valid = ~np.isnan(na_aux)
+    na_aux[~na_valid] = -np.inf
+    na_rtn = na_aux.max(axis=1)
+    na_rtn[~na_valid.any(axis=1)] = 0.
+    return na_rtn
+
+
+'''
+End help functions
+'''
+
+
+class StateIndexer(object):
+    '''
+    Map the keys of the states used in the Q-tables to integer indexes, and
+    back
+    '''
+
+    def __init__(self):
+        '''
+        Initialize a StateIndexer object
+        '''
+        self.d_idx = {}
+        self.l_states = []
+
+    def get(self, s_state):
+        '''
+        Return the index of the state passed, including it if it is needed
+        :param s_state: string or integer. The key of the state
+        '''
+        try:
+            return self.d_idx[s_state]
+        except KeyError:
+            i_idx = len(self.l_states)
+            self.d_idx[s_state] = i_idx
+            self.l_states.append(s_state)
+            return i_idx
+
+    def find(self, s_state):
+        '''
+        Return the index of the state passed or -1 if it was not included
+        :param s_state: string or integer. The key of the state
+        '''
+        return self.d_idx.get(s_state, -1)
+
+    def __getitem__(self, i_idx):
+        '''
+        Return the state related to the index passed
+        :param i_idx: integer. The index of the state
+        '''
+        return self.l_states[i_idx]
+
+    def __len__(self):
+        '''
+        Return the number of states indexed
+        '''
+        return len(self.l_states)
+
+
+class _QRow(object):
+    '''
+    A view of the Q-values of a state in a HashedQStore that behaves like the
+    inner dictionaries of the Q-tables. Missing actions read as 0. and the
+    state is just included in the store when a value is written
+    '''
+
+    def __init__(self, store, state):
+        '''
+        Initialize a _QRow object. Save all parameters as attributes
+        :param store: HashedQStore object. The store of the values
+        :param state: integer. The state packed by pack_state()
+        '''
+        self.store = store
+        self.state = state
+
+    def _values(self):
+        '''
+        Return the array with the Q-values of the state or None
+        '''
+        i_row = self.store.find(self.state)
+        if i_row < 0:
+            return None
+        return self.store.na_q[i_row]
+
+    def __getitem__(self, s_action):
+        '''
+        Return the Q-value of the action or 0. if it was not visited
+        :param s_action: string. The action
+        '''
+        na_row = self._values()
+        if na_row is None:
+            return 0.
+        f_val = na_row[d_action_idx[s_action]]
+        if f_val != f_val:
+            return 0.
+        return float(f_val)
+
+    def __setitem__(self, s_action, f_val):
+        '''
+        Set the Q-value of the action, including the state if it is needed
+        :param s_action: string. The action
+        :param f_val: float. The new Q-value
+        '''
+        i_row = self.store.insert(self.state)
+        self.store.na_q[i_row, d_action_idx[s_action]] = f_val
+
+    def get(self, s_action, default=None):
+        '''
+        Return the Q-value of the action or default if it was not visited
+        :param s_action: string. The action
+        :*param default: object. The value returned for missing actions
+        '''
+        na_row = self._values()
+        if na_row is None or np.isnan(na_row[d_action_idx[s_action]]):
+            return default
+        return float(na_row[d_action_idx[s_action]])
+
+    def iteritems(self):
+        '''
+        Return an iterator over the actions visited and their Q-values
+        '''
+        na_row = self._values()
+        if na_row is None:
+            return iter([])
+        return iter([(l_actions[i], float(na_row[i]))
+                     for i in np.flatnonzero(~np.isnan(na_row))])
+
+    def items(self):
+        '''
+        Return a list of the actions visited and their Q-values
+        '''
+        return list(self.iteritems())
+
+    def keys(self):
+        '''
+        Return a list of the actions visited
+        '''
+        return [s_action for s_action, f_val in self.iteritems()]
+
+    def values(self):
+        '''
+        Return a list of the Q-values of the actions visited
+        '''
+        return [f_val for s_action, f_val in self.iteritems()]
+
+    def __iter__(self):
+        '''
+        Return an iterator over the actions visited
+        '''
+        return iter(self.keys())
+
+    def __contains__(self, s_action):
+        '''
+        Return if the action was visited
+        :param s_action: string. The action
+        '''
+        return self.get(s_action) is not None
+
+    def __len__(self):
+        '''
+        Return the number of actions visited
+        '''
+        na_row = self._values()
+        if na_row is None:
+            return 0
+        return int((~np.isnan(na_row)).sum())
+
+
+class HashedQStore(object):
+    '''
+    A compact Q-table. The states, packed in integers by pack_state(), are
+    kept in a hash table with open addressing (linear probing) and the
+    Q-values in a dense matrix with a fixed column for each action, NaN when
+    the action was not visited. It can be used in place of the dictionaries
+    of dictionaries and reading it does not include new states. The states
+    are converted from and to strings just when the table is saved or loaded
+    '''
+    f_max_load = 0.5
+
+    def __init__(self, i_capacity=1024):
+        '''
+        Initialize a HashedQStore object
+        :*param i_capacity: integer. Number of states expected
+        '''
+        i_slots = 8
+        while i_slots * self.f_max_load < i_capacity:
+            i_slots *= 2
+        self.na_hash = np.zeros(i_slots, dtype=np.int64)
+        self.na_row = np.empty(i_slots, dtype=np.int32)
+        self.na_row.fill(-1)
+        self.na_q = np.empty((max(i_capacity, 1), N_ACTIONS))
+        self.na_q.fill(np.nan)
+        self.l_states = []
+
+    @classmethod
+    def from_table(cls, q_table, i_capacity=None):
+        '''
+        Return a HashedQStore with the values of a Q-table. The states saved
+        as strings are packed in integers
+        :param q_table: dictionary. A Q-table or a table of visits
+        :*param i_capacity: integer. Number of states expected
+        '''
+        store = cls(i_capacity or max(len(q_table), 1024))
+        for state, d_row in q_table.iteritems():
+            if isinstance(state, basestring):
+                state = str_to_state(state)
+            for s_action, f_val in d_row.iteritems():
+                store[state][s_action] = f_val
+        return store
+
+    def _slot(self, state, i_hash):
+        '''
+        Return the slot of the state in the hash table or the empty slot where
+        it should be included
+        :param state: integer. The state packed by pack_state()
+        :param i_hash: integer. The hash of the state
+        '''
+        i_mask = len(self.na_hash) - 1
+        i_slot = i_hash & i_mask
+        while True:
+            i_row = self.na_row[i_slot]
+            if i_row < 0:
+                return i_slot
+            if self.na_hash[i_slot] == i_hash and \
+               self.l_states[i_row] == state:
+                return i_slot
+            i_slot = (i_slot + 1) & i_mask
+
+    def find(self, state):
+        '''
+        Return the row of the state passed or -1 if it was not included
+        :param state: integer. The state packed by pack_state()
+        '''
+        return int(self.na_row[self._slot(state, hash(state))])
+
+    def insert(self, state):
+        '''
+        Return the row of the state passed, including it if it is needed
+        :param state: integer. The state packed by pack_state()
+        '''
+        i_hash = hash(state)
+        i_slot = self._slot(state, i_hash)
+        i_row = self.na_row[i_slot]
+        if i_row >= 0:
+            return int(i_row)
+        i_row = len(self.l_states)
+        if i_row + 1 > len(self.na_hash) * self.f_max_load:
+            self._grow_slots()
+            i_slot = self._slot(state, i_hash)
+        if i_row == len(self.na_q):
+            na_aux = np.empty(self.na_q.shape)
+            na_aux.fill(np.nan)
+            self.na_q = np.concatenate([self.na_q, na_aux])
+        self.na_hash[i_slot] = i_hash
+        self.na_row[i_slot] = i_row
+        self.l_states.append(state)
+        return i_row
+
+    def _grow_slots(self):
+        '''
+        Double the size of the hash table, including the states again
+        '''
+        i_slots = len(self.na_hash) * 2
+        self.na_hash = np.zeros(i_slots, dtype=np.int64)
+        self.na_row = np.empty(i_slots, dtype=np.int32)
+        self.na_row.fill(-1)
+        for i_row, state in enumerate(self.l_states):
+            i_hash = hash(state)
+            i_slot = self._slot(state, i_hash)
+            self.na_hash[i_slot] = i_hash
+            self.na_row[i_slot] = i_row
+
+    def __getitem__(self, state):
+        '''
+        Return a view of the Q-values of the state. It is just included in
+        the store when a value is written
+        :param state: integer. The state packed by pack_state()
+        '''
+        return _QRow(self, state)
+
+    def get(self, state, default=None):
+        '''
+        Return a view of the Q-values of the state or default if it was not
+        included
+        :param state: integer. The state packed by pack_state()
+        :*param default: object. The value returned for missing states
+        '''
+        if self.find(state) < 0:
+            return default
+        return _QRow(self, state)
+
+    def __contains__(self, state):
+        '''
+        Return if the state was included
+        :param state: integer. The state packed by pack_state()
+        '''
+        return self.find(state) >= 0
+
+    def __len__(self):
+        '''
+        Return the number of states included
+        '''
+        return len(self.l_states)
+
+    def __iter__(self):
+        '''
+        Return an iterator over the states, in the order they were included
+        '''
+        return iter(self.l_states)
+
+    def keys(self):
+        '''
+        Return a list of the states, in the order they were included
+        '''
+        return list(self.l_states)
+
+    def iteritems(self):
+        '''
+        Yield each state and a view of its Q-values
+        '''
+        for state in self.l_states:
+            yield state, _QRow(self, state)
+
+    def items(self):
+        '''
+        Return a list of the states and the views of their Q-values
+        '''
+        return list(self.iteritems())
+
+    def dense_rows(self, l_keys):
+        '''
+        Return a matrix with the Q-values of the states passed, NaN where the
+        action was not visited or the state is unknown
+        :param l_keys: list. The keys of the states desired
+        '''
+        na_idx = np.array([self.find(state) for state in l_keys], dtype=int)
+        na_rtn = self.na_q[np.maximum(na_idx, 0)]
+        na_rtn[na_idx < 0] = np.nan
+        return na_rtn
+
+    def nbytes(self):
+        '''
+        Return an estimate of the memory used by the store, in bytes
+        '''
+        i_rtn = self.na_hash.nbytes + self.na_row.nbytes + self.na_q.nbytes
+        i_rtn += sys.getsizeof(self.l_states)
+        i_rtn += sum(sys.getsizeof(state) for state in self.l_states)
+        return i_rtn
+
+
+# binary Q-table format: magic, header length, JSON header and a float64
+# payload (n_states x N_ACTIONS) aligned, so it can be memory-mapped
+QTB_MAGIC = 'QTBL0001'
+QTB_ALIGN = 64
+
+
+def qtable_to_arrays(q_table):
+    '''
+    Return the list of states and a matrix with the Q-values of each one.
+    Actions not visited are filled with NaN
+    :param q_table: dictionary. The Q-table of an agent
+    '''
+    if isinstance(q_table, HashedQStore):
+        d_names = dict((state_to_str(i_key), i_key) for i_key in q_table)
+        l_states = sorted(d_names)
+        na_q = q_table.dense_rows([d_names[s_state] for s_state in l_states])
+        return l_states, na_q
+    l_states = sorted(q_table.keys())
+    na_q = np.empty((len(l_states), N_ACTIONS))
+    na_q.fill(np.nan)
+    for i_row, s_state in enumerate(l_states):
+        for s_action, f_val in q_table[s_state].iteritems():
+            na_q[i_row, d_action_idx[s_action]] = f_val
+    return l_states, na_q
+
+
+def arrays_to_qtable(l_states, na_q, q_table=None):
+    '''
+    Fill a Q-table (a dictionary of dictionaries) with the values passed,
+    skipping the actions not visited (NaN). Return the Q-table
+    :param l_states: list. The states related to each row of na_q
+    :param na_q: numpy array. Q-values of each state and action
+    :*param q_table: dictionary. A Q-table to be updated
+    '''
+    if q_table is None:
+        q_table = defaultdict(lambda: defaultdict(float))
+    if isinstance(q_table, HashedQStore):
+        l_states = [str_to_state(state) if isinstance(state, basestring)
+                    else state for state in l_states]
+    na_row, na_col = np.nonzero(~np.isnan(na_q))
+    for i_row, i_col in zip(na_row, na_col):
+        f_val = float(na_q[i_row, i_col])
+        q_table[l_states[i_row]][l_actions[i_col]] = f_val
+    return q_table
+
+
+def _digest(l_states, na_q):
+    '''
+    Return a hash of the content of a Q-table
+    :param l_states: list. The states related to each row of na_q
+    :param na_q: numpy array. Q-values of each state and action
+    '''
+    obj_md5 = hashlib.md5()
+    obj_md5.update(json.dumps(l_states))
+    obj_md5.update(np.ascontiguousarray(na_q, dtype='<f8').tostring())
+    return obj_md5.hexdigest()
+
+
+def read_header(s_fname):
+    '''
+    Return the header of a binary Q-table and the offset of its payload
+    :param s_fname: string. Path to the file
+    '''
+    with open(s_fname, 'rb') as fr:
+        s_magic = fr.read(len(QTB_MAGIC))
+        if s_magic != QTB_MAGIC:
+            s_err = '{} is not a binary Q-table'.format(s_fname)
+            raise InvalidQTableException(s_err)
+        i_len = struct.unpack('<Q', fr.read(8))[0]
+        d_header = json.loads(fr.read(i_len))
+    i_offset = len(QTB_MAGIC) + 8 + i_len
+    return d_header, i_offset
+
+
+def save_qtable(s_fname, q_table, d_params=None, s_encoding='str'):
+    '''
+    Save the Q-table in the binary format. The file is not written again if
+    the digest in its header is the one of the table. Return if it was
+    written
+    :param s_fname: string. Path to the file
+    :param q_table: dictionary. The Q-table of an agent
+    :*param d_params: dictionary. Hyperparameters of the agent to keep
+    :*param s_encoding: string. How the states are represented
+    '''
+    l_states, na_q = qtable_to_arrays(q_table)
+    s_digest = _digest(l_states, na_q)
+    # the file can be written by other processes, so check its own header
+    if os.path.exists(s_fname):
+        try:
+            if read_header(s_fname)[0]['digest'] == s_digest:
+                return False
+        except (InvalidQTableException, ValueError, KeyError, struct.error):
+            pass
+    d_header = {'version': 1,
+                'state_encoding': s_encoding,
+                'states': l_states,
+                'actions': l_actions,
+                'shape': list(na_q.shape),
+                'dtype': '<f8',
+                'params': d_params or {},
+                'digest': s_digest}
+    s_header = json.dumps(d_header)
+    # pad the header so the payload starts aligned
+    i_start = len(QTB_MAGIC) + 8 + len(s_header)
+    s_header += ' ' * ((-i_start) % QTB_ALIGN)
+    with open(s_fname, 'wb') as fw:
+        fw.write(QTB_MAGIC)
+        fw.write(struct.pack('<Q', len(s_header)))
+        fw.write(s_header)
+        fw.write(np.ascontiguousarray(na_q, dtype='<f8').tostring())
+    return True
+
+
+def load_qtable(s_fname, b_mmap=False):
+    '''
+    Return the header and the Q-values of a binary Q-table. The callers that
+    use just some rows of the arrays can memory-map the values from the file
+    :param s_fname: string. Path to the file
+    :*param b_mmap: boolean. If should memory-map the payload
+    '''
+    d_header, i_offset = read_header(s_fname)
+    t_shape = tuple(d_header['shape'])
+    if t_shape[0] == 0:
+        return d_header, np.zeros(t_shape)
+    if b_mmap:
+        na_q = np.memmap(s_fname, dtype=d_header['dtype'], mode='r',
+                         offset=i_offset, shape=t_shape)
+    else:
+        with open(s_fname, 'rb') as fr:
+            fr.seek(i_offset)
+            na_q = np.fromfile(fr, dtype=d_header['dtype'])
+        na_q = na_q.reshape(t_shape)
+    return d_header, na_q
+
+
+def read_legacy_qtable(s_fname):
+    '''
+    Return a Q-table from the tab-separated files used previously
+    :param s_fname: string. Path to the file
+    '''
+    import pandas as pd
+    q_table = defaultdict(lambda: defaultdict(float))
+    df_qtable = pd.read_csv(s_fname, sep='\t', index_col=0)
+    for s_idx, row in df_qtable.iterrows():
+        for s_key, f_val in row.iteritems():
+            if not np.isnan(f_val):
+                if s_key == 'Unnamed: 1':
+                    s_key = None
+                q_table[s_idx][s_key] = f_val
+    return q_table
+
+
+def write_legacy_qtable(s_fname, q_table):
+    '''
+    Save a Q-table in the tab-separated format used previously
+    :param s_fname: string. Path to the file
+    :param q_table: dictionary. The Q-table of an agent
+    '''
+    import pandas as pd
+    pd.DataFrame(q_table).T.to_csv(s_fname, sep='\t')
+
+
+def convert_log_to_bin(s_log, s_bin, d_params=None):
+    '''
+    Convert a Q-table in the tab-separated format to the binary one
+    :param s_log: string. Path to the tab-separated file
+    :param s_bin: string. Path to the binary file
+    :*param d_params: dictionary. Hyperparameters of the agent to keep
+    '''
+    save_qtable(s_bin, read_legacy_qtable(s_log), d_params=d_params)
+
+
+def convert_bin_to_log(s_bin, s_log):
+    '''
+    Convert a Q-table in the binary format to the tab-separated one
+    :param s_bin: string. Path to the binary file
+    :param s_log: string. Path to the tab-separated file
+    '''
+    d_header, na_q = load_qtable(s_bin)
+    q_table = arrays_to_qtable(d_header['states'], na_q)
+    write_legacy_qtable(s_log, q_table)
+
+
+def read_qtable(s_fname):
+    '''
+    Return a Q-table from a binary or a tab-separated file (.log)
+    :param s_fname: string. Path to the file
+    '''
+    if s_fname.endswith('.log'):
+        return read_legacy_qtable(s_fname)
+    d_header, na_q = load_qtable(s_fname)
+    return arrays_to_qtable(d_header['states'], na_q)
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a columnar recorder of the PnL and the position of an agent over a
+session. The values are written in preallocated NumPy arrays and saved as a
+typed array at the end of each session
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import glob
+import os
+import numpy as np
+
+'''
+Begin help functions
+'''
+
+# the columns recorded and their types
+l_series_dtype = [('time', np.int32),
+                  ('position', np.float64),
+                  ('bid', np.float64),
+                  ('ask', np.float64),
+                  ('mid', np.float64),
+                  ('pnl', np.float64),
+                  ('reward', np.float64)]
+
+
+def series_fname(s_dir, s_agent, s_phase, i_trial, i_session):
+    '''
+    Return the path of the file of a session
+    :param s_dir: string. Folder of the files
+    :param s_agent: string. The name of the agent
+    :param s_phase: string. 'train' or 'test'
+    :param i_trial: integer. id of the trial
+    :param i_session: integer. id of the session in the trial
+    '''
+    s_fname = '{}_{}_{:04d}_{:03d}.npz'.format(s_agent, s_phase, i_trial,
+                                               i_session)
+    return os.path.join(s_dir, s_fname)
+
+
+def list_series(s_dir, s_agent, s_phase='*'):
+    '''
+    Return the paths of the files of the agent, in order
+    :param s_dir: string. Folder of the files
+    :param s_agent: string. The name of the agent
+    :*param s_phase: string. 'train', 'test' or '*' for both
+    '''
+    s_pattern = os.path.join(s_dir, '{}_{}_*.npz'.format(s_agent, s_phase))
+    return sorted(glob.glob(s_pattern))
+
+
+def load_series(s_fname):
+    '''
+    Return the structured array and the information about the session saved
+    in the file passed
+    :param s_fname: string. Path to the file
+    '''
+    with np.load(s_fname) as d_load:
+        na_series = d_load['series']
+        d_info = {'agent': str(d_load['agent']),
+                  'phase': str(d_load['phase']),
+                  'trial': int(d_load['trial']),
+                  'session': int(d_load['session']),
+                  'date': str(d_load['date'])}
+    return na_series, d_info
+
+
+'''
+End help functions
+'''
+
+
+class SeriesRecorder(object):
+    '''
+    Keep the time series of the position, the cash legs, the mid price, the
+    PnL and the reward of an agent in preallocated columns
+    '''
+
+    def __init__(self, i_capacity=8192):
+        '''
+        Initialize a SeriesRecorder object
+        :*param i_capacity: integer. Initial number of rows
+        '''
+        self.i_size = 0
+        self.d_columns = {}
+        for s_col, dtype in l_series_dtype:
+            self.d_columns[s_col] = np.zeros(i_capacity, dtype=dtype)
+        # keep the arrays in the order of the append parameters
+        self.l_arrays = [self.d_columns[s_col] for s_col, _ in l_series_dtype]
+
+    def _grow(self):
+        '''
+        Double the size of the columns
+        '''
+        for s_col, dtype in l_series_dtype:
+            na_old = self.d_columns[s_col]
+            self.d_columns[s_col] = np.concatenate([na_old,
+                                                    np.zeros_like(na_old)])
+        self.l_arrays = [self.d_columns[s_col] for s_col, _ in l_series_dtype]
+
+    def append(self, i_time, f_position, f_bid, f_ask, f_mid, f_pnl,
+               f_reward):
+        '''
+        Include a row in the series
+        :param i_time: integer. Seconds since midnight
+        :param f_position: float. The position of the agent
+        :param f_bid: float. The cash spent buying
+        :param f_ask: float. The cash received selling
+        :param f_mid: float. The mid price used to mark the position
+        :param f_pnl: float. The PnL of the agent
+        :param f_reward: float. The reward of the last action
+        '''
+        i_pos = self.i_size
+        if i_pos == len(self.l_arrays[0]):
+            self._grow()
+        na_time, na_pos, na_bid, na_ask, na_mid, na_pnl, na_rwd = \
+            self.l_arrays
+        na_time[i_pos] = i_time
+        na_pos[i_pos] = f_position
+        na_bid[i_pos] = f_bid
+        na_ask[i_pos] = f_ask
+        na_mid[i_pos] = f_mid
+        na_pnl[i_pos] = f_pnl
+        na_rwd[i_pos] = f_reward
+        self.i_size = i_pos + 1
+
+    def to_array(self):
+        '''
+        Return a structured array with the rows recorded
+        '''
+        na_rtn = np.empty(self.i_size, dtype=l_series_dtype)
+        for s_col, _ in l_series_dtype:
+            na_rtn[s_col] = self.d_columns[s_col][:self.i_size]
+        return na_rtn
+
+    def flush(self, s_fname, d_info):
+        '''
+        Save the rows recorded and the information about the session passed,
+        then clear the recorder
+        :param s_fname: string. Path to the file
+        :param d_info: dictionary. agent, phase, trial, session and date
+        '''
+        s_dir = os.path.dirname(s_fname)
+        if s_dir and not os.path.exists(s_dir):
+            os.makedirs(s_dir)
+        np.savez(s_fname, series=self.to_array(), **d_info)
+        self.i_size = 0
+
+    def __len__(self):
+        '''
+        Return the number of rows recorded
+        '''
+        return self.i_size
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a compact registry of the agents in the Environment. The state of
+each agent is held in preallocated NumPy arrays indexed by a slot number
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+
+'''
+Begin help functions
+'''
+
+
+class UnknownAgentException(Exception):
+    """
+    UnknownAgentException is raised by the AgentRegistry when it is asked for
+    an agent id that was not registered
+    """
+    pass
+
+
+'''
+End help functions
+'''
+
+
+class AgentState(object):
+    '''
+    A view over the slot of one agent in the AgentRegistry. It behaves like the
+    dictionary previously used to hold the agent state, but all the values
+    live in the arrays of the registry
+    '''
+    __slots__ = ['registry', 'i_slot']
+
+    def __init__(self, registry, i_slot):
+        '''
+        Initialize an AgentState object. Save all parameters as attributes
+        :param registry: AgentRegistry object. The owner of the data
+        :param i_slot: integer. The slot of the agent in the registry
+        '''
+        self.registry = registry
+        self.i_slot = i_slot
+
+    def __getitem__(self, s_key):
+        '''
+        Return the value of the column s_key of the agent
+        :param s_key: string. The name of the information desired
+        '''
+        if s_key == 'Agent':
+            return self.registry.l_agents[self.i_slot]
+        return self.registry.d_columns[s_key][self.i_slot].item()
+
+    def __setitem__(self, s_key, value):
+        '''
+        Set the value of the column s_key of the agent
+        :param s_key: string. The name of the information to change
+        :param value: float or boolean. The new value
+        '''
+        self.registry.d_columns[s_key][self.i_slot] = value
+
+    def __contains__(self, s_key):
+        '''
+        Return if s_key is a valid information of the agent state
+        :param s_key: string. The name of the information
+        '''
+        return s_key == 'Agent' or s_key in self.registry.d_columns
+
+    def keys(self):
+        '''
+        Return the names of the information held by the view
+        '''
+        return self.registry.l_columns + self.registry.l_flags + ['Agent']
+
+    def to_dict(self):
+        '''
+        Return a copy of the agent state as a dictionary
+        '''
+        return dict((s_key, self[s_key]) for s_key in self.keys())
+
+    def __repr__(self):
+        '''
+        Return the representation of the agent state
+        '''
+        return repr(self.to_dict())
+
+
+class AgentRegistry(object):
+    '''
+    Map agent ids to slots in preallocated arrays holding the position and
+    flags of each agent. Lookups by the agent id are O(1) and no dictionary is
+    allocated per message
+    '''
+    l_columns = ['qBid', 'Bid', 'Ask', 'qAsk', 'Position', 'Pnl']
+    l_flags = ['best_bid', 'best_offer']
+
+    def __init__(self, i_capacity=16):
+        '''
+        Initialize an AgentRegistry object. Save all parameters as attributes
+        :*param i_capacity: integer. Number of slots allocated at start
+        '''
+        self.i_capacity = max(1, int(i_capacity))
+        self.i_size = 0
+        self.d_slot = {}
+        self.l_agents = []
+        self.l_views = []
+        self.d_columns = {}
+        for s_key in self.l_columns:
+            self.d_columns[s_key] = np.zeros(self.i_capacity, dtype=np.float64)
+        for s_key in self.l_flags:
+            self.d_columns[s_key] = np.zeros(self.i_capacity, dtype=np.bool_)
+
+    def _grow(self):
+        '''
+        Double the capacity of the arrays, keeping the current data
+        '''
+        i_new = self.i_capacity * 2
+        for s_key, na_old in self.d_columns.iteritems():
+            na_new = np.zeros(i_new, dtype=na_old.dtype)
+            na_new[:self.i_capacity] = na_old
+            self.d_columns[s_key] = na_new
+        self.i_capacity = i_new
+
+    def _get_id(self, obj):
+        '''
+        Return the agent id of the object passed
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        return getattr(obj, 'i_id', obj)
+
+    def add(self, agent):
+        '''
+        Include the agent in the registry and return its slot. If the id was
+        already registered, the agent replaces the old one and its slot is
+        cleaned up
+        :param agent: Agent object. The agent to be included
+        '''
+        i_id = agent.i_id
+        if i_id in self.d_slot:
+            i_slot = self.d_slot[i_id]
+            self.l_agents[i_slot] = agent
+        else:
+            if self.i_size == self.i_capacity:
+                self._grow()
+            i_slot = self.i_size
+            self.d_slot[i_id] = i_slot
+            self.l_agents.append(agent)
+            self.l_views.append(AgentState(self, i_slot))
+            self.i_size += 1
+        self.clear_slot(i_slot)
+        return i_slot
+
+    def remove(self, obj):
+        '''
+        Exclude the agent passed from the registry. The last agent is moved to
+        its slot, so the slots in use stay contiguous
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        i_slot = self.slot(obj)
+        i_last = self.i_size - 1
+        if i_slot != i_last:
+            agent = self.l_agents[i_last]
+            self.l_agents[i_slot] = agent
+            self.d_slot[agent.i_id] = i_slot
+            for na_col in self.d_columns.itervalues():
+                na_col[i_slot] = na_col[i_last]
+        del self.d_slot[self._get_id(obj)]
+        self.l_agents.pop()
+        self.l_views.pop()
+        self.clear_slot(i_last)
+        self.i_size -= 1
+
+    def clear_slot(self, i_slot):
+        '''
+        Set to zero all the information related to the slot passed
+        :param i_slot: integer. The slot to be cleaned up
+        '''
+        for na_col in self.d_columns.itervalues():
+            na_col[i_slot] = 0
+
+    def reset(self):
+        '''
+        Set to zero the information of all agents at once
+        '''
+        for na_col in self.d_columns.itervalues():
+            na_col[:self.i_size] = 0
+
+    def slot(self, obj):
+        '''
+        Return the slot of the agent passed
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        try:
+            return self.d_slot[self._get_id(obj)]
+        except KeyError:
+            raise UnknownAgentException('Unknown agent {}'.format(obj))
+
+    def get_agent(self, obj):
+        '''
+        Return the agent related to the id passed
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        return self.l_agents[self.slot(obj)]
+
+    def column(self, s_key):
+        '''
+        Return the array with the information s_key of all agents registered
+        :param s_key: string. The name of the information desired
+        '''
+        return self.d_columns[s_key][:self.i_size]
+
+    def iterkeys(self):
+        '''
+        Return an iterator over the agents registered
+        '''
+        return iter(self.l_agents)
+
+    def __iter__(self):
+        '''
+        Return an iterator over the agents registered
+        '''
+        return iter(self.l_agents)
+
+    def __len__(self):
+        '''
+        Return the number of agents registered
+        '''
+        return self.i_size
+
+    def __contains__(self, obj):
+        '''
+        Return if the agent passed was registered
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        return self._get_id(obj) in self.d_slot
+
+    def __getitem__(self, obj):
+        '''
+        Return the view to the state of the agent passed
+        :param obj: Agent object or integer. The agent or its id
+        '''
+        return self.l_views[self.slot(obj)]
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement an experience replay buffer to be used by the learning agents. All
+transitions are held in preallocated NumPy arrays used as a ring buffer
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+
+class ExperienceReplay(object):
+    '''
+    A ring buffer of transitions (state, action, reward, next state, valid
+    actions in the next state) that can be sampled uniformly or proportionally
+    to the last TD-error of each transition
+    '''
+
+    def __init__(self, i_capacity=10000, b_prioritized=False, f_alpha=0.6,
+                 f_beta=0.4, f_eps=1e-3, i_seed=None):
+        '''
+        Initialize an ExperienceReplay object. Save all parameters as
+        attributes
+        :*param i_capacity: integer. Maximum number of transitions held
+        :*param b_prioritized: boolean. If should use prioritized sampling
+        :*param f_alpha: float. How much prioritization is used (0 = uniform)
+        :*param f_beta: float. Compensation of the bias of the prioritization
+        :*param f_eps: float. Minimum priority of a transition
+        :*param i_seed: integer. Seed of the random number generator
+        '''
+        self.i_capacity = i_capacity
+        self.b_prioritized = b_prioritized
+        self.f_alpha = f_alpha
+        self.f_beta = f_beta
+        self.f_eps = f_eps
+        self.rng = np.random.RandomState(i_seed)
+        self.i_pos = 0
+        self.i_size = 0
+        self.f_max_priority = 1.
+        self.na_state = np.zeros(i_capacity, dtype=np.int64)
+        self.na_action = np.zeros(i_capacity, dtype=np.int8)
+        self.na_reward = np.zeros(i_capacity, dtype=np.float64)
+        self.na_next_state = np.zeros(i_capacity, dtype=np.int64)
+        self.na_mask = np.zeros(i_capacity, dtype=np.int16)
+        self.na_priority = np.zeros(i_capacity, dtype=np.float64)
+
+    def add(self, i_state, i_action, f_reward, i_next_state, i_mask):
+        '''
+        Include a transition in the buffer, overwriting the oldest one when it
+        is full
+        :param i_state: integer. The index of the state
+        :param i_action: integer. The index of the action taken
+        :param f_reward: float. The reward received
+        :param i_next_state: integer. The index of the state reached
+        :param i_mask: integer. Bit mask of the actions valid in next state
+        '''
+        i_pos = self.i_pos
+        self.na_state[i_pos] = i_state
+        self.na_action[i_pos] = i_action
+        self.na_reward[i_pos] = f_reward
+        self.na_next_state[i_pos] = i_next_state
+        self.na_mask[i_pos] = i_mask
+        # new transitions should be replayed at least once
+        self.na_priority[i_pos] = self.f_max_priority
+        self.i_pos = (i_pos + 1) % self.i_capacity
+        self.i_size = min(self.i_size + 1, self.i_capacity)
+
+    def sample(self, i_batch_size):
+        '''
+        Return the positions of a mini-batch of transitions and the importance
+        sampling weights of each one
+        :param i_batch_size: integer. Number of transitions desired
+        '''
+        i_size = self.i_size
+        if not self.b_prioritized:
+            na_idx = self.rng.randint(0, i_size, i_batch_size)
+            return na_idx, np.ones(i_batch_size)
+        na_prob = self.na_priority[:i_size] ** self.f_alpha
+        na_prob /= na_prob.sum()
+        na_idx = self.rng.choice(i_size, i_batch_size, p=na_prob)
+        na_weight = (i_size * na_prob[na_idx]) ** (-self.f_beta)
+        na_weight /= na_weight.max()
+        return na_idx, na_weight
+
+    def update_priorities(self, na_idx, na_td_error):
+        '''
+        Update the priorities of the transitions replayed
+        :param na_idx: numpy array. Positions of the transitions in the buffer
+        :param na_td_error: numpy array. The last TD-error of each transition
+        '''
+        na_priority = np.abs(na_td_error) + self.f_eps
+        self.na_priority[na_idx] = na_priority
+        self.f_max_priority = max(self.f_max_priority, na_priority.max())
+
+    def __len__(self):
+        '''
+        Return the number of transitions held
+        '''
+        return self.i_size
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement rolling-window aggregates of the order flow measures. The
+cumulative values are kept in a ring buffer, one entry per timestamp, and
+each window keeps a pointer to the last entry before its start, so all the
+windows are updated together in O(1) amortized time
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import pipeline
+
+'''
+Begin help functions
+'''
+
+# the measures computed for each window, in the columns of the values
+OFI, TRADED_BID, TRADED_ASK, DELTA_MID, LOG_RET = range(5)
+l_measures = ['ofi', 'traded_bid', 'traded_ask', 'delta_mid', 'log_ret']
+
+
+'''
+End help functions
+'''
+
+
+class RollingWindows(object):
+    '''
+    Rolling sums of the order flow imbalance and of the quantities traded at
+    each side, and the change of the mid price, over several windows. The
+    values of the last update are kept in a preallocated matrix (windows x
+    measures)
+    '''
+
+    def __init__(self, l_windows=(1, 10, 60), i_capacity=1024):
+        '''
+        Initialize a RollingWindows object. Save all parameters as attributes
+        :*param l_windows: tuple. The lengths of the windows in seconds
+        :*param i_capacity: integer. Number of entries allocated at start
+        '''
+        self.l_windows = sorted(l_windows)
+        self.d_window_idx = dict((i_window, idx) for idx, i_window in
+                                 enumerate(self.l_windows))
+        self.l_window_us = [i_window * pipeline.US_PER_SECOND
+                            for i_window in self.l_windows]
+        # keys used by the Environment to expose the values
+        self.l_keys = []
+        for i_window in self.l_windows:
+            for s_key in ['qOfi', 'qAggr', 'qTraded', 'logret']:
+                self.l_keys.append('{}_{}s'.format(s_key, i_window))
+        self.na_values = np.zeros((len(self.l_windows), len(l_measures)))
+        self.i_capacity = i_capacity
+        self.reset()
+
+    def reset(self):
+        '''
+        Clear the entries and the values. It is called at each new file
+        '''
+        self.na_time = np.zeros(self.i_capacity, dtype=np.int64)
+        # cumulative ofi, traded at bid, traded at ask, and the mid price
+        self.na_cum = np.zeros((self.i_capacity, 4))
+        self.i_head = -1  # absolute index of the last entry
+        self.l_ptr = [-1] * len(self.l_windows)
+        self.na_values[:] = 0.
+
+    def _grow(self, i_oldest):
+        '''
+        Double the size of the ring, keeping the entries still needed
+        :param i_oldest: integer. Absolute index of the oldest entry needed
+        '''
+        i_old_cap = len(self.na_time)
+        i_new_cap = i_old_cap * 2
+        na_time = np.zeros(i_new_cap, dtype=np.int64)
+        na_cum = np.zeros((i_new_cap, 4))
+        for i_abs in xrange(i_oldest, self.i_head + 1):
+            na_time[i_abs % i_new_cap] = self.na_time[i_abs % i_old_cap]
+            na_cum[i_abs % i_new_cap] = self.na_cum[i_abs % i_old_cap]
+        self.na_time = na_time
+        self.na_cum = na_cum
+
+    def update(self, i_time_us, f_ofi, f_traded_bid, f_traded_ask, f_mid):
+        '''
+        Include the cumulative measures at the time passed and update the
+        values of all windows
+        :param i_time_us: integer. Microseconds since midnight
+        :param f_ofi: float. The order flow imbalance since the start
+        :param f_traded_bid: float. The quantity traded at bid since the start
+        :param f_traded_ask: float. The quantity traded at ask since the start
+        :param f_mid: float. The current mid price
+        '''
+        i_cap = len(self.na_time)
+        i_head = self.i_head
+        if i_head < 0 or self.na_time[i_head % i_cap] != i_time_us:
+            # the largest window keeps the oldest entry needed
+            i_oldest = max(self.l_ptr[-1], 0)
+            if i_head + 1 - i_oldest >= i_cap:
+                self._grow(i_oldest)
+                i_cap = len(self.na_time)
+            i_head += 1
+            self.i_head = i_head
+            self.na_time[i_head % i_cap] = i_time_us
+        na_cum = self.na_cum
+        na_time = self.na_time
+        i_pos = i_head % i_cap
+        na_cum[i_pos, 0] = f_ofi
+        na_cum[i_pos, 1] = f_traded_bid
+        na_cum[i_pos, 2] = f_traded_ask
+        na_cum[i_pos, 3] = f_mid
+        na_values = self.na_values
+        l_ptr = self.l_ptr
+        for i_win, i_window_us in enumerate(self.l_window_us):
+            # move the pointer to the last entry before the window start
+            i_start = i_time_us - i_window_us
+            i_ptr = l_ptr[i_win]
+            while i_ptr < i_head and na_time[(i_ptr + 1) % i_cap] <= i_start:
+                i_ptr += 1
+            l_ptr[i_win] = i_ptr
+            if i_ptr < 0:
+                # the window starts before the file
+                f_base_ofi = f_base_bid = f_base_ask = 0.
+                f_base_mid = na_cum[0, 3]
+            else:
+                i_base = i_ptr % i_cap
+                f_base_ofi = na_cum[i_base, 0]
+                f_base_bid = na_cum[i_base, 1]
+                f_base_ask = na_cum[i_base, 2]
+                f_base_mid = na_cum[i_base, 3]
+            na_values[i_win, OFI] = f_ofi - f_base_ofi
+            na_values[i_win, TRADED_BID] = f_traded_bid - f_base_bid
+            na_values[i_win, TRADED_ASK] = f_traded_ask - f_base_ask
+            na_values[i_win, DELTA_MID] = f_mid - f_base_mid
+            na_values[i_win, LOG_RET] = 0.
+            if f_base_mid > 0. and f_mid > 0.:
+                na_values[i_win, LOG_RET] = np.log(f_mid / f_base_mid)
+
+    def get(self, s_measure, i_window):
+        '''
+        Return the value of a measure over a window
+        :param s_measure: string. One of the l_measures
+        :param i_window: integer. The length of the window in seconds
+        '''
+        i_win = self.d_window_idx[i_window]
+        return float(self.na_values[i_win, l_measures.index(s_measure)])
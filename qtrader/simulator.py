@@ -10,9 +10,13 @@ Created on 08/18/2016
 import importlib
 import logging
 import os
-import pandas as pd
 import random
 import time
+import numpy as np
+
+import cache
+import offline
+import qtable
 
 
 # global variable
@@ -23,6 +27,19 @@ Begin help functions
 '''
 
 
+def get_agent_params(agent):
+    '''
+    Return a dictionary with the name and the hyperparameters of the agent
+    :param agent: Agent object. The primary agent
+    '''
+    d_params = {'agent': agent.s_agent_name}
+    for s_key in ['f_gamma', 'f_k', 'f_min_time', 'max_pos', 'f_alpha',
+                  'i_tilings', 'i_tiles', 'i_memory']:
+        if hasattr(agent, s_key):
+            d_params[s_key] = getattr(agent, s_key)
+    return d_params
+
+
 def save_q_table(e, i_trial):
     '''
     Log the final Q-table of the algorithm
@@ -33,10 +50,16 @@ def save_q_table(e, i_trial):
     try:
         q_table = agent.q_table
         # define the name of the files
-        s_fname = 'log/qtable/{}_qtable_{}.log'
-        s_fname = s_fname.format(agent.s_agent_name, i_trial)
-        # save data structures
-        pd.DataFrame(q_table).T.to_csv(s_fname, sep='\t')
+        s_fname = 'log/qtable/{}_qtable_{}{}'
+        s_fname = s_fname.format(agent.s_agent_name, i_trial,
+                                 agent.s_qtable_ext)
+        # keep the hyperparameters with the values
+        d_params = get_agent_params(agent)
+        # save data structures. Just write if the table has changed
+        if hasattr(agent, 'save_weights'):
+            agent.save_weights(s_fname)
+            return
+        qtable.save_qtable(s_fname, q_table, d_params=d_params)
     except:
         print 'No Q-table to be printed'
 
@@ -65,16 +88,46 @@ class Simulator(object):
         self.update_delay = update_delay
 
         self.display = display
+        self.l_session_pnl = []  # PnL of the primary agent in each session
+        self.l_decision_logs = []  # decisions taken in each test session
+        self.d_trials = {'train': 0, 'test': 0}  # trials run in each phase
 
-    def train(self, n_trials=1, n_sessions=1):
+    def _log_session(self, s_phase, i_trial, s_file, d_result=None):
+        '''
+        Keep the final PnL and position of the primary agent in the session
+        :param s_phase: string. 'train' or 'test'
+        :param i_trial: integer. id of the current trial
+        :param s_file: string. name of the file used in the session
+        :*param d_result: dictionary. results recovered from the cache
+        '''
+        if d_result is None:
+            d_state = self.env.agent_states[self.env.primary_agent]
+            d_result = {'pnl': d_state['Pnl'],
+                        'position': d_state['Position']}
+        self.l_session_pnl.append({'phase': s_phase,
+                                   'trial': i_trial,
+                                   'file': s_file,
+                                   'pnl': d_result['pnl'],
+                                   'position': d_result['position']})
+
+    def train(self, n_trials=1, n_sessions=1, b_record=False,
+              b_save_qtable=True):
         '''
         Run the simulation to train the algorithm
         :*param n_sessions: integer. Number of files to read
         :*param n_trials: integer. Iterations over the same files
+        :*param b_record: boolean. If should record the transitions of the
+            agent to be used in offline evaluation
+        :*param b_save_qtable: boolean. If should save the Q-table after each
+            session
         '''
         n_sessions = min(n_sessions, self.env.order_matching.max_nfiles)
+        agent = self.env.primary_agent
+        if b_record:
+            agent.transition_log = offline.TransitionLog()
 
         for trial in xrange(n_trials):
+            self.d_trials['train'] += 1
             # reset the order matching to the initial point
             self.env.reset_order_matching_idx()
             for i_sess in xrange(n_sessions):
@@ -82,6 +135,9 @@ class Simulator(object):
                 # [debug]
                 # print 'Simulator.run(): Trial {}'.format(trial + 1)
                 self.env.reset()
+                s_file = self.env.order_matching.get_trial_identification()
+                if b_record:
+                    agent.transition_log.new_episode()
                 self.current_time = 0.0
                 self.last_updated = 0.0
                 self.start_time = time.time()
@@ -105,27 +161,56 @@ class Simulator(object):
                     finally:
                         if self.quit or self.env.done:
                             break
+                self._log_session('train', trial + 1, s_file)
+                self.env.flush_recorders('train', self.d_trials['train'],
+                                         i_sess + 1)
+                # solve the empirical model, if the agent keeps one
+                if getattr(agent, 'mdp', None) is not None:
+                    agent.solve_mdp()
                 # save the current Q-table
-                save_q_table(self.env, trial+1)
+                if b_save_qtable:
+                    save_q_table(self.env, trial+1)
                 # if self.quit:
                 #     break
             # log the end of the trial
             self.env.log_trial()
+        # save the transitions recorded
+        if b_record:
+            s_fname = 'log/transitions/{}_transitions.npz'
+            s_fname = s_fname.format(agent.s_agent_name)
+            if not os.path.exists(os.path.dirname(s_fname)):
+                os.makedirs(os.path.dirname(s_fname))
+            agent.transition_log.save(s_fname)
+            agent.transition_log = None
+            return s_fname
 
-    def test(self, s_qtable, n_trials=1, n_sessions=1, i_idx=None):
+    def test(self, s_qtable, n_trials=1, n_sessions=1, i_idx=None,
+             result_cache=None, i_seed=0):
         '''
-        Run the simulation to test the policy learned
+        Run the simulation to test the policy learned. When a cache is passed
+        and the policy is frozen, the sessions already simulated are not run
+        again
         :param s_qtable: string. path to the qtable to be used
         :*param n_sessions: integer. Number of files to read
         :*param n_trials: integer. Iterations over the same files
         :*param i_idx: integer. start file of the envioronment
+        :*param result_cache: ResultCache object. Cache of the sessions
+        :*param i_seed: integer. Seed used in each session, when caching
         '''
         n_sessions = min(n_sessions, self.env.order_matching.max_nfiles)
         agent = self.env.primary_agent
         if agent.s_agent_name != 'BasicAgent':
             agent.set_qtable(s_qtable)
+        # just cache the sessions that depend only on the key
+        b_cache = result_cache is not None and agent.FROZEN_POLICY
+        b_cache = b_cache and self.env.background is None
+        if b_cache:
+            s_zip = self.env.order_matching.s_fname
+            s_qhash = cache.qtable_file_hash(s_qtable)
+            d_agent = get_agent_params(agent)
 
         for trial in xrange(n_trials):
+            self.d_trials['test'] += 1
             # reset the order matching to the initial point
             self.env.reset_order_matching_idx(i_idx=i_idx)
             for i_sess in xrange(n_sessions):
@@ -133,6 +218,25 @@ class Simulator(object):
                 # [debug]
                 # print 'Simulator.run(): Trial {}'.format(trial + 1)
                 self.env.reset()
+                s_file = self.env.order_matching.get_trial_identification()
+                s_key = None
+                if b_cache and s_file:
+                    s_key = result_cache.make_key(
+                        cache.day_file_hash(s_zip, s_file),
+                        s_qhash,
+                        d_agent,
+                        i_seed)
+                    d_result = result_cache.get(s_key)
+                    if d_result is not None:
+                        # skip the file, using the results stored
+                        self.env.order_matching.idx += 1
+                        self._log_session('test', trial + 1, s_file,
+                                          d_result)
+                        self.l_decision_logs.append(d_result['decisions'])
+                        continue
+                    random.seed(i_seed)
+                    np.random.seed(i_seed)
+                    agent.decision_log = []
                 self.current_time = 0.0
                 self.last_updated = 0.0
                 self.start_time = time.time()
@@ -156,6 +260,15 @@ class Simulator(object):
                     finally:
                         if self.quit or self.env.done:
                             break
+                self._log_session('test', trial + 1, s_file)
+                self.env.flush_recorders('test', self.d_trials['test'],
+                                         i_sess + 1)
+                if s_key is not None:
+                    d_result = dict(self.l_session_pnl[-1])
+                    d_result['decisions'] = agent.decision_log
+                    result_cache.put(s_key, d_result)
+                    self.l_decision_logs.append(agent.decision_log)
+                    agent.decision_log = None
             # log the end of the trial
             self.env.log_trial()
 
@@ -168,13 +281,15 @@ class Simulator(object):
         '''
         agent = self.env.primary_agent
         for trial in xrange(n_trials):
-            s_qtable = 'log/qtable/{}_qtable_{}.log'
-            s_qtable = s_qtable.format(agent.s_agent_name, trial+1)
+            s_qtable = 'log/qtable/{}_qtable_{}{}'
+            s_qtable = s_qtable.format(agent.s_agent_name, trial+1,
+                                       agent.s_qtable_ext)
             self.test(s_qtable=s_qtable,
                       n_trials=1,
                       n_sessions=n_sessions)
 
-    def out_of_sample(self, s_qtable, n_start, n_trials=1, n_sessions=1):
+    def out_of_sample(self, s_qtable, n_start, n_trials=1, n_sessions=1,
+                      result_cache=None):
         '''
         Test the performance of the a given policy starting on the files index
         passed as parameter
@@ -182,6 +297,7 @@ class Simulator(object):
         :param n_start: integer. start file to use in simulation
         :*param n_sessions: integer. Number of files to read
         :*param n_trials: integer. Iterations over the same files
+        :*param result_cache: ResultCache object. Cache of the sessions
         '''
         agent = self.env.primary_agent
         for trial in xrange(n_trials):
@@ -189,4 +305,5 @@ class Simulator(object):
             self.test(s_qtable=s_qtable,
                       n_trials=1,
                       n_sessions=n_sessions,
-                      i_idx=n_start)
+                      i_idx=n_start,
+                      result_cache=result_cache)
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Fixtures shared by the tests. The modules of qtrader import each other by
+name, so their folder is included in the path, and the tests run from the
+root of the repository, where the data folder with the models is
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import os
+import random
+import sys
+import zipfile
+import pytest
+
+S_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(S_ROOT, 'qtrader'))
+# the analysis modules plot to files only
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+
+'''
+Begin help functions
+'''
+
+
+def make_day(i_seed, i_rows=2000):
+    '''
+    Return the content of a csv file with random best quotes and trades of a
+    day around 15.00, in the format of the files used by the simulation
+    :param i_seed: integer. Seed of the random generator and day of the file
+    :*param i_rows: integer. Number of rows of the file
+    '''
+    rng = random.Random(i_seed)
+    i_mid = 1500
+    i_start = 10 * 3600 + 25 * 60
+    i_end = 16 * 3600 + 31 * 60
+    l_rows = [',Date,Type,Price,Size']
+    for i in xrange(i_rows):
+        i_time = i_start + (i_end - i_start) * i // i_rows
+        s_time = '2016-07-{:02d} {:02d}:{:02d}:{:02d}'.format(
+            25 + i_seed % 5, i_time // 3600, i_time % 3600 // 60,
+            i_time % 60)
+        f_rand = rng.random()
+        if f_rand < 0.1:
+            i_mid += rng.choice([-1, 1])
+        if f_rand < 0.15:
+            s_type, i_price = 'TRADE', i_mid + rng.choice([0, 1])
+        elif f_rand < 0.575:
+            s_type, i_price = 'BID', i_mid
+        else:
+            s_type, i_price = 'ASK', i_mid + 1
+        l_rows.append('{},{},{},{:0.2f},{}'.format(
+            i, s_time, s_type, i_price / 100., rng.randint(1, 30) * 100))
+    return '\n'.join(l_rows) + '\n'
+
+
+'''
+End help functions
+'''
+
+
+@pytest.fixture(autouse=True)
+def root_dir(monkeypatch):
+    '''
+    Run each test from the root of the repository
+    '''
+    monkeypatch.chdir(S_ROOT)
+    return S_ROOT
+
+
+@pytest.fixture(scope='session')
+def synth_zip(tmpdir_factory):
+    '''
+    Return the path to a zip file with two days of synthetic data
+    '''
+    s_fname = str(tmpdir_factory.mktemp('data').join('synth.zip'))
+    with zipfile.ZipFile(s_fname, 'w') as fw:
+        for i_day in range(2):
+            fw.writestr('day{:02d}.csv'.format(i_day), make_day(i_day))
+    return s_fname
+
+
+@pytest.fixture
+def env(synth_zip):
+    '''
+    Return an environment over the synthetic data with a LearningAgent_k as
+    the primary agent
+    '''
+    import agent
+    from environment import Environment
+    e = Environment(s_fname=synth_zip, i_idx=0)
+    a = e.create_agent(agent.LearningAgent_k, f_min_time=2., f_k=0.8,
+                       f_gamma=0.5)
+    e.set_primary_agent(a)
+    return e
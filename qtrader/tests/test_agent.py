@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the state kept by the agents between the decisions
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import itertools
+
+import qtable
+from simulator import Simulator
+
+
+'''
+Begin help functions
+'''
+
+
+def old_valid_actions(agent):
+    '''
+    Return the actions allowed as the lists built by _take_action() before
+    they were precomputed
+    :param agent: BasicAgent object. The agent in its current position
+    '''
+    valid_actions = list(agent.actions_to_open)
+    f_pos = agent.position['qBid'] - agent.position['qAsk']
+    if f_pos <= (agent.max_pos * -1):
+        valid_actions = list(agent.actions_to_close_when_short)  # copy
+        if abs(agent.f_delta_pnl) >= (4.-1e-6):
+            valid_actions = list(agent.actions_to_stop_when_short)
+    elif f_pos >= agent.max_pos:
+        valid_actions = list(agent.actions_to_close_when_long)
+        if abs(agent.f_delta_pnl) >= (4.-1e-6):
+            valid_actions = list(agent.actions_to_stop_when_long)
+    return valid_actions
+
+
+'''
+End help functions
+'''
+
+
+def test_reset_clears_the_last_decision(env):
+    agent = env.primary_agent
+    sim = Simulator(env, update_delay=1.00, display=False)
+    sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+    assert agent.last_action is not None or agent.old_state is not None
+    env.reset()
+    assert agent.old_state is None
+    assert agent.last_action is None
+    assert agent.last_max_pnl is None
+    assert agent.f_delta_pnl == 0.
+    assert agent.i_valid_mask == agent.d_valid_masks[(0, False)]
+
+
+def test_hashed_tables_use_packed_states(env, tmpdir):
+    agent = env.primary_agent
+    agent.set_hashed_qtable()
+    agent.set_replay(i_capacity=1000, i_batch_size=8, i_replay_every=5)
+    sim = Simulator(env, update_delay=1.00, display=False)
+    sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+    assert len(agent.q_table) > 0
+    assert all(isinstance(state, (int, long)) for state in agent.q_table)
+    # the strings are used just in the files
+    s_fname = str(tmpdir.join('table.qtb'))
+    qtable.save_qtable(s_fname, agent.q_table)
+    d_header, na_q = qtable.load_qtable(s_fname)
+    assert d_header['states'][0].startswith('{')
+    assert len(d_header['states']) == len(agent.q_table)
+
+
+def test_visits_are_kept_by_packed_state(synth_zip):
+    import agent as agent_module
+    from environment import Environment
+    e = Environment(s_fname=synth_zip, i_idx=0)
+    agent = e.create_agent(agent_module.LearningAgent, f_min_time=2.)
+    e.set_primary_agent(agent)
+    agent.set_hashed_qtable()
+    sim = Simulator(e, update_delay=1.00, display=False)
+    sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+    assert len(agent.nvisits_table) > 0
+    assert set(agent.nvisits_table) <= set(agent.q_table)
+
+
+def test_valid_masks_match_the_old_lists(env):
+    agent = env.primary_agent
+    i_max = agent.max_pos
+    l_pos = [-i_max - 100, -i_max, -i_max + 100, 0, i_max - 100, i_max,
+             i_max + 100]
+    l_delta = [0., -3.99, -4. + 1e-7, -4., -10.]
+    set_masks = set()
+    for f_pos, f_delta in itertools.product(l_pos, l_delta):
+        agent.position['qBid'] = max(f_pos, 0) + 300
+        agent.position['qAsk'] = max(-f_pos, 0) + 300
+        agent.f_delta_pnl = f_delta
+        l_old = old_valid_actions(agent)
+        t_valid = agent._update_valid_actions()
+        assert list(t_valid) == l_old
+        assert agent.last_valid_actions is t_valid
+        set_masks.add(agent.i_valid_mask)
+        na_bits = qtable.masks_to_bool([agent.i_valid_mask])[0]
+        assert [s_action for s_action, b_bit in zip(qtable.l_actions,
+                                                    na_bits) if b_bit] == \
+            [s_action for s_action in qtable.l_actions if s_action in l_old]
+    # all the regimes were visited
+    assert len(set_masks) == 5
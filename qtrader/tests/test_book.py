@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the order index and the sweeps of the sides of the limit order book
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import pytest
+
+import book
+
+
+'''
+Begin help functions
+'''
+
+
+def new_order(i_order_id, f_price, i_qty=100, i_agent=11, s_side='BID'):
+    '''
+    Return a message of a new passive order
+    :param i_order_id: integer. The order id
+    :param f_price: float. The price of the order
+    :*param i_qty: integer. The quantity of the order
+    :*param i_agent: integer. The id of the owner
+    :*param s_side: string. BID or ASK
+    '''
+    return {'agent_id': i_agent,
+            'order_id': i_order_id,
+            'new_order_id': i_order_id,
+            'order_side': s_side,
+            'order_status': 'New',
+            'order_price': f_price,
+            'total_qty_order': i_qty,
+            'traded_qty_order': 0,
+            'order_qty': i_qty,
+            'agressor_indicator': 'Neutral',
+            'action': 'BEST_BID'}
+
+
+'''
+End help functions
+'''
+
+
+def test_order_index_reuses_slots():
+    obj_idx = book.OrderIndex(i_capacity=2)
+    for i in range(5):
+        obj_idx.set(i, 10. + i, 100, i)
+    assert len(obj_idx) == 5 and len(obj_idx.na_price) == 8
+    assert obj_idx.pop(3) == (13., 100, 3)
+    assert 3 not in obj_idx
+    obj_idx.set(7, 9., 200, 7)
+    assert obj_idx.get(7) == (9., 200, 7)
+    assert obj_idx.i_top == 5
+
+
+def test_sweep_keeps_live_orders_far_from_the_top():
+    obj_side = book.BidSide()
+    obj_side.i_max_age = 0
+    obj_side.i_keep_levels = 2
+    for i in range(5):
+        obj_side.update(new_order(i + 1, 15. - i * 0.01))
+    obj_side.i_updates += 10
+    obj_side.sweep()
+    assert len(obj_side.order_index) == 5
+    assert obj_side.i_stale_evicted == 0
+    assert obj_side.l_canceled == []
+
+
+def test_sweep_evicts_orphans():
+    obj_side = book.BidSide()
+    for i in range(3):
+        obj_side.update(new_order(i + 1, 15. - i * 0.01))
+    # drop the order 2 from its level, but not from the index
+    obj_side._remove_from_level(14.99, 2, 100)
+    obj_side.sweep()
+    assert 2 not in obj_side.order_index
+    assert len(obj_side.order_index) == 2
+    assert obj_side.i_orphans_evicted == 1
+    assert obj_side.l_canceled == []
+
+
+def test_depth_trimming_cancels_to_the_owners():
+    obj_book = book.LimitOrderBook('PETR4')
+    obj_side = obj_book.book_bid
+    obj_side.b_trim_depth = True
+    obj_side.i_max_age = 0
+    obj_side.i_keep_levels = 2
+    for i in range(5):
+        obj_side.update(new_order(i + 1, 15. - i * 0.01, i_agent=11 + i))
+    obj_side.i_updates += 10
+    obj_side.sweep()
+    assert len(obj_side.order_index) == 2
+    assert obj_side.price_tree.count == 2
+    l_msg = obj_book.pop_canceled()
+    assert sorted(d_msg['agent_id'] for d_msg in l_msg) == [13, 14, 15]
+    assert set(d_msg['order_status'] for d_msg in l_msg) == {'Canceled'}
+    assert obj_book.pop_canceled() == []
+
+
+def test_partial_fill_of_unknown_order():
+    obj_side = book.BidSide()
+    obj_side.b_trim_depth = True
+    obj_side.i_max_age = 0
+    obj_side.i_keep_levels = 2
+    for i in range(3):
+        obj_side.update(new_order(i + 1, 15. - i * 0.01))
+    obj_side.i_updates += 10
+    obj_side.sweep()
+    assert 3 not in obj_side.order_index
+    # the order evicted by the sweep is put back in the book
+    d_msg = new_order(3, 14.98, i_qty=60)
+    d_msg['order_status'] = 'Partially Filled'
+    obj_side.update(d_msg)
+    assert obj_side.order_index.get(3)[:2] == (14.98, 60)
+    assert obj_side.d_evicted == {}
+    # an order never seen is still an error
+    d_msg = new_order(9, 14.98, i_qty=60)
+    d_msg['order_status'] = 'Partially Filled'
+    with pytest.raises(KeyError):
+        obj_side.update(d_msg)
+
+
+def test_size_history_is_capped():
+    obj_side = book.BidSide()
+    obj_side.update(new_order(1, 15.))
+    for i in range(obj_side.i_history + 5):
+        obj_side.sweep()
+    assert len(obj_side.l_size_history) == obj_side.i_history
+    assert obj_side.l_size_history[-1] == (1, 1, 1)
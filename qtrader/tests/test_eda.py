@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the functions used to explore the data and the logs of the simulations
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import logging
+import os
+import zipfile
+import numpy as np
+import pytest
+
+import eda
+from simulator import Simulator
+
+
+'''
+Begin help functions
+'''
+
+
+def naive_parse(s_fname):
+    '''
+    Return the kind, the agent and the pnl of the lines of interest of a log
+    file, reading it line by line
+    :param s_fname: string. Name of the log file
+    '''
+    l_rtn = []
+    for s_line in open(s_fname):
+        if ';' not in s_line:
+            # the continuation of a message with many lines
+            continue
+        s_msg = s_line.split(';', 1)[1]
+        if '.update(): time = ' in s_msg:
+            s_pnl = s_msg.split(', pnl = ')[1].split(',')[0]
+            l_rtn.append((eda.UPDATE, s_msg.split('.')[0], float(s_pnl)))
+        elif '.choose_an_action()' in s_msg:
+            l_rtn.append((eda.CHOOSE, '', np.nan))
+        elif 'Trial Ended' in s_msg:
+            l_rtn.append((eda.TRIAL_ENDED, '', np.nan))
+        elif 'run(): Starting testing phase !' in s_msg:
+            l_rtn.append((eda.TEST_STARTED, '', np.nan))
+    return l_rtn
+
+
+'''
+End help functions
+'''
+
+
+@pytest.fixture
+def sim_log(env, tmpdir):
+    '''
+    Return the log file of a trial of the simulation, in the format used by
+    setup_logging()
+    '''
+    s_log = str(tmpdir.join('sim.log'))
+    root = logging.getLogger()
+    i_level = root.level
+    obj_handler = logging.FileHandler(s_log)
+    obj_handler.setFormatter(logging.Formatter('%(asctime)s;%(message)s'))
+    root.addHandler(obj_handler)
+    root.setLevel(logging.DEBUG)
+    try:
+        sim = Simulator(env, update_delay=1.00, display=False)
+        sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+        logging.info('run(): Starting testing phase ! In-Sample Test.')
+    finally:
+        root.removeHandler(obj_handler)
+        obj_handler.close()
+        root.setLevel(i_level)
+    return s_log
+
+
+def test_ofi_starts_when_both_sides_are_quoted(tmpdir):
+    l_rows = [',Date,Type,Price,Size',
+              '0,2016-07-25 10:30:00,BID,"15,00",100',
+              '1,2016-07-25 10:30:00,TRADE,"15,01",100',
+              '2,2016-07-25 10:30:01,ASK,"15,01",200',
+              '3,2016-07-25 10:30:02,BID,"15,00",300',
+              '4,2016-07-25 10:30:03,ASK,"15,02",100']
+    s_fname = str(tmpdir.join('ofi.zip'))
+    with zipfile.ZipFile(s_fname, 'w') as archive:
+        archive.writestr('day00.csv', '\n'.join(l_rows) + '\n')
+    df = eda.ofi_windows(s_fname, l_windows=(1, 10))
+    assert list(df['BID']) == [15., 15., 15.]
+    assert list(df['ASK']) == [15.01, 15.01, 15.02]
+    # the bid grew 200 and, after that, the ask of 200 was consumed
+    assert np.allclose(df['OFI_10'], [0., 200., 400.])
+    assert np.allclose(df['OFI_1'], [0., 200., 200.])
+
+
+def test_parse_log_matches_the_lines(sim_log):
+    l_lines = naive_parse(sim_log)
+    d_events = eda.parse_log(sim_log)
+    l_kinds = [t_line[0] for t_line in l_lines]
+    assert list(d_events['kind']) == l_kinds
+    assert set(l_kinds) == {eda.UPDATE, eda.CHOOSE, eda.TRIAL_ENDED,
+                            eda.TEST_STARTED}
+    na_update = d_events['kind'] == eda.UPDATE
+    assert set(d_events['agent'][na_update]) == {'LearningAgent_k'}
+    assert np.array_equal(d_events['pnl'][na_update],
+                          [t_line[2] for t_line in l_lines
+                           if t_line[0] == eda.UPDATE])
+    assert not np.isnan(d_events['reward'][na_update]).any()
+    na_choose = d_events['kind'] == eda.CHOOSE
+    assert set(d_events['gamma'][na_choose]) == {'0.5'}
+    assert set(d_events['k'][na_choose]) == {'0.8'}
+    # lines split between the chunks read
+    d_aux = eda.parse_log(sim_log, i_chunk=1000)
+    for s_col in eda.l_event_cols:
+        assert np.array_equal(d_aux[s_col], d_events[s_col]) or \
+            np.allclose(d_aux[s_col], d_events[s_col], equal_nan=True)
+
+
+def test_events_cache_follows_the_log(sim_log, monkeypatch):
+    d_events = eda.load_events(sim_log)
+    assert os.path.exists(sim_log + '.events.npz')
+
+    def must_not_parse(s_fname):
+        raise AssertionError('the cache was not used')
+    monkeypatch.setattr(eda, 'parse_log', must_not_parse)
+    d_aux = eda.load_events(sim_log)
+    assert np.array_equal(d_aux['kind'], d_events['kind'])
+    monkeypatch.undo()
+    # a line appended changes the size of the log
+    with open(sim_log, 'a') as fw:
+        fw.write('2016-07-25 10:00:00,000;Environment.log_trial(): '
+                 'Trial Ended.\n')
+    d_aux = eda.load_events(sim_log)
+    assert len(d_aux['kind']) == len(d_events['kind']) + 1
+    # the same size, but written later
+    obj_stat = os.stat(sim_log)
+    os.utime(sim_log, (obj_stat.st_atime, obj_stat.st_mtime + 10))
+    monkeypatch.setattr(eda, 'parse_log', lambda s_fname: {'kind': 'new'})
+    assert eda.load_events(sim_log)['kind'] == 'new'
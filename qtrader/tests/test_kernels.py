@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the numeric kernels in pure Python and, when numba is installed, that
+the compiled versions give the same results
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+import pytest
+
+import kernels
+
+
+'''
+Begin help functions
+'''
+
+
+def random_quotes(i_rows=2000, i_seed=0):
+    '''
+    Return random walks of the best quotes, in ticks of 0.01, and irregular
+    times in microseconds
+    :*param i_rows: integer. Number of rows generated
+    :*param i_seed: integer. Seed of the random generator
+    '''
+    rng = np.random.RandomState(i_seed)
+    na_bid = 10. + np.cumsum(rng.randint(-1, 2, i_rows)) * 0.01
+    na_ask = na_bid + rng.randint(1, 3, i_rows) * 0.01
+    na_bid_qty = rng.randint(1, 50, i_rows) * 100.
+    na_ask_qty = rng.randint(1, 50, i_rows) * 100.
+    na_time = np.cumsum(rng.randint(0, 3 * 10 ** 6, i_rows)).astype(np.int64)
+    return na_time, [na_bid, na_bid_qty, na_ask, na_ask_qty]
+
+
+'''
+End help functions
+'''
+
+
+def test_e_n():
+    # the bid improved, the ask was hit, the bid was canceled, no change
+    assert kernels.py_e_n(10.01, 300., 10., 200., True) == 300.
+    assert kernels.py_e_n(10.02, 100., 10.02, 400., False) == 300.
+    assert kernels.py_e_n(9.99, 500., 10., 200., True) == -200.
+    assert kernels.py_e_n(10., 200., 10., 200., False) == 0.
+
+
+def test_accumulate_ofi():
+    na_bid = np.array([10., 10., 10.01, 10.01])
+    na_bid_qty = np.array([100., 300., 200., 200.])
+    na_ask = np.array([10.02, 10.02, 10.02, 10.03])
+    na_ask_qty = np.array([100., 100., 100., 500.])
+    na_ofi = kernels.py_accumulate_ofi(na_bid, na_bid_qty, na_ask,
+                                       na_ask_qty)
+    assert list(na_ofi) == [0., 200., 400., 500.]
+
+
+def test_rolling_sum():
+    na_time = np.array([0, 1, 2, 5, 6], dtype=np.int64)
+    na_cum = np.array([1., 3., 6., 10., 15.])
+    na_sum = kernels.py_rolling_sum(na_time, na_cum, 2)
+    assert list(na_sum) == [1., 3., 5., 4., 9.]
+
+
+def test_compiled_kernels_match():
+    pytest.importorskip('numba')
+    na_time, l_args = random_quotes()
+    na_ofi = kernels.py_accumulate_ofi(*l_args)
+    assert np.array_equal(kernels.accumulate_ofi(*l_args), na_ofi)
+    for i_window in [10 ** 6, 10 ** 7, 6 * 10 ** 7]:
+        assert np.array_equal(kernels.rolling_sum(na_time, na_ofi, i_window),
+                              kernels.py_rolling_sum(na_time, na_ofi,
+                                                     i_window))
+    e_n = kernels.get_kernel('e_n')
+    for f_price in [9.99, 10., 10.01]:
+        for b_bid in [True, False]:
+            assert e_n(f_price, 300., 10., 200., b_bid) == \
+                kernels.py_e_n(f_price, 300., 10., 200., b_bid)
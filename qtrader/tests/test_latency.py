@@ -0,0 +1,38 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the log-linear histograms of the decision latency
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import latency
+
+
+def test_buckets_keep_the_relative_precision():
+    i_sub_bits = 7
+    for i_value in [0, 5, 127, 128, 1000, 123456, 10 ** 10]:
+        i_idx = latency.bucket_index(i_value, i_sub_bits)
+        f_aux = latency.bucket_value(i_idx, i_sub_bits)
+        assert abs(f_aux - i_value) <= i_value * 2. ** -i_sub_bits
+
+
+def test_percentiles_and_merge():
+    rng = np.random.RandomState(0)
+    na_values = rng.exponential(1e-4, 5000)
+    obj_a = latency.LatencyHistogram()
+    obj_b = latency.LatencyHistogram()
+    for f_value in na_values[:2500]:
+        obj_a.record(f_value)
+    for f_value in na_values[2500:]:
+        obj_b.record(f_value)
+    obj_a.merge(obj_b)
+    assert obj_a.i_count == 5000
+    for f_pct in [50., 99.]:
+        f_exact = np.percentile(na_values, f_pct)
+        assert abs(obj_a.percentile(f_pct) / f_exact - 1.) < 0.02
+    obj_a.reset()
+    assert obj_a.percentile(50.) == 0.
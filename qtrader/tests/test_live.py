@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the replay of the files through a local socket and the report of the
+latencies measured
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import time
+import zipfile
+import numpy as np
+import pytest
+
+import live
+
+
+'''
+Begin help functions
+'''
+
+
+def replay(s_fname, f_speed, f_sleep=0.):
+    '''
+    Return the rows received from a ReplayServer and when each one arrived
+    :param s_fname: string. The zip file replayed
+    :param f_speed: float. Multiple of the real time
+    :*param f_sleep: float. Time spent by the consumer in each row
+    '''
+    server = live.ReplayServer(s_fname, f_speed)
+    obj_source = live.SocketSource(server.start())
+    l_rows, l_arrival = [], []
+    try:
+        for row in obj_source('day00.csv'):
+            l_rows.append(row)
+            l_arrival.append(obj_source.f_last_arrival)
+            time.sleep(f_sleep)
+    finally:
+        server.stop()
+    return l_rows, np.array(l_arrival)
+
+
+'''
+End help functions
+'''
+
+
+@pytest.fixture
+def one_per_second(tmpdir):
+    '''
+    Return a zip file with six rows, one second apart
+    '''
+    l_rows = [',Date,Type,Price,Size']
+    for i in xrange(6):
+        l_rows.append('{},2016-07-25 10:30:0{},BID,15.00,100'.format(i, i))
+    s_fname = str(tmpdir.join('paced.zip'))
+    with zipfile.ZipFile(s_fname, 'w') as archive:
+        archive.writestr('day00.csv', '\n'.join(l_rows) + '\n')
+    return s_fname
+
+
+def test_server_paces_the_rows(one_per_second):
+    l_rows, na_arrival = replay(one_per_second, 10.)
+    assert [row['Date'][-1] for row in l_rows] == list('012345')
+    na_gap = np.diff(na_arrival)
+    assert np.all(na_gap > 0.05) and np.all(na_gap < 0.2)
+    l_rows, na_arrival = replay(one_per_second, None)
+    assert len(l_rows) == 6 and na_arrival[-1] - na_arrival[0] < 0.1
+
+
+def test_arrival_is_stamped_on_receive(one_per_second):
+    # the consumer takes 0.3s per row, but the rows are sent every 0.1s
+    l_rows, na_arrival = replay(one_per_second, 10., f_sleep=0.3)
+    assert len(l_rows) == 6
+    assert np.all(np.diff(na_arrival) < 0.2)
+    assert na_arrival[-1] - na_arrival[0] < 0.8
+
+
+def test_source_can_be_dropped(one_per_second):
+    server = live.ReplayServer(one_per_second, 1.)
+    obj_source = live.SocketSource(server.start())
+    try:
+        rows = obj_source('day00.csv')
+        assert rows.next()['Date'].endswith('00')
+        f_start = time.time()
+        rows.close()
+        assert time.time() - f_start < 0.5
+    finally:
+        server.stop()
+
+
+def test_latency_report():
+    monitor = live.LatencyMonitor(f_budget=1e-3)
+    for i in xrange(100):
+        # the row waited i * 1e-4 before the step, that takes 4.5e-4
+        monitor.record(10. - i * 1e-4, 10., 10. + 4.5e-4)
+    monitor.record(None, 10., 10. + 2e-3)
+    d_report = monitor.report()
+    assert d_report['n_steps'] == 101 and d_report['budget'] == 1e-3
+    na_latency = 4.5e-4 + np.arange(100) * 1e-4
+    for s_pct, f_pct in [('50', 50.), ('99', 99.), ('99.9', 99.9)]:
+        assert np.isclose(d_report['latency_p' + s_pct],
+                          np.percentile(na_latency, f_pct))
+    assert np.isclose(d_report['latency_over_budget'], 0.94)
+    assert np.isclose(d_report['step_over_budget'], 1. / 101)
+    assert np.isclose(d_report['step_p50'], 4.5e-4)
+    assert live.LatencyMonitor().report() == {'n_steps': 0, 'budget': 1e-3}
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the order matching that replays the files of the simulation
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import random
+
+import agent
+from environment import Environment
+from simulator import Simulator
+
+
+def test_cross_stats_are_counted_by_replay(synth_zip):
+    # replaying the same file again should not accumulate the counters
+    e = Environment(s_fname=synth_zip, i_idx=0)
+    e.set_primary_agent(e.create_agent(agent.BasicAgent, f_min_time=2.))
+    sim = Simulator(e, update_delay=1.00, display=False)
+    l_stats = []
+    for i_trial in range(2):
+        random.seed(0)
+        sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+        l_stats.append(e.order_matching.get_cross_stats())
+    assert sum(d_aux['events'] for d_aux in l_stats[0].itervalues()) > 0
+    assert l_stats[1] == l_stats[0]
+
+
+def test_historical_flow_belongs_to_the_zombie(env):
+    from environment import ZombieAgent
+    from translators import ZOMBIE_ID
+    assert isinstance(env.agent_states.get_agent(ZOMBIE_ID), ZombieAgent)
+    env.reset()
+    for i_step in range(50):
+        env.step()
+    my_book = env.order_matching.my_book
+    f_price, obj_price = my_book.book_bid.price_tree.max_item()
+    for idx_ord, obj_order in obj_price.order_tree.nsmallest(1000):
+        assert obj_order['agent_id'] == ZOMBIE_ID
@@ -0,0 +1,34 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the solvers of the empirical MDP on a model with known Q-values
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import mdp
+
+
+def test_solvers_find_the_known_values():
+    # a loop a -> b -> a paying one in each step, and an action in b that
+    # stays there paying nothing. With gamma = 0.5 the values are both 2
+    obj_mdp = mdp.EmpiricalMDP(i_capacity=2)
+    for i_rep in range(3):
+        obj_mdp.add('a', 0, 1., 'b')
+        obj_mdp.add('b', 1, 1., 'a')
+        obj_mdp.add('b', 0, 0., 'b')
+    assert len(obj_mdp) == 9
+    for s_method in ['value_iteration', 'prioritized_sweeping']:
+        na_q = obj_mdp.solve(s_method, f_gamma=0.5)
+        assert abs(na_q[0, 0] - 2.) < 1e-4
+        assert abs(na_q[1, 1] - 2.) < 1e-4
+        assert abs(na_q[1, 0] - 1.) < 1e-4
+        assert np.isnan(na_q[0, 1])
+
+
+def test_empty_model():
+    na_q = mdp.EmpiricalMDP().solve()
+    assert na_q.shape[0] == 0
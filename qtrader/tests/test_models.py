@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the archive of models against the pickled scikit-learn models
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import pickle
+import numpy as np
+import pytest
+
+import models
+
+
+def test_archive_reproduces_the_pickles(tmpdir):
+    s_out = str(tmpdir.join('models.bin'))
+    l_names = models.export_models(s_out)
+    assert l_names
+    rng = np.random.RandomState(0)
+    for s_name in l_names:
+        with open(models.d_pickles[s_name], 'r') as fr:
+            obj_model = pickle.load(fr)
+        obj_aux = models.get_model(s_name, s_out)
+        if hasattr(obj_model, 'cluster_centers_'):
+            i_features = obj_model.cluster_centers_.shape[1]
+        elif hasattr(obj_model, 'components_'):
+            i_features = obj_model.components_.shape[1]
+        else:
+            i_features = len(obj_model.scale_)
+        na_x = rng.rand(20, i_features)
+        if isinstance(obj_aux, models.KMeans):
+            assert (obj_aux.predict(na_x) == obj_model.predict(na_x)).all()
+        else:
+            na_diff = obj_aux.transform(na_x) - obj_model.transform(na_x)
+            assert np.abs(na_diff).max() < 1e-9
+
+
+def test_arrays_are_aligned_and_read_only(tmpdir):
+    s_out = str(tmpdir.join('aux.bin'))
+    na_a = np.arange(6.).reshape(2, 3)
+    models.save_archive(s_out, {'a': na_a, 'b': np.ones(3)})
+    d_arrays = models.load_archive(s_out)
+    assert (d_arrays['a'] == na_a).all()
+    assert (d_arrays['b'] == 1.).all()
+    assert not d_arrays['a'].flags.writeable
+    assert d_arrays['a'].ctypes.data % 8 == 0
+    with pytest.raises(KeyError):
+        models.get_model('missing', s_out)
+
+
+def test_invalid_archive(tmpdir):
+    s_out = str(tmpdir.join('models.dat'))
+    with open(s_out, 'wb') as fw:
+        fw.write('not an archive')
+    with pytest.raises(models.InvalidArchiveException):
+        models.load_archive(s_out)
+
+
+def test_empty_archive_keeps_the_header(tmpdir, monkeypatch):
+    # make the header end on an aligned position
+    monkeypatch.setattr(models, 'VERSION', 10000)
+    monkeypatch.setattr(models, 'ALIGN', 16)
+    monkeypatch.setattr(models, 'd_archives', {})
+    s_out = str(tmpdir.join('empty.bin'))
+    models.save_archive(s_out, {})
+    with open(s_out, 'rb') as fr:
+        s_aux = fr.read()
+    assert len(s_aux) == 48 and s_aux.endswith('}')
+    assert models.load_archive(s_out) == {}
+
+
+def test_export_without_pickles(tmpdir):
+    s_out = str(tmpdir.join('models.bin'))
+    with pytest.raises(IOError):
+        models.export_models(s_out, {'pca': str(tmpdir.join('none.dat'))})
+    assert not tmpdir.join('models.bin').check()
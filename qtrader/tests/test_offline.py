@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the offline evaluation of policies on hand-built transition logs
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import offline
+import qtable
+
+
+'''
+Begin help functions
+'''
+
+ALL = qtable.ALL_ACTIONS_MASK
+BID = qtable.d_action_idx['BEST_BID']
+OFFER = qtable.d_action_idx['BEST_OFFER']
+
+
+def two_episodes():
+    '''
+    Return a log with two episodes of two steps, taking the actions with
+    probability 0.5. The second step of the last episode is a fill
+    '''
+    obj_log = offline.TransitionLog(i_capacity=2)
+    obj_log.add('a', ALL, BID, 1., 'b', ALL, 0.5)
+    obj_log.add('b', ALL, OFFER, 2., 'b', ALL, 0.5)
+    obj_log.new_episode()
+    obj_log.add('a', ALL, OFFER, 4., 'b', ALL, 0.5)
+    obj_log.add('b', ALL, BID, 8., 'b', ALL, 0.25, b_fill=True)
+    return obj_log
+
+
+'''
+End help functions
+'''
+
+
+def test_fitted_q_finds_the_known_values():
+    # b -> b paying 2 has value 2 / (1 - 0.5) and a -> b pays 1 more
+    obj_log = offline.TransitionLog()
+    for i_rep in range(3):
+        obj_log.add('a', ALL, BID, 1., 'b', ALL, 1.)
+        obj_log.add('b', ALL, OFFER, 2., 'b', ALL, 1.)
+    na_q = offline.fitted_q(obj_log, f_gamma=0.5, n_iter=1000, f_tol=1e-9)
+    assert abs(na_q[0, BID] - 3.) < 1e-6
+    assert abs(na_q[1, OFFER] - 4.) < 1e-6
+    assert np.isnan(na_q[0, OFFER]) and np.isnan(na_q[1, BID])
+    assert offline.fitted_q(offline.TransitionLog()).shape[0] == 0
+
+
+def test_importance_sampling_by_hand():
+    obj_log = two_episodes()
+    assert len(obj_log) == 4 and list(obj_log['episode']) == [0, 0, 1, 1]
+    # the behavior policy itself has ratios of 1
+    na_probs = np.zeros((4, qtable.N_ACTIONS))
+    na_probs[np.arange(4), obj_log['action']] = obj_log['prob']
+    f_aux = offline.importance_sampling(obj_log, na_probs, b_weighted=False)
+    assert abs(f_aux - (1. + 2. + 4. + 8.) / 2.) < 1e-9
+    # a policy that always takes BEST_BID. The ratios are 2 and 0, and the
+    # fill keeps a ratio of 1, although its action would not be taken
+    na_probs = np.zeros((4, qtable.N_ACTIONS))
+    na_probs[:, BID] = 1.
+    f_aux = offline.importance_sampling(obj_log, na_probs, b_weighted=False)
+    assert abs(f_aux - (2. * 1. + 2. * 0. * 2. + 0. + 0.) / 2.) < 1e-9
+    # weighted, the weights of each step are normalized across episodes
+    f_aux = offline.importance_sampling(obj_log, na_probs)
+    assert abs(f_aux - (2. / 1. * 1. + 0. + 0. + 0.) / 2.) < 1e-9
+
+
+def test_log_round_trip(tmpdir):
+    obj_log = two_episodes()
+    s_fname = str(tmpdir.join('log.npz'))
+    obj_log.save(s_fname)
+    obj_aux = offline.TransitionLog.load(s_fname)
+    assert len(obj_aux) == len(obj_log)
+    assert obj_aux.indexer.l_states == obj_log.indexer.l_states
+    for s_key in obj_log.d_data:
+        assert (obj_aux[s_key] == obj_log[s_key]).all()
+
+
+def test_agent_logs_the_action_chosen(env):
+    # BEST_BOTH is rebuilt as BEST_OFFER from the messages sent, but the
+    # probability recorded is the one of choosing BEST_BOTH
+    agent = env.primary_agent
+    agent.transition_log = offline.TransitionLog()
+    agent.old_key, agent.state_key = 'old', 'new'
+    agent.last_action, agent.last_reward = 'BEST_OFFER', 0.
+    agent.old_chosen_action, agent.f_old_prob = 'BEST_BOTH', 0.2
+    agent._store_transition({})
+    # a fill was not chosen and keeps the action of the update
+    agent.b_old_fill = True
+    agent._store_transition({})
+    l_actions = [qtable.l_actions[i] for i in agent.transition_log['action']]
+    assert l_actions == ['BEST_BOTH', 'BEST_OFFER']
+    assert list(agent.transition_log['prob']) == [0.2, 0.2]
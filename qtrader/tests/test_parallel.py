@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the merge of the Q-tables trained by the parallel workers
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import parallel
+import qtable
+
+
+def test_untouched_entries_do_not_weight():
+    '''
+    Only the entries changed by a worker without visits counting should
+    weight in the merge
+    '''
+    na_q = np.empty((2, qtable.N_ACTIONS))
+    na_q.fill(np.nan)
+    na_q[:, 0] = [1., 2.]
+    t_master = (['a', 'b'], na_q, np.where(np.isnan(na_q), 0., 3.))
+    # the worker updates one entry of 'a' and creates the state 'c'
+    na_worker = np.vstack([na_q, na_q[:1]])
+    na_worker[0, 0] = 5.
+    l_states = ['a', 'b', 'c']
+    na_n, na_changed = parallel.master_visits(t_master, l_states, na_worker)
+    na_n[na_changed] += 1.
+    assert na_changed.sum() == 2
+    assert na_n[0, 0] == 4. and na_n[1, 0] == 3. and na_n[2, 0] == 1.
+    # another worker leaves the table untouched
+    na_n2, na_changed2 = parallel.master_visits(t_master, ['a', 'b'], na_q)
+    assert not na_changed2.any()
+    l_rtn, na_new_q, na_new_n = parallel.merge_tables(
+        t_master, [(l_states, na_worker, na_n), (['a', 'b'], na_q, na_n2)])
+    assert l_rtn == l_states
+    assert na_new_q[0, 0] == 5. and na_new_q[1, 0] == 2.
+    assert na_new_n[0, 0] == 4. and na_new_n[1, 0] == 3.
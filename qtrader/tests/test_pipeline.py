@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the composition, the threads and the profile of the pipeline stages
+and the parser of the timestamps
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import StringIO
+import threading
+import time
+import pytest
+
+import pipeline
+
+
+'''
+Begin help functions
+'''
+
+
+def counter(l_closed):
+    '''
+    Yield the integers forever, marking in l_closed when it is closed
+    :param l_closed: list. Receives True when the generator is closed
+    '''
+    try:
+        i_aux = 0
+        while True:
+            yield i_aux
+            i_aux += 1
+    finally:
+        l_closed.append(True)
+
+
+def double(stream):
+    '''
+    Yield the items of the stream multiplied by two
+    :param stream: iterator. integers
+    '''
+    for i_aux in stream:
+        yield i_aux * 2
+
+
+def add(stream, i_value):
+    '''
+    Yield the items of the stream plus the value passed
+    :param stream: iterator. integers
+    :param i_value: integer. The value added, as the order matching is
+    '''
+    for i_aux in stream:
+        yield i_aux + i_value
+
+
+def failing(stream):
+    '''
+    Yield the first item of the stream and raise an error
+    :param stream: iterator. Any items
+    '''
+    for obj in stream:
+        yield obj
+        raise ValueError('stage failed')
+
+
+'''
+End help functions
+'''
+
+
+def test_compose_chains_the_stages():
+    l_stages = [(double, False), (add, True)]
+    stream = pipeline.compose(iter([1, 2, 3]), l_stages, 10)
+    assert list(stream) == [12, 14, 16]
+
+
+def test_source_closes_the_file():
+    fr = StringIO.StringIO(',Date,Type,Price,Size\n0,d,BID,1.0,100\n')
+    l_rows = list(pipeline.source(fr))
+    assert l_rows[0]['Type'] == 'BID'
+    assert fr.closed
+
+
+def test_threaded_stops_when_dropped():
+    # the consumer leaves before the end of the stream, with the queue full
+    l_closed = []
+    i_before = threading.active_count()
+    stream = pipeline.threaded(counter(l_closed), i_maxsize=4)
+    assert [stream.next() for i in range(10)] == range(10)
+    time.sleep(0.05)
+    stream.close()
+    for i_wait in range(50):
+        if l_closed and threading.active_count() == i_before:
+            break
+        time.sleep(0.05)
+    assert l_closed == [True]
+    assert threading.active_count() == i_before
+
+
+def test_threaded_raises_in_the_consumer():
+    stream = pipeline.threaded(failing(iter(range(5))))
+    assert stream.next() == 0
+    with pytest.raises(ValueError):
+        stream.next()
+
+
+def test_profile_measures_each_stage():
+    l_stages = [(double, False), (add, True)]
+    stream, d_times = pipeline.profile(iter(range(100)), l_stages, 1)
+    assert list(stream) == [i * 2 + 1 for i in range(100)]
+    l_times = pipeline.stage_times(d_times, ['source', 'double', 'add'])
+    assert [s_name for s_name, f_time in l_times] == ['source', 'double',
+                                                      'add']
+    assert all(f_time >= -1e-6 for s_name, f_time in l_times)
+
+
+def test_time_parser_with_and_without_fractions():
+    parse_time = pipeline.TimeParser()
+    i_base = (10 * 3600 + 30 * 60) * pipeline.US_PER_SECOND
+    assert parse_time('2016-07-25 10:30:00') == i_base
+    assert parse_time('2016-07-25 10:30:00.25') == i_base + 250000
+    assert parse_time('2016-07-25 10:30:00.250') == i_base + 250000
+    assert parse_time('2016-07-25 10:30:00.000007') == i_base + 7
+    # digits beyond the microseconds are dropped
+    assert parse_time('2016-07-25 10:30:00.9999999') == i_base + 999999
+    # the clock alone, as the rows cut by the analysis
+    assert parse_time('10:30:00.5') == i_base + 500000
+    assert pipeline.parse_seconds('2016-07-25 10:30:00.999') == \
+        i_base // pipeline.US_PER_SECOND
+
+
+def test_time_parser_across_seconds():
+    parse_time = pipeline.TimeParser()
+    l_dates = ['2016-07-25 10:30:59.900', '2016-07-25 10:30:59.950',
+               '2016-07-25 10:31:00', '2016-07-25 10:31:00.001',
+               '2016-07-25 11:00:00.5', '2016-07-26 10:00:00',
+               '2016-07-26 10:00:00.5']
+    l_times = [parse_time(s_date) for s_date in l_dates]
+    l_expected = []
+    for s_date in l_dates:
+        s_clock, _, s_frac = s_date[11:].partition('.')
+        i_hour, i_min, i_sec = [int(s_aux) for s_aux in s_clock.split(':')]
+        i_sec += i_hour * 3600 + i_min * 60
+        f_frac = float('0.' + s_frac) if s_frac else 0.
+        l_expected.append(i_sec * pipeline.US_PER_SECOND +
+                          int(round(f_frac * pipeline.US_PER_SECOND)))
+    assert l_times == l_expected
+    # a new day starts again from the midnight
+    assert l_times[5] < l_times[4]
+    assert parse_time.s_last == '10:00:00'
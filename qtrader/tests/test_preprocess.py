@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test that the models used by the scalers are loaded once by process
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import pickle
+
+import models
+import preprocess
+
+
+def test_load_model_returns_the_same_object(tmpdir, monkeypatch):
+    monkeypatch.setattr(preprocess, 'd_models', {})
+    l_loaded = []
+    pickle_load = pickle.load
+
+    def counting_load(fr):
+        l_loaded.append(fr.name)
+        return pickle_load(fr)
+    monkeypatch.setattr(pickle, 'load', counting_load)
+    s_fname = models.d_pickles['kmeans_2']
+    obj_model = preprocess.load_model(s_fname)
+    assert preprocess.load_model(s_fname) is obj_model
+    assert preprocess.load_model(models.d_pickles['pca']) is not obj_model
+    assert l_loaded == [s_fname, models.d_pickles['pca']]
+    # without the archive, the scalers share the pickled objects
+    monkeypatch.setattr(models, 'S_ARCHIVE', str(tmpdir.join('none.bin')))
+    obj_a = preprocess.LessClustersScaler()
+    obj_b = preprocess.LessClustersScaler()
+    assert obj_a.kmeans is obj_model and obj_b.kmeans is obj_model
+    assert obj_a.d_scale['OFI'] is obj_b.d_scale['OFI']
+    assert len(l_loaded) == len(set(l_loaded))
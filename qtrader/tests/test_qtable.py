@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the hashed Q-table store, the packing of the states and the binary
+Q-table format
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+from collections import defaultdict
+import shutil
+import numpy as np
+
+import qtable
+
+
+'''
+Begin help functions
+'''
+
+
+def make_state(i_cluster, f_position, b_bid, b_offer):
+    '''
+    Return a state in the format built by the learning agents
+    :param i_cluster: integer. The cluster of the inputs
+    :param f_position: float. The position of the agent
+    :param b_bid: boolean. If the agent has an order at the best bid
+    :param b_offer: boolean. If the agent has an order at the best offer
+    '''
+    d_state = {}
+    d_state['cluster'] = i_cluster
+    d_state['Position'] = f_position
+    d_state['best_bid'] = b_bid
+    d_state['best_offer'] = b_offer
+    return d_state
+
+
+def as_dict(q_table):
+    '''
+    Return the Q-table as plain dictionaries, to be compared
+    :param q_table: dictionary. A Q-table
+    '''
+    return dict((s_state, dict(d_row)) for s_state, d_row in
+                q_table.iteritems())
+
+
+def make_table():
+    '''
+    Return a Q-table keyed by the strings of some states
+    '''
+    q_table = defaultdict(lambda: defaultdict(float))
+    q_table[str(make_state(3, 0., False, False))]['BEST_BID'] = 1.5
+    q_table[str(make_state(3, 0., False, False))][None] = -0.25
+    q_table[str(make_state(0, -200., True, False))]['BUY'] = 2.
+    q_table[str(make_state(9, 100., False, True))]['SELL'] = 0.
+    return q_table
+
+
+'''
+End help functions
+'''
+
+
+def test_pack_state_round_trip():
+    for t_args in [(0, 0., False, False), (3, -100., True, False),
+                   (9, 300., True, True), (5, -2.5e4, False, True)]:
+        d_state = make_state(*t_args)
+        i_key = qtable.pack_state(d_state)
+        assert isinstance(i_key, (int, long)) and i_key >= 0
+        assert qtable.state_to_str(i_key) == str(d_state)
+        assert qtable.str_to_state(str(d_state)) == i_key
+
+
+def test_hashed_store_reads_do_not_insert():
+    store = qtable.HashedQStore(i_capacity=2)
+    i_key = qtable.pack_state(make_state(1, 0., False, False))
+    assert store[i_key]['BUY'] == 0.
+    assert i_key not in store and len(store) == 0
+    for i in range(100):
+        store[qtable.pack_state(make_state(i, 0., False, False))][None] = i
+    assert len(store) == 100
+    assert store[qtable.pack_state(make_state(42, 0., False, False))][None] \
+        == 42.
+    assert store.get(i_key).keys() == [None]
+
+
+def test_qtb_round_trip(tmpdir):
+    q_table = make_table()
+    s_fname = str(tmpdir.join('table.qtb'))
+    assert qtable.save_qtable(s_fname, q_table, d_params={'f_gamma': 0.5})
+    # the same content is not written again
+    assert not qtable.save_qtable(s_fname, q_table)
+    d_header, na_q = qtable.load_qtable(s_fname)
+    assert d_header['params'] == {'f_gamma': 0.5}
+    assert d_header['states'] == sorted(q_table)
+    q_loaded = qtable.read_qtable(s_fname)
+    assert dict((s, dict(d)) for s, d in q_loaded.iteritems()) == \
+        dict((s, dict(d)) for s, d in q_table.iteritems())
+
+
+def test_hashed_store_saves_the_same_table(tmpdir):
+    q_table = make_table()
+    store = qtable.HashedQStore.from_table(q_table)
+    assert all(isinstance(state, (int, long)) for state in store)
+    l_states, na_q = qtable.qtable_to_arrays(q_table)
+    l_states2, na_q2 = qtable.qtable_to_arrays(store)
+    assert l_states == l_states2
+    assert np.array_equal(np.isnan(na_q), np.isnan(na_q2))
+    assert np.array_equal(np.nan_to_num(na_q), np.nan_to_num(na_q2))
+    # load a file in a store
+    s_fname = str(tmpdir.join('table.qtb'))
+    qtable.save_qtable(s_fname, store)
+    d_header, na_q3 = qtable.load_qtable(s_fname)
+    store2 = qtable.arrays_to_qtable(d_header['states'], na_q3,
+                                     qtable.HashedQStore())
+    assert sorted(store2) == sorted(store)
+
+
+def test_save_checks_the_header_of_the_file(tmpdir):
+    # other process rewrites the file between two saves of the same table
+    q_table = make_table()
+    q_other = make_table()
+    q_other[str(make_state(1, 0., False, False))]['BEST_OFFER'] = 3.
+    s_fname = str(tmpdir.join('table.qtb'))
+    s_other = str(tmpdir.join('other.qtb'))
+    assert qtable.save_qtable(s_fname, q_table)
+    assert qtable.save_qtable(s_other, q_other)
+    shutil.copy(s_other, s_fname)
+    assert qtable.save_qtable(s_fname, q_table)
+    assert as_dict(qtable.read_qtable(s_fname)) == as_dict(q_table)
+    # a file that is not a binary Q-table is replaced
+    with open(s_fname, 'wb') as fw:
+        fw.write('garbage')
+    assert qtable.save_qtable(s_fname, q_table)
+
+
+def test_legacy_round_trip(tmpdir):
+    # the None action is saved in a column without name, 'Unnamed: 1'
+    q_table = make_table()
+    s_log = str(tmpdir.join('table.log'))
+    s_bin = str(tmpdir.join('table.qtb'))
+    s_log2 = str(tmpdir.join('table2.log'))
+    qtable.write_legacy_qtable(s_log, q_table)
+    assert 'Unnamed' not in open(s_log).read()
+    assert as_dict(qtable.read_qtable(s_log)) == as_dict(q_table)
+    qtable.convert_log_to_bin(s_log, s_bin, d_params={'f_k': 0.8})
+    assert qtable.read_header(s_bin)[0]['params'] == {'f_k': 0.8}
+    assert as_dict(qtable.read_qtable(s_bin)) == as_dict(q_table)
+    qtable.convert_bin_to_log(s_bin, s_log2)
+    assert as_dict(qtable.read_legacy_qtable(s_log2)) == as_dict(q_table)
+    d_header, na_q = qtable.load_qtable(s_bin, b_mmap=True)
+    assert isinstance(na_q, np.memmap) and na_q.shape == (3, qtable.N_ACTIONS)
@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the recorder of the PnL series of the agents
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import recorder
+
+
+def test_series_round_trip(tmpdir):
+    obj_rec = recorder.SeriesRecorder(i_capacity=2)
+    for i in range(5):
+        obj_rec.append(37800 + i, i * 100., 15. * i, 0., 15.005, -i, 0.5)
+    assert len(obj_rec) == 5
+    s_fname = recorder.series_fname(str(tmpdir), 'Agent11', 'train', 1, 2)
+    d_info = {'agent': 'Agent11', 'phase': 'train', 'trial': 1,
+              'session': 2, 'date': '2016-07-25'}
+    obj_rec.flush(s_fname, d_info)
+    assert len(obj_rec) == 0
+    assert recorder.list_series(str(tmpdir), 'Agent11') == [s_fname]
+    na_series, d_load = recorder.load_series(s_fname)
+    assert d_load == d_info
+    assert list(na_series['time']) == range(37800, 37805)
+    assert list(na_series['position']) == [0., 100., 200., 300., 400.]
+
+
+def test_recording_is_opt_in(env, tmpdir):
+    agent = env.primary_agent
+    assert env.d_recorders == {}
+    env.add_recorder(agent)
+    env.d_recorders[agent.i_id].append(37800, 0., 0., 0., 15., 0., 0.)
+    env.flush_recorders('test', 3, 1, s_dir=str(tmpdir))
+    l_files = recorder.list_series(str(tmpdir), agent.s_agent_name)
+    assert [s.split('/')[-1] for s in l_files] == \
+        ['{}_test_0003_001.npz'.format(agent.s_agent_name)]
+    env.remove_agent(agent)
+    assert env.d_recorders == {}
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the registry of the agents and the views over the state of each one
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import pytest
+
+import registry
+
+
+'''
+Begin help functions
+'''
+
+
+class FakeAgent(object):
+    '''
+    The minimal agent kept by the registry
+    '''
+
+    def __init__(self, i_id):
+        '''
+        Initialize a FakeAgent object. Save all parameters as attributes
+        :param i_id: integer. The agent id
+        '''
+        self.i_id = i_id
+
+
+'''
+End help functions
+'''
+
+
+def test_add_grows_and_replaces():
+    obj_reg = registry.AgentRegistry(i_capacity=2)
+    l_agents = [FakeAgent(i) for i in [10, 11, 12]]
+    for i, agent in enumerate(l_agents):
+        assert obj_reg.add(agent) == i
+        obj_reg[agent]['Position'] = i + 1.
+    assert obj_reg.i_capacity == 4 and len(obj_reg) == 3
+    assert list(obj_reg.column('Position')) == [1., 2., 3.]
+    # the same id takes the slot, with a clean state
+    agent = FakeAgent(11)
+    assert obj_reg.add(agent) == 1
+    assert obj_reg.get_agent(11) is agent
+    assert list(obj_reg.column('Position')) == [1., 0., 3.]
+    assert list(obj_reg) == [l_agents[0], agent, l_agents[2]]
+
+
+def test_remove_keeps_the_slots_contiguous():
+    obj_reg = registry.AgentRegistry()
+    l_agents = [FakeAgent(i) for i in [10, 11, 12]]
+    for i, agent in enumerate(l_agents):
+        obj_reg.add(agent)
+        obj_reg[agent]['Pnl'] = i * 10.
+        obj_reg[agent]['best_bid'] = i == 2
+    obj_reg.remove(10)
+    assert len(obj_reg) == 2 and 10 not in obj_reg
+    assert l_agents[0] not in obj_reg and l_agents[2] in obj_reg
+    # the last agent took the slot of the removed one
+    assert obj_reg.slot(l_agents[2]) == 0
+    assert obj_reg[12]['Pnl'] == 20. and obj_reg[12]['best_bid'] is True
+    assert obj_reg[11]['Pnl'] == 10.
+    assert list(obj_reg.column('Pnl')) == [20., 10.]
+    assert obj_reg.d_columns['Pnl'][2] == 0.
+    with pytest.raises(registry.UnknownAgentException):
+        obj_reg[10]
+    with pytest.raises(registry.UnknownAgentException):
+        obj_reg.remove(l_agents[0])
+
+
+def test_state_view_behaves_like_the_dictionary():
+    obj_reg = registry.AgentRegistry()
+    agent = FakeAgent(7)
+    obj_reg.add(agent)
+    d_state = obj_reg[agent]
+    d_state['Bid'] = 15.01
+    d_state['qBid'] = 300
+    assert obj_reg[7] is d_state
+    assert 'Ask' in d_state and 'Agent' in d_state and 'foo' not in d_state
+    assert d_state['Agent'] is agent
+    d_aux = d_state.to_dict()
+    assert set(d_aux) == set(registry.AgentRegistry.l_columns +
+                             registry.AgentRegistry.l_flags + ['Agent'])
+    assert d_aux['Bid'] == 15.01 and d_aux['qBid'] == 300.
+    assert d_aux['best_offer'] is False
+    obj_reg.reset()
+    assert d_state['Bid'] == 0. and d_state['Agent'] is agent
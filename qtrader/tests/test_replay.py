@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the experience replay buffer and its use by the learning agents
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+from replay import ExperienceReplay
+
+
+def test_ring_buffer_overwrites_the_oldest():
+    obj_replay = ExperienceReplay(i_capacity=3, i_seed=0)
+    for i in range(5):
+        obj_replay.add(i, 0, float(i), i + 1, 1)
+    assert len(obj_replay) == 3
+    assert sorted(obj_replay.na_state) == [2, 3, 4]
+
+
+def test_prioritized_sample_weights():
+    obj_replay = ExperienceReplay(i_capacity=10, b_prioritized=True,
+                                  i_seed=0)
+    for i in range(10):
+        obj_replay.add(i, 0, 0., i, 1)
+    obj_replay.update_priorities(np.arange(10), np.arange(10.))
+    na_idx, na_weight = obj_replay.sample(32)
+    assert na_idx.min() >= 0 and na_idx.max() < 10
+    assert na_weight.max() == 1.
+    # the transition with the smallest TD-error is the least likely
+    assert (na_idx == 0).sum() < (na_idx == 9).sum()
+
+
+def test_agent_fills_an_empty_buffer(env):
+    # an empty buffer has length zero, so it should not be used as a flag
+    from simulator import Simulator
+    agent = env.primary_agent
+    agent.set_replay(i_capacity=1000, i_batch_size=8, i_replay_every=5)
+    assert len(agent.replay) == 0
+    sim = Simulator(env, update_delay=1.00, display=False)
+    sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+    assert len(agent.replay) > 0
+
+
+def test_online_update_uses_the_valid_actions(env):
+    # the online update and the replay take the max over the same actions
+    import qtable
+    agent = env.primary_agent
+    agent.old_state = {'aux': 0}
+    agent.old_key, agent.state_key = 'old', 'new'
+    agent.last_action, agent.last_reward = 'BEST_BID', 1.
+    agent.q_table['new']['SELL'] = 10.
+    agent.q_table['new']['BEST_OFFER'] = 2.
+    agent.i_valid_mask = qtable.actions_to_mask([None, 'BEST_BID',
+                                                 'BEST_OFFER', 'BEST_BOTH'])
+    agent._apply_policy({'aux': 1}, None, 0.)
+    assert agent.q_table['old']['BEST_BID'] == 1. + agent.f_gamma * 2.
+    na_q = qtable.dense_rows(agent.q_table, agent.state_index,
+                             [agent.state_index.get('new')])
+    assert qtable.max_q(na_q, [agent.i_valid_mask])[0] == 2.
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the rolling-window aggregates against sums computed from scratch
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import numpy as np
+
+import pipeline
+import rolling
+
+
+def test_windows_match_the_brute_force():
+    # a small ring forces it to grow while the largest window is open
+    rng = np.random.RandomState(0)
+    obj_roll = rolling.RollingWindows(l_windows=(1, 10), i_capacity=4)
+    l_time, l_ofi, l_mid = [], [], []
+    i_time, f_ofi, f_mid = 0, 0., 15.
+    for i_row in xrange(500):
+        i_time += rng.randint(0, 3) * pipeline.US_PER_SECOND // 2
+        f_ofi += rng.randint(-300, 301)
+        f_mid += rng.randint(-1, 2) * 0.01
+        obj_roll.update(i_time, f_ofi, 0., 0., f_mid)
+        if l_time and l_time[-1] == i_time:
+            l_ofi[-1], l_mid[-1] = f_ofi, f_mid
+        else:
+            l_time.append(i_time)
+            l_ofi.append(f_ofi)
+            l_mid.append(f_mid)
+        for i_window in obj_roll.l_windows:
+            i_start = i_time - i_window * pipeline.US_PER_SECOND
+            l_before = [i for i, i_aux in enumerate(l_time)
+                        if i_aux <= i_start]
+            f_base_ofi, f_base_mid = 0., l_mid[0]
+            if l_before:
+                f_base_ofi = l_ofi[l_before[-1]]
+                f_base_mid = l_mid[l_before[-1]]
+            assert obj_roll.get('ofi', i_window) == f_ofi - f_base_ofi
+            f_aux = obj_roll.get('delta_mid', i_window)
+            assert abs(f_aux - (f_mid - f_base_mid)) < 1e-9
+    assert len(obj_roll.na_time) > 4
+
+
+def test_reset_clears_the_windows():
+    obj_roll = rolling.RollingWindows(l_windows=(1,))
+    obj_roll.update(0, 100., 200., 300., 15.)
+    obj_roll.reset()
+    assert obj_roll.i_head == -1
+    assert not obj_roll.na_values.any()
+    obj_roll.update(0, 5., 0., 0., 15.)
+    assert obj_roll.get('ofi', 1) == 5.
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the tile coding of the inputs and the weights of the TileCodingAgent
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import os
+import numpy as np
+import pytest
+
+import agent as agent_module
+import preprocess
+import simulator
+from environment import Environment
+from simulator import Simulator
+
+
+'''
+Begin help functions
+'''
+
+
+def features(**kwargs):
+    '''
+    Return the inputs of the tile coder, changing the values passed
+    '''
+    d_feat = {'OFI': 0., 'qBID': 1000., 'BOOK_RATIO': 1., 'LOG_RET': 0.,
+              'SPREAD': 1., 'POSITION': 0.}
+    d_feat.update(kwargs)
+    return d_feat
+
+
+def tile_env(s_fname, **kwargs):
+    '''
+    Return an environment with a TileCodingAgent as the primary agent
+    :param s_fname: string. the container zip file used in simulation
+    '''
+    e = Environment(s_fname=s_fname, i_idx=0)
+    a = e.create_agent(agent_module.TileCodingAgent, f_min_time=2., **kwargs)
+    e.set_primary_agent(a)
+    return e
+
+
+'''
+End help functions
+'''
+
+
+def test_tile_indexes():
+    obj_coder = preprocess.TileCoder(i_tilings=4, i_tiles=8, i_memory=101)
+    na_idx = obj_coder.transform(features())
+    assert na_idx.shape == (4,) and na_idx.dtype == np.int64
+    assert ((na_idx >= 0) & (na_idx < 101)).all()
+    assert list(obj_coder.transform(features())) == list(na_idx)
+    # the grids are offset, so a small change moves just some of the tiles
+    na_near = obj_coder.transform(features(OFI=400.))
+    i_shared = (na_near == na_idx).sum()
+    assert 0 < i_shared < 4
+    na_far = obj_coder.transform(features(OFI=4000.))
+    assert (na_far != na_idx).all()
+    # the values out of the bounds fall in the tiles of the edges
+    assert list(obj_coder.transform(features(OFI=1e6))) == \
+        list(obj_coder.transform(features(OFI=5000.)))
+    # the flags split all the grids
+    na_flag = obj_coder.transform(features(), [True, False])
+    assert (na_flag != obj_coder.transform(features(), [False, True])).all()
+    assert (na_flag != na_idx).all()
+
+
+def test_weights_round_trip(synth_zip, tmpdir, monkeypatch):
+    e = tile_env(synth_zip, i_memory=1009)
+    sim = Simulator(e, update_delay=1.00, display=False)
+    sim.train(n_trials=1, n_sessions=1, b_save_qtable=False)
+    na_weights = e.primary_agent.na_weights
+    assert np.abs(na_weights).sum() > 0.
+    s_fname = str(tmpdir.join('weights.npz'))
+    e.primary_agent.save_weights(s_fname)
+    with np.load(s_fname) as d_load:
+        assert int(d_load['tilings']) == 8 and float(d_load['alpha']) == 0.1
+    # the memory is taken from the file
+    obj_aux = tile_env(synth_zip).primary_agent
+    obj_aux.set_qtable(s_fname)
+    assert obj_aux.FROZEN_POLICY
+    assert obj_aux.i_memory == 1009
+    assert obj_aux.scaler.i_memory == 1009
+    assert np.array_equal(obj_aux.na_weights, na_weights)
+    with pytest.raises(AssertionError):
+        tile_env(synth_zip, i_tilings=4).primary_agent.set_qtable(s_fname)
+    # the simulator names the file by the format of the agent
+    monkeypatch.chdir(str(tmpdir))
+    os.makedirs('log/qtable')
+    simulator.save_q_table(e, 1)
+    s_saved = 'log/qtable/TileCodingAgent_qtable_1.npz'
+    with np.load(s_saved) as d_load:
+        assert np.array_equal(d_load['weights'], na_weights)
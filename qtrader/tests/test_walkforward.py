@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the folds of the walk-forward backtests and their cache
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import glob
+import json
+import os
+import numpy as np
+
+import cache
+import walkforward
+
+
+def test_build_folds():
+    l_folds = walkforward.build_folds(5, 2)
+    assert [d_fold['train_start'] for d_fold in l_folds] == [0, 1, 2]
+    assert [d_fold['test_start'] for d_fold in l_folds] == [2, 3, 4]
+    l_folds = walkforward.build_folds(6, 2, i_test=2, i_first=1)
+    assert [(d_fold['train_start'], d_fold['test_start'])
+            for d_fold in l_folds] == [(1, 3)]
+    l_folds = walkforward.build_folds(5, 1, i_step=2)
+    assert [d_fold['train_start'] for d_fold in l_folds] == [0, 2]
+
+
+def test_digest_covers_the_seed_and_the_code(synth_zip, monkeypatch):
+    d_fold = walkforward.build_folds(2, 1)[0]
+    l_args = [synth_zip, d_fold, 'LearningAgent_k', {'f_k': 0.8}, 1]
+    s_digest = walkforward.fold_digest(*(l_args + [0]))
+    assert walkforward.fold_digest(*(l_args + [0])) == s_digest
+    assert walkforward.fold_digest(*(l_args + [1])) != s_digest
+    monkeypatch.setattr(cache, 's_code_version', 'other code')
+    assert walkforward.fold_digest(*(l_args + [0])) != s_digest
+
+
+def test_tile_coding_folds_are_cached(synth_zip, tmpdir):
+    s_dir = str(tmpdir)
+    d_kwargs = {'f_min_time': 2.}
+    df = walkforward.walk_forward(synth_zip, 'TileCodingAgent', d_kwargs,
+                                  n_trials=1, n_workers=1, s_cache_dir=s_dir)
+    assert list(df['fold']) == [0]
+    # the test fold runs on the weights learned, not on an empty table
+    s_weights = glob.glob(os.path.join(s_dir, 'fold_000_*.npz'))[0]
+    with np.load(s_weights) as d_load:
+        assert np.abs(d_load['weights']).sum() > 0.
+    # the results cached are reused while the inputs are the same
+    s_result = glob.glob(os.path.join(s_dir, 'fold_000_*.json'))[0]
+    with open(s_result, 'r') as fr:
+        l_rows = json.load(fr)
+    l_rows[0]['pnl'] = 1234.
+    with open(s_result, 'w') as fw:
+        json.dump(l_rows, fw)
+    df = walkforward.walk_forward(synth_zip, 'TileCodingAgent', d_kwargs,
+                                  n_trials=1, n_workers=1, s_cache_dir=s_dir)
+    assert list(df['pnl']) == [1234.]
+    df = walkforward.walk_forward(synth_zip, 'TileCodingAgent', d_kwargs,
+                                  n_trials=1, n_workers=1, s_cache_dir=s_dir,
+                                  i_seed=1)
+    assert list(df['pnl']) != [1234.]
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Test the sweeps run by the pool of warm workers
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import logging
+import os
+import pytest
+
+import workers
+
+
+@pytest.fixture
+def sim_log(tmpdir):
+    '''
+    Log the messages of the test to a file, as setup_logging() does
+    '''
+    root = logging.getLogger()
+    i_level = root.level
+    obj_handler = logging.FileHandler(str(tmpdir.join('sim.log')))
+    root.addHandler(obj_handler)
+    root.setLevel(logging.DEBUG)
+    yield str(tmpdir)
+    root.removeHandler(obj_handler)
+    obj_handler.close()
+    root.setLevel(i_level)
+
+
+def run_sweep(s_fname, n_workers):
+    '''
+    Return the results of a sweep over k run by the number of workers passed
+    :param s_fname: string. the container zip file used in simulation
+    :param n_workers: integer. Number of processes
+    '''
+    l_kwargs = [{'f_min_time': 2., 'f_k': f_k, 'f_gamma': 0.5}
+                for f_k in [0.3, 2.]]
+    pool = workers.WarmPool(s_fname, 0, n_workers=n_workers)
+    try:
+        return pool.sweep('LearningAgent_k', l_kwargs, n_trials=2)
+    finally:
+        pool.close()
+
+
+def test_parallel_sweep_matches_the_serial_one(synth_zip, sim_log):
+    eda = pytest.importorskip('eda')
+    d_rtn = {}
+    for n_workers in [1, 2]:
+        l_results = run_sweep(synth_zip, n_workers)
+        l_logs = [d_result['s_log'] for d_result in l_results]
+        assert all(os.path.dirname(s_log) == sim_log for s_log in l_logs)
+        d_pnl = dict((d_result['d_kwargs']['f_k'], d_result['l_sessions'])
+                     for d_result in l_results)
+        d_rtn[n_workers] = (d_pnl, eda.count_by_k_gamma(
+            l_logs, 'LearningAgent_k', 'k'))
+    d_pnl, d_count = d_rtn[1]
+    assert d_rtn[2][0] == d_pnl
+    assert sorted(d_count) == ['0.3', '2.0']
+    for s_key, d_trials in d_count.iteritems():
+        assert sorted(d_trials) == [1, 2]
+        assert d_rtn[2][1][s_key] == d_trials
@@ -8,6 +8,9 @@ Translate messages from files and from agents to the matching engine
 Created on 09/16/2016
 """
 
+# global variable
+ZOMBIE_ID = 10  # id of the ZombieAgent, the owner of the historical flow
+
 
 def translate_trades(idx, row, my_ordmatch, s_side=None, i_id=None):
     '''
@@ -51,7 +54,7 @@ def translate_trades(idx, row, my_ordmatch, s_side=None, i_id=None):
     for idx_ord, order_aux in obj_price.order_tree.nsmallest(1000):
         # check the id of the aggressor
         if not i_id:
-            i_agrr = 10
+            i_agrr = ZOMBIE_ID
         else:
             i_agrr = i_id
         # define how much should be traded
@@ -160,11 +163,10 @@ def translate_row(idx, row, my_ordmatch, s_side=None):
         for f_price, obj_price in gen_bk:
             # assert obj_price.order_tree.count <= 2, 'More than two offers'
             for idx_ord, obj_order in obj_price.order_tree.nsmallest(1000):
-                # check if is the order from the primary agent
-                if my_ordmatch.env.primary_agent:
-                    i_primary_id = my_ordmatch.env.primary_agent.i_id
-                    if obj_order['agent_id'] == i_primary_id:
-                        continue
+                # check if is the order from the primary agent or from any
+                # background agent. Just the historical flow is changed here
+                if obj_order['agent_id'] != ZOMBIE_ID:
+                    continue
                 # check if should cancel the best price
                 b_cancel = False
                 # check if the price in the row in smaller
@@ -196,7 +198,7 @@ def translate_row(idx, row, my_ordmatch, s_side=None):
                     if row['Type'] == 'ASK':
                         s_action = 'BEST_OFFER'
                     b_replaced = True
-                    d_rtn = {'agent_id': 10,
+                    d_rtn = {'agent_id': ZOMBIE_ID,
                              'instrumento_symbol': 'PETR4',
                              'order_id': i_new_id,
                              'order_entry_step': idx,
@@ -215,7 +217,7 @@ def translate_row(idx, row, my_ordmatch, s_side=None):
             s_action = 'BEST_BID'
             if row['Type'] == 'ASK':
                 s_action = 'BEST_OFFER'
-            d_rtn = {'agent_id': 10,
+            d_rtn = {'agent_id': ZOMBIE_ID,
                      'instrumento_symbol': 'PETR4',
                      'order_id': my_book.i_last_order_id + 1,
                      'order_entry_step': idx,
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Run walk-forward backtests over all the files of a zip archive. The train and
+test windows slide across the days, the folds are scheduled in a pool of
+processes and the Q-table and the results of each fold are cached, so folds
+whose inputs did not change are not simulated again
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import zipfile
+import numpy as np
+import pandas as pd
+
+from simulator import Simulator
+import agent as agent_module
+import cache
+import qtable
+import workers
+
+# global variable
+DEBUG = True
+
+'''
+Begin help functions
+'''
+
+
+def build_folds(i_nfiles, i_train, i_test=1, i_step=None, i_first=0):
+    '''
+    Return a list of dictionaries describing each fold. The train window of a
+    fold is followed by its test window, and each fold starts i_step files
+    after the previous one
+    :param i_nfiles: integer. Number of files in the archive
+    :param i_train: integer. Number of files used to train
+    :*param i_test: integer. Number of files used to test
+    :*param i_step: integer. Files between the start of two folds. Default is
+        the size of the test window
+    :*param i_first: integer. Index of the first file used
+    '''
+    if not i_step:
+        i_step = i_test
+    l_folds = []
+    i_start = i_first
+    while i_start + i_train + i_test <= i_nfiles:
+        l_folds.append({'fold': len(l_folds),
+                        'train_start': i_start,
+                        'n_train': i_train,
+                        'test_start': i_start + i_train,
+                        'n_test': i_test})
+        i_start += i_step
+    return l_folds
+
+
+def fold_digest(s_fname, d_fold, s_agent, d_kwargs, n_trials, i_seed):
+    '''
+    Return a hash of everything that defines the result of a fold: the files
+    used (name, CRC and size), the agent, the training setup, the seed and
+    the version of the code
+    :param s_fname: string. the container zip file used in simulation
+    :param d_fold: dictionary. The fold description from build_folds()
+    :param s_agent: string. The name of the agent class
+    :param d_kwargs: dictionary. Parameters used to create the agent
+    :param n_trials: integer. Iterations over the train files
+    :param i_seed: integer. Seed of the random number generators of the fold
+    '''
+    with zipfile.ZipFile(s_fname, 'r') as archive:
+        l_info = archive.infolist()
+    i_end = d_fold['test_start'] + d_fold['n_test']
+    l_files = [(x.filename, x.CRC, x.file_size)
+               for x in l_info[d_fold['train_start']:i_end]]
+    d_inputs = {'files': l_files,
+                'n_train': d_fold['n_train'],
+                'agent': s_agent,
+                'kwargs': d_kwargs,
+                'n_trials': n_trials,
+                'seed': i_seed,
+                'code': cache.code_version()}
+    s_inputs = json.dumps(d_inputs, sort_keys=True)
+    return hashlib.md5(s_inputs).hexdigest()
+
+
+def _create_env(s_fname, i_idx, s_agent, d_kwargs):
+    '''
+    Return an environment with the primary agent already created
+    :param s_fname: string. the container zip file used in simulation
+    :param i_idx: integer. The index of the start file to be read
+    :param s_agent: string. The name of the agent class
+    :param d_kwargs: dictionary. Parameters used to create the agent
+    '''
+    # reuse the environment of the process from the previous jobs
+    return workers.warm_env(s_fname, i_idx, s_agent, d_kwargs)
+
+
+def _run_fold(d_job):
+    '''
+    Train and test the agent in one fold, reusing the cached Q-table and
+    results when they exist. Return a list of dictionaries with the PnL of
+    each test session. Used by the process pool
+    :param d_job: dictionary. The description of the job
+    '''
+    d_fold = d_job['d_fold']
+    s_base = os.path.join(d_job['s_cache_dir'], 'fold_{:03d}_{}')
+    s_base = s_base.format(d_fold['fold'], d_job['s_digest'])
+    s_qtable = s_base + getattr(agent_module, d_job['s_agent']).s_qtable_ext
+    s_result = s_base + '.json'
+    if os.path.exists(s_result) and not d_job['b_force']:
+        with open(s_result, 'r') as fr:
+            return json.load(fr)
+    random.seed(d_job['i_seed'])
+    np.random.seed(d_job['i_seed'])
+    # train the agent, when there is no Q-table for this fold
+    if not os.path.exists(s_qtable) or d_job['b_force']:
+        e = _create_env(d_job['s_fname'], d_fold['train_start'],
+                        d_job['s_agent'], d_job['d_kwargs'])
+        sim = Simulator(e, update_delay=1.00, display=False)
+        sim.train(n_trials=d_job['n_trials'],
+                  n_sessions=d_fold['n_train'],
+                  b_save_qtable=False)
+        agent = e.primary_agent
+        if hasattr(agent, 'save_weights'):
+            # the agents that approximate the Q-values keep just weights
+            agent.save_weights(s_qtable)
+        else:
+            d_params = dict(d_job['d_kwargs'])
+            d_params.update({'agent': d_job['s_agent'],
+                             'fold': d_fold['fold']})
+            q_table = getattr(agent, 'q_table', {})
+            qtable.save_qtable(s_qtable, q_table, d_params=d_params)
+    # test the policy learned in the files that follow the train window
+    e = _create_env(d_job['s_fname'], d_fold['train_start'],
+                    d_job['s_agent'], d_job['d_kwargs'])
+    sim = Simulator(e, update_delay=1.00, display=False)
+    sim.test(s_qtable=s_qtable,
+             n_trials=1,
+             n_sessions=d_fold['n_test'],
+             i_idx=d_fold['test_start'])
+    l_rtn = []
+    for d_session in sim.l_session_pnl:
+        d_row = dict(d_fold)
+        d_row.update(d_session)
+        l_rtn.append(d_row)
+    with open(s_result, 'w') as fw:
+        json.dump(l_rtn, fw)
+    return l_rtn
+
+
+'''
+End help functions
+'''
+
+
+def walk_forward(s_fname, s_agent='LearningAgent_k', d_kwargs=None,
+                 i_train=1, i_test=1, i_step=None, i_first=0, n_trials=5,
+                 n_workers=None, s_cache_dir='log/walkforward', i_seed=0,
+                 b_force=False):
+    '''
+    Slide train and test windows across all files of the archive and return a
+    DataFrame with the PnL of each test session of each fold
+    :param s_fname: string. the container zip file used in simulation
+    :*param s_agent: string. The name of the agent class
+    :*param d_kwargs: dictionary. Parameters used to create the agent
+    :*param i_train: integer. Number of files used to train in each fold
+    :*param i_test: integer. Number of files used to test in each fold
+    :*param i_step: integer. Files between the start of two folds
+    :*param i_first: integer. Index of the first file used
+    :*param n_trials: integer. Iterations over the train files
+    :*param n_workers: integer. Number of processes. Default is the cpu count
+    :*param s_cache_dir: string. Folder where the folds are cached
+    :*param i_seed: integer. Base seed of the random number generators
+    :*param b_force: boolean. If should ignore the cached folds
+    '''
+    if not d_kwargs:
+        d_kwargs = {}
+    if not os.path.exists(s_cache_dir):
+        os.makedirs(s_cache_dir)
+    with zipfile.ZipFile(s_fname, 'r') as archive:
+        i_nfiles = len(archive.infolist())
+    l_folds = build_folds(i_nfiles, i_train, i_test, i_step, i_first)
+    l_jobs = []
+    for d_fold in l_folds:
+        s_digest = fold_digest(s_fname, d_fold, s_agent, d_kwargs, n_trials,
+                               i_seed + d_fold['fold'])
+        l_jobs.append({'s_fname': s_fname,
+                       'd_fold': d_fold,
+                       's_agent': s_agent,
+                       'd_kwargs': d_kwargs,
+                       'n_trials': n_trials,
+                       's_cache_dir': s_cache_dir,
+                       's_digest': s_digest,
+                       'i_seed': i_seed + d_fold['fold'],
+                       'b_force': b_force})
+    s_msg = 'walk_forward(): Running {} folds of {} files'
+    s_msg = s_msg.format(len(l_jobs), i_nfiles)
+    if DEBUG:
+        logging.info(s_msg)
+    else:
+        print s_msg
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        l_results = pool.map(_run_fold, l_jobs)
+    finally:
+        pool.close()
+        pool.join()
+    l_rows = [d_row for l_fold in l_results for d_row in l_fold]
+    l_cols = ['fold', 'train_start', 'n_train', 'test_start', 'n_test',
+              'phase', 'trial', 'file', 'pnl', 'position']
+    df = pd.DataFrame(l_rows, columns=l_cols)
+    df.to_csv(os.path.join(s_cache_dir, 'walk_forward.csv'), index=False)
+    return df
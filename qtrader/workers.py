@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Implement a pool of pre-forked workers to run sweeps of short simulations.
+Each worker keeps its environments (the archive opened, the order matching
+and the ZombieAgent) and the scaler models loaded between the jobs, so a job
+is just a small dictionary with the agent and the parameters to be used
+
+@author: ucaiado
+
+Created on 10/19/2026
+"""
+import logging
+import multiprocessing
+import os
+import random
+import numpy as np
+
+from environment import Environment
+from simulator import Simulator
+
+# global variable
+DEBUG = True
+
+# the environments kept by the process, by zip file
+d_envs = {}
+
+'''
+Begin help functions
+'''
+
+
+def warm_env(s_fname, i_idx, s_agent, d_kwargs):
+    '''
+    Return the environment of the process for the zip file passed, creating
+    it only in the first call, with a new primary agent. The primary agent of
+    the last call is removed
+    :param s_fname: string. the container zip file used in simulation
+    :param i_idx: integer. The index of the start file to be read
+    :param s_agent: string. The name of the agent class
+    :param d_kwargs: dictionary. Parameters used to create the agent
+    '''
+    import agent as agent_module
+    e = d_envs.get(s_fname)
+    if e is None:
+        e = Environment(s_fname=s_fname, i_idx=i_idx)
+        d_envs[s_fname] = e
+    elif e.primary_agent is not None:
+        e.remove_agent(e.primary_agent)
+    e.initial_idx = i_idx
+    e.count_trials = 1
+    e.done = False
+    a = e.create_agent(getattr(agent_module, s_agent), **d_kwargs)
+    e.set_primary_agent(a)
+    return e
+
+
+def log_to(s_log):
+    '''
+    Send the messages logged by the process to the file passed instead of the
+    log files inherited from the parent process. Return the handler created
+    :param s_log: string. Path to the log file
+    '''
+    root = logging.getLogger()
+    for obj_handler in list(root.handlers):
+        if isinstance(obj_handler, logging.FileHandler):
+            root.removeHandler(obj_handler)
+            obj_handler.close()
+    obj_handler = logging.FileHandler(s_log, mode='w')
+    obj_handler.setFormatter(logging.Formatter('%(asctime)s;%(message)s'))
+    root.addHandler(obj_handler)
+    return obj_handler
+
+
+def _init_worker(s_fname, i_idx, l_agents):
+    '''
+    Create the environment of the worker and an agent of each class passed,
+    so the modules and the models are loaded before the first job
+    :param s_fname: string. the container zip file used in simulation
+    :param i_idx: integer. The index of the start file to be read
+    :param l_agents: list. The names of the agent classes used by the jobs
+    '''
+    for s_agent in l_agents:
+        warm_env(s_fname, i_idx, s_agent, {})
+
+
+def _run_job(d_job):
+    '''
+    Train an agent in the warm environment of the worker and return the PnL
+    of each session. Used by the process pool
+    :param d_job: dictionary. The description of the job
+    '''
+    # the jobs run at the same time, so each one logs to its own file
+    obj_handler = None
+    if d_job['s_log']:
+        obj_handler = log_to(d_job['s_log'])
+    try:
+        random.seed(d_job['i_seed'])
+        np.random.seed(d_job['i_seed'])
+        e = warm_env(d_job['s_fname'], d_job['i_idx'], d_job['s_agent'],
+                     d_job['d_kwargs'])
+        sim = Simulator(e, update_delay=1.00, display=False)
+        sim.train(n_trials=d_job['n_trials'],
+                  n_sessions=d_job['n_sessions'],
+                  b_save_qtable=d_job['b_save_qtable'])
+    finally:
+        if obj_handler:
+            logging.getLogger().removeHandler(obj_handler)
+            obj_handler.close()
+    return {'s_agent': d_job['s_agent'],
+            'd_kwargs': d_job['d_kwargs'],
+            's_log': d_job['s_log'],
+            'l_sessions': sim.l_session_pnl}
+
+
+'''
+End help functions
+'''
+
+
+class WarmPool(object):
+    '''
+    A pool of processes forked once, whose workers keep warm environments of
+    one zip file to run the jobs of a sweep
+    '''
+
+    def __init__(self, s_fname, i_idx=None, l_agents=('LearningAgent_k',),
+                 n_workers=None):
+        '''
+        Initialize a WarmPool object. Save all parameters as attributes
+        :param s_fname: string. the container zip file used in simulation
+        :*param i_idx: integer. The index of the start file to be read
+        :*param l_agents: tuple. The names of the agent classes to warm up
+        :*param n_workers: integer. Number of processes. Default is cpu count
+        '''
+        self.s_fname = s_fname
+        self.i_idx = i_idx
+        self.pool = multiprocessing.Pool(n_workers,
+                                         initializer=_init_worker,
+                                         initargs=(s_fname, i_idx,
+                                                   list(l_agents)))
+
+    def sweep(self, s_agent, l_kwargs, n_trials=1, n_sessions=1, i_idx=None,
+              i_seed=0, b_save_qtable=False):
+        '''
+        Train one agent for each set of parameters passed and return a list
+        with the parameters, the log file and the PnL of the sessions of each
+        one. When the process logs to a file, each job logs to a file with the
+        same name followed by the agent and the index of the job. The Q-tables
+        are not saved by default, as all jobs would write the same files
+        :param s_agent: string. The name of the agent class
+        :param l_kwargs: list. Dictionaries of parameters to create the agents
+        :*param n_trials: integer. Iterations over the same files
+        :*param n_sessions: integer. Number of files read in each trial
+        :*param i_idx: integer. The start file. Default is the one of the pool
+        :*param i_seed: integer. Base seed of the random number generators
+        :*param b_save_qtable: boolean. If the workers should save Q-tables
+        '''
+        if i_idx is None:
+            i_idx = self.i_idx
+        s_base = None
+        for obj_handler in logging.getLogger().handlers:
+            if isinstance(obj_handler, logging.FileHandler):
+                s_base = os.path.splitext(obj_handler.baseFilename)[0]
+        l_jobs = []
+        for i_job, d_kwargs in enumerate(l_kwargs):
+            s_log = None
+            if s_base:
+                s_log = '{}_{}_{:02d}.log'.format(s_base, s_agent, i_job)
+            l_jobs.append({'s_fname': self.s_fname,
+                           'i_idx': i_idx,
+                           's_agent': s_agent,
+                           'd_kwargs': d_kwargs,
+                           'n_trials': n_trials,
+                           'n_sessions': n_sessions,
+                           'i_seed': i_seed + i_job,
+                           's_log': s_log,
+                           'b_save_qtable': b_save_qtable})
+        l_results = self.pool.map(_run_job, l_jobs, chunksize=1)
+        for d_result in l_results:
+            f_pnl = sum(d_sess['pnl'] for d_sess in d_result['l_sessions'])
+            s_msg = 'WarmPool.sweep(): {} {}: PnL of {:0.2f}'
+            s_msg = s_msg.format(s_agent, d_result['d_kwargs'], f_pnl)
+            if DEBUG:
+                logging.info(s_msg)
+            else:
+                print s_msg
+        return l_results
+
+    def close(self):
+        '''
+        Wait for the jobs running and stop the workers
+        '''
+        self.pool.close()
+        self.pool.join()